@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_user_deleted_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='profile_updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -22,6 +22,12 @@ class User(AbstractUser):
     # intact; is_active=False is the functional login gate.
     deleted_at = models.DateTimeField(null=True, blank=True, default=None)
 
+    # Last change to anything the public profile (UserSerializer) shows: the
+    # row itself, plus the listing, booking, review, favorite and chat stats,
+    # touched by marketplace signals. Validator for conditional GETs of pages
+    # that embed the profile (see marketplace.conditional).
+    profile_updated_at = models.DateTimeField(auto_now=True)
+
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username"]
 
@@ -19,6 +19,7 @@ def anonymize_and_close_account(user) -> None:
       only after the DB transaction commits.
     """
     # Imported lazily to avoid any app-loading/circular-import concerns.
+    from marketplace import listing_cache, suggest
     from marketplace.models import (
         BlockedUser,
         ContactMessage,
@@ -50,7 +51,13 @@ def anonymize_and_close_account(user) -> None:
 
         # (d) Deactivate (do not delete) the user's listings so bookings/reviews
         # made by other users survive; is_active=False hides them everywhere.
-        Listing.objects.filter(owner=user).update(is_active=False)
+        Listing.objects.filter(owner=user).update(is_active=False, updated_at=timezone.now())
+        # .update() skips model signals; drop cached listing pages and
+        # autocomplete entries explicitly.
+        listing_cache.bump_version()
+        suggest.record_listing_changes(
+            Listing.objects.filter(owner=user).values_list("id", flat=True)
+        )
 
         # (e) Anonymize orphan PII in ContactMessage (matched by email, no FK).
         if original_email:
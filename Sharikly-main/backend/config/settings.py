@@ -87,6 +87,31 @@ else:
         }
     }
 
+# Cache
+# The listing page version, block lists and the suggest journal must be seen by
+# every gunicorn worker, so production needs a shared backend: Redis when
+# REDIS_URL is set (needs the ``redis`` package), else a database table
+# (``python manage.py createcachetable``, run by restart_server.sh). Local
+# development runs a single process and keeps the per-process LocMem cache.
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+elif os.getenv("DB_ENGINE") == "postgresql":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "marketplace_cache",
+        }
+    }
+else:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+
 # Password validators
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -146,6 +171,14 @@ STORAGES = {
     },
 }
 
+# Without R2 credentials (local development, the image worker on a laptop),
+# keep media and static files on disk under MEDIA_ROOT / STATIC_ROOT.
+if not CLOUDFLARE_R2_BUCKET:
+    STORAGES = {
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    }
+
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
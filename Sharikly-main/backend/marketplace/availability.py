@@ -0,0 +1,287 @@
+"""
+Per-listing availability index.
+
+``ListingOccupancy`` holds one narrow row per date range a listing cannot be
+booked: its PENDING/CONFIRMED bookings and its availability blocks. Rows are
+written from Booking and AvailabilityBlock post_save signals (see
+``signals.py``) and disappear with their source row via CASCADE, so a
+date-window search is a single anti-join on an indexed table instead of
+a correlated subquery against Booking per candidate listing.
+
+``rebuild()`` re-derives the whole table; ``python manage.py
+rebuild_availability_index`` wraps it.
+
+Per-listing questions go through ``Calendar``: one query loads the listing's
+rows (optionally only those touching a window), bookings and blocks are
+sorted and merged into disjoint intervals, and overlap checks and free-gap
+walks are binary searches over them. Booking creation, block creation, the
+availability ranges endpoint and the free-windows endpoint all use it, so
+there is one definition of "overlaps": inclusive on both ends, as the dates
+are stored.
+
+``create_booking()`` is the only way bookings are made from requests: it
+locks the listing row, checks the calendar and inserts, so two renters
+racing for the same dates cannot both pass the check. Only attempts on the
+same listing wait for each other. SQLite (development) has no row locks;
+there the attempt takes the database write lock for its own transaction
+only.
+
+``calendars()`` loads many listings over a horizon in one grouped query for
+``GET /listings/calendar/``, which sends each listing's unavailable days as
+``[offset, length]`` runs or a bitmap instead of lists of date strings.
+"""
+import base64
+from bisect import bisect_right
+from datetime import timedelta
+from itertools import groupby
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import AvailabilityBlock, Booking, Listing, ListingOccupancy
+
+ACTIVE_BOOKING_STATUSES = (Booking.Status.PENDING, Booking.Status.CONFIRMED)
+ONE_DAY = timedelta(days=1)
+FREE_WINDOW_HORIZON = timedelta(days=365)
+
+
+def sync_booking(booking) -> None:
+    """Index ``booking`` while it holds its dates; drop it once declined/cancelled."""
+    if booking.status in ACTIVE_BOOKING_STATUSES:
+        ListingOccupancy.objects.update_or_create(
+            booking=booking,
+            defaults={
+                "listing_id": booking.listing_id,
+                "start_date": booking.start_date,
+                "end_date": booking.end_date,
+            },
+        )
+    else:
+        ListingOccupancy.objects.filter(booking=booking).delete()
+
+
+def sync_block(block) -> None:
+    ListingOccupancy.objects.update_or_create(
+        block=block,
+        defaults={
+            "listing_id": block.listing_id,
+            "start_date": block.start_date,
+            "end_date": block.end_date,
+        },
+    )
+
+
+def overlapping(start, end):
+    """Occupancy rows intersecting the inclusive window [start, end]."""
+    return ListingOccupancy.objects.filter(start_date__lte=end, end_date__gte=start)
+
+
+def filter_available(qs, start, end):
+    """Listings with no booking or block intersecting [start, end]."""
+    return qs.exclude(pk__in=overlapping(start, end).values("listing_id"))
+
+
+class DatesUnavailable(Exception):
+    """The requested dates overlap a booking or block (``source``)."""
+
+    def __init__(self, source):
+        super().__init__(source)
+        self.source = source
+
+
+def _lock_listing(listing_pk) -> None:
+    listings = Listing.objects.filter(pk=listing_pk)
+    if connection.vendor == "sqlite":
+        # No row locks: a no-op write as the transaction's first statement
+        # takes the database write lock (as BEGIN IMMEDIATE would) until commit.
+        listings.update(id=F("id"))
+    else:
+        list(listings.select_for_update().values_list("pk"))
+
+
+def create_booking(listing, renter, start, end, total_price) -> Booking:
+    """
+    Insert a PENDING booking of ``listing`` for [start, end], or raise
+    DatesUnavailable. Check and insert happen under a row lock on the
+    listing (``SELECT ... FOR UPDATE``), so concurrent attempts on the same
+    listing run one after the other; the occupancy row is written by the
+    booking's post_save signal before the lock is released.
+    """
+    with transaction.atomic():
+        _lock_listing(listing.pk)
+        calendar = Calendar.load(listing.pk, start, end)
+        if calendar.bookings.overlaps(start, end):
+            raise DatesUnavailable("booking")
+        if calendar.blocks.overlaps(start, end):
+            raise DatesUnavailable("block")
+        return Booking.objects.create(
+            listing=listing,
+            renter=renter,
+            start_date=start,
+            end_date=end,
+            total_price=total_price,
+            status=Booking.Status.PENDING,
+        )
+
+
+def _derived_rows():
+    bookings = Booking.objects.filter(status__in=ACTIVE_BOOKING_STATUSES).values_list(
+        "pk", "listing_id", "start_date", "end_date"
+    )
+    for pk, listing_id, start, end in bookings.iterator(chunk_size=2000):
+        yield ListingOccupancy(
+            booking_id=pk, listing_id=listing_id, start_date=start, end_date=end
+        )
+    blocks = AvailabilityBlock.objects.values_list("pk", "listing_id", "start_date", "end_date")
+    for pk, listing_id, start, end in blocks.iterator(chunk_size=2000):
+        yield ListingOccupancy(
+            block_id=pk, listing_id=listing_id, start_date=start, end_date=end
+        )
+
+
+def rebuild(batch_size: int = 1000) -> int:
+    """Replace the whole index with rows derived from bookings and blocks."""
+    with transaction.atomic():
+        ListingOccupancy.objects.all().delete()
+        created = ListingOccupancy.objects.bulk_create(_derived_rows(), batch_size=batch_size)
+    return len(created)
+
+
+def merge(intervals) -> list:
+    """Sorted, disjoint copy of inclusive ``(start, end)`` date intervals; touching ones join."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + ONE_DAY:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class Intervals:
+    """Merged inclusive date intervals with binary-search lookups."""
+
+    def __init__(self, intervals=()):
+        self.merged = merge(intervals)
+        self._starts = [start for start, _ in self.merged]
+
+    def __bool__(self):
+        return bool(self.merged)
+
+    def overlaps(self, start, end) -> bool:
+        """True if any day of [start, end] is covered."""
+        # Intervals are disjoint and sorted, so ends increase with starts: the
+        # last interval starting on or before ``end`` is the only candidate.
+        i = bisect_right(self._starts, end) - 1
+        return i >= 0 and self.merged[i][1] >= start
+
+    def gaps(self, start, end, min_days=1):
+        """Yield the uncovered ``(first, last)`` day ranges of [start, end], in order."""
+        cursor = start
+        i = bisect_right(self._starts, start) - 1
+        if i >= 0 and self.merged[i][1] >= cursor:
+            cursor = self.merged[i][1] + ONE_DAY
+        for busy_start, busy_end in self.merged[i + 1:]:
+            if busy_start > end or cursor > end:
+                break
+            if busy_start > cursor and (busy_start - cursor).days >= min_days:
+                yield cursor, busy_start - ONE_DAY
+            cursor = max(cursor, busy_end + ONE_DAY)
+        if cursor <= end and (end - cursor).days + 1 >= min_days:
+            yield cursor, end
+
+    def ranges(self) -> list:
+        return [{"start": str(start), "end": str(end)} for start, end in self.merged]
+
+    def runs(self, start, days) -> list:
+        """``[[offset, length], ...]`` of the covered days among ``days`` days from ``start``."""
+        end = start + timedelta(days=days - 1)
+        runs = []
+        i = max(bisect_right(self._starts, start) - 1, 0)
+        for busy_start, busy_end in self.merged[i:]:
+            if busy_start > end:
+                break
+            first, last = max(busy_start, start), min(busy_end, end)
+            if first <= last:
+                runs.append([(first - start).days, (last - first).days + 1])
+        return runs
+
+    def bitmap(self, start, days) -> str:
+        """Base64 of one bit per day from ``start`` (set: unavailable), LSB first."""
+        bits = bytearray((days + 7) // 8)
+        for offset, length in self.runs(start, days):
+            for day in range(offset, offset + length):
+                bits[day >> 3] |= 1 << (day & 7)
+        return base64.b64encode(bytes(bits)).decode("ascii")
+
+
+class Calendar:
+    """
+    A listing's unavailable days: ``bookings`` (PENDING/CONFIRMED), ``blocks``
+    and their union ``unavailable``, each merged. Built by ``load()`` from the
+    occupancy index in one query.
+    """
+
+    def __init__(self, bookings=(), blocks=(), block_reasons=None):
+        self.bookings = Intervals(bookings)
+        self.blocks = Intervals(blocks)
+        self.unavailable = Intervals(self.bookings.merged + self.blocks.merged)
+        # Unmerged (start, end, reason) per block, when loaded with reasons.
+        self.block_reasons = block_reasons
+
+    @classmethod
+    def load(cls, listing_id, start=None, end=None, reasons=False):
+        """The calendar of ``listing_id``, limited to rows touching [start, end] if given."""
+        rows = ListingOccupancy.objects.filter(listing_id=listing_id)
+        if start is not None:
+            rows = rows.filter(end_date__gte=start)
+        if end is not None:
+            rows = rows.filter(start_date__lte=end)
+        columns = ["start_date", "end_date", "booking_id"]
+        if reasons:
+            columns.append("block__reason")
+        bookings, blocks, block_reasons = [], [], []
+        for row in rows.values_list(*columns):
+            if row[2] is not None:
+                bookings.append(row[:2])
+            else:
+                blocks.append(row[:2])
+                if reasons:
+                    block_reasons.append((row[0], row[1], row[3] or ""))
+        return cls(bookings, blocks, sorted(block_reasons) if reasons else None)
+
+    def free_windows(self, start, limit, min_days=1, end=None) -> list:
+        """
+        Up to ``limit`` bookable ``(first, last)`` day ranges of at least
+        ``min_days`` days from ``start`` (through ``end``, default
+        FREE_WINDOW_HORIZON ahead; the last window is cut there).
+        """
+        end = end or start + FREE_WINDOW_HORIZON
+        windows = []
+        for window in self.unavailable.gaps(start, end, min_days=min_days):
+            windows.append(window)
+            if len(windows) >= limit:
+                break
+        return windows
+
+
+def calendars(listing_ids, start, days) -> dict:
+    """
+    ``{listing_id: Intervals}`` of unavailable days between ``start`` and
+    ``days`` days later, for many listings at once (map views, host
+    multi-calendars): one query over the occupancy index, grouped by listing.
+    """
+    end = start + timedelta(days=days - 1)
+    rows = (
+        ListingOccupancy.objects.filter(
+            listing_id__in=listing_ids, start_date__lte=end, end_date__gte=start
+        )
+        .order_by("listing_id")
+        .values_list("listing_id", "start_date", "end_date")
+    )
+    found = {
+        listing_id: Intervals((first, last) for _, first, last in group)
+        for listing_id, group in groupby(rows, key=lambda row: row[0])
+    }
+    return {listing_id: found.get(listing_id) or Intervals() for listing_id in listing_ids}
@@ -0,0 +1,260 @@
+"""
+Content-addressed listing photos: each distinct file is stored once, as a
+MediaBlob.
+
+Uploads are hashed (SHA-256) as they arrive. If a blob with that hash exists,
+the new ListingImage points at its object and nothing is written. Otherwise
+the bytes are stored once under ``blobs/<h[:2]>/<h><ext>``. A host reusing
+the same photos on ten listings costs one object, one upload and one CDN
+cache entry.
+
+Only listing photos are deduplicated. They are public anyway, whereas a
+content-derived name in a public-read bucket would let anyone holding a
+candidate file check whether it was sent in some chat. Chat attachments keep
+a random name per message (``uploads.random_name``).
+
+References are foreign keys (``ListingImage.blob``), so a blob's reference
+count is a join, not a counter. A counter would drift under
+``bulk_create``, which sends no signals. ``collect_garbage()`` deletes blobs
+with no references whose ``last_used_at`` is older than a grace period
+(``MEDIA_BLOB_GRACE_HOURS``, default 24). Uploads that resolved to a blob but
+have not been attached yet are therefore never collected.
+
+Listing photos that reach storage without passing through Django (direct
+uploads, see uploads.py) or from before deduplication are hashed afterwards
+by ``adopt_pending()``. Duplicates are then re-pointed at the existing blob and
+their extra copy is deleted. Both run from
+``python manage.py collect_media_blobs``.
+
+Direct uploads of listing images may send the file's ``sha256`` up front. A
+known hash skips the upload. Blobs only hold listing photos, which are
+public, so this reveals nothing.
+"""
+import hashlib
+import logging
+import mimetypes
+import posixpath
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .models import DirectUpload, ListingImage, MediaBlob, Message
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "blobs/"
+DEFAULT_STORAGE_WORKERS = 4
+DEFAULT_GRACE_HOURS = 24
+HASH_CHUNK_SIZE = 1024 * 1024
+# Messages sent before chat attachments stopped being deduplicated may still
+# name a blob's object; the collector leaves those objects alone.
+MESSAGE_FILE_FIELDS = ("image", "audio", "file")
+
+
+def _storage():
+    return default_storage
+
+
+def hash_file(file) -> str:
+    file.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def blob_name(sha256: str, extension: str) -> str:
+    return f"{PREFIX}{sha256[:2]}/{sha256}{extension.lower()}"
+
+
+def _extension(filename, content_type=None) -> str:
+    extension = posixpath.splitext(filename or "")[1]
+    if not extension and content_type:
+        extension = mimetypes.guess_extension(content_type) or ""
+    return extension[:10]
+
+
+def _touch(blob):
+    now = timezone.now()
+    MediaBlob.objects.filter(pk=blob.pk).update(last_used_at=now)
+    blob.last_used_at = now
+    return blob
+
+
+def find(sha256):
+    """The blob with this content, marked as in use, or None."""
+    blob = MediaBlob.objects.filter(sha256=sha256).first()
+    return _touch(blob) if blob else None
+
+
+def _write(name, file) -> None:
+    storage = _storage()
+    if storage.exists(name):
+        return
+    saved = storage.save(name, file)
+    if saved != name:
+        # Lost a race to write the same content: keep the canonical copy.
+        storage.delete(saved)
+
+
+def store_many(files, return_exceptions=False) -> list:
+    """
+    The blobs holding each of ``files`` (uploaded files), in order. Only
+    content never stored before is written, several objects at a time on a
+    bounded thread pool (``UPLOAD_STORAGE_WORKERS``, default 4) rather than
+    one blocking round trip after another. The threads only talk to storage;
+    the database work stays on the calling thread.
+
+    If a write fails the first error is raised (with ``return_exceptions``,
+    the failed files' entries are their exceptions instead). What was written
+    is kept as blobs, which the collector removes unless something references
+    them.
+    """
+    hashes = [hash_file(file) for file in files]
+    found = {blob.sha256: blob for blob in MediaBlob.objects.filter(sha256__in=hashes)}
+    if found:
+        MediaBlob.objects.filter(pk__in=[blob.pk for blob in found.values()]).update(
+            last_used_at=timezone.now()
+        )
+    missing = {}
+    for sha256, file in zip(hashes, files):
+        if sha256 not in found and sha256 not in missing:
+            missing[sha256] = (blob_name(sha256, _extension(file.name)), file)
+
+    errors = {}
+    if missing:
+        workers = int(getattr(settings, "UPLOAD_STORAGE_WORKERS", DEFAULT_STORAGE_WORKERS))
+        with ThreadPoolExecutor(max_workers=max(min(workers, len(missing)), 1)) as pool:
+            futures = {
+                sha256: pool.submit(_write, name, file) for sha256, (name, file) in missing.items()
+            }
+            wait(futures.values())
+        now = timezone.now()
+        written = []
+        for sha256, future in futures.items():
+            if future.exception():
+                errors[sha256] = future.exception()
+                continue
+            name, file = missing[sha256]
+            written.append(MediaBlob(sha256=sha256, name=name, size=file.size, last_used_at=now))
+        # A concurrent upload of the same content may have registered it first.
+        MediaBlob.objects.bulk_create(written, ignore_conflicts=True)
+        found.update(
+            (blob.sha256, blob)
+            for blob in MediaBlob.objects.filter(sha256__in=[blob.sha256 for blob in written])
+        )
+    if errors and not return_exceptions:
+        raise next(iter(errors.values()))
+    return [found.get(sha256) or errors[sha256] for sha256 in hashes]
+
+
+def store(file) -> MediaBlob:
+    """The blob holding ``file``'s content, written only if it is new."""
+    return store_many([file])[0]
+
+
+def _referenced_elsewhere(name, exclude_listing_image=None) -> bool:
+    images = ListingImage.objects.filter(image=name)
+    if exclude_listing_image is not None:
+        images = images.exclude(pk=exclude_listing_image)
+    message_match = Q()
+    for field in MESSAGE_FILE_FIELDS:
+        message_match |= Q(**{field: name})
+    messages = Message.objects.filter(message_match)
+    return (
+        images.exists()
+        or messages.exists()
+        or DirectUpload.objects.filter(key=name, consumed_at__isnull=True).exists()
+    )
+
+
+def adopt(name):
+    """
+    Hash the stored object ``name``. Returns ``(blob, duplicate)``: the blob
+    with its content, and whether ``name`` is a redundant copy of it (the
+    caller re-points its row and deletes ``name``). A new content is
+    registered as a blob in place, without copying.
+    """
+    storage = _storage()
+    existing = MediaBlob.objects.filter(name=name).first()
+    if existing is not None:
+        return _touch(existing), False
+    with storage.open(name, "rb") as handle:
+        sha256 = hash_file(handle)
+    blob = find(sha256)
+    if blob is not None:
+        return blob, True
+    try:
+        with transaction.atomic():
+            blob = MediaBlob.objects.create(
+                sha256=sha256, name=name, size=storage.size(name), last_used_at=timezone.now()
+            )
+    except IntegrityError:
+        return find(sha256), True
+    return blob, False
+
+
+def _adopt_listing_image(listing_image) -> bool:
+    old_name = listing_image.image.name
+    blob, duplicate = adopt(old_name)
+    ListingImage.objects.filter(pk=listing_image.pk).update(image=blob.name, blob=blob)
+    if duplicate and not _referenced_elsewhere(old_name, exclude_listing_image=listing_image.pk):
+        _storage().delete(old_name)
+    return duplicate
+
+
+def adopt_pending(limit=500) -> dict:
+    """Hash up to ``limit`` listing images whose files have no blob yet."""
+    counts = {"hashed": 0, "deduplicated": 0, "errors": 0}
+    pending_images = ListingImage.objects.filter(blob__isnull=True).exclude(image="")
+    for listing_image in pending_images.order_by("id")[:limit]:
+        try:
+            counts["deduplicated"] += _adopt_listing_image(listing_image)
+            counts["hashed"] += 1
+        except Exception:
+            logger.exception("Hashing listing image %s failed", listing_image.pk)
+            counts["errors"] += 1
+    return counts
+
+
+def grace_period() -> timedelta:
+    return timedelta(hours=float(getattr(settings, "MEDIA_BLOB_GRACE_HOURS", DEFAULT_GRACE_HOURS)))
+
+
+def unreferenced(now=None):
+    cutoff = (now or timezone.now()) - grace_period()
+    named_by_message = Q()
+    for field in MESSAGE_FILE_FIELDS:
+        named_by_message |= Q(**{field: OuterRef("name")})
+    return MediaBlob.objects.filter(
+        last_used_at__lt=cutoff,
+        listing_images__isnull=True,
+    ).exclude(Exists(Message.objects.filter(named_by_message)))
+
+
+def collect_garbage(now=None, batch_size=500) -> dict:
+    """Delete unreferenced blobs past the grace period, row first, then object."""
+    counts = {"blobs": 0, "bytes": 0}
+    while True:
+        batch = list(unreferenced(now).order_by("id")[:batch_size])
+        if not batch:
+            return counts
+        for blob in batch:
+            with transaction.atomic():
+                # Re-checked in the DELETE itself: a reference may have appeared.
+                deleted, _ = unreferenced(now).filter(pk=blob.pk).delete()
+            if deleted:
+                try:
+                    _storage().delete(blob.name)
+                except Exception:
+                    logger.exception("Could not delete blob object %s", blob.name)
+                counts["blobs"] += 1
+                counts["bytes"] += blob.size
+        if len(batch) < batch_size:
+            return counts
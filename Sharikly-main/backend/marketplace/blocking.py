@@ -0,0 +1,65 @@
+"""
+Cached block graph: who a user cannot interact with, in either direction.
+
+``blocked_user_ids(user)`` is consulted on every listing search, similar
+listings, chat room list, message list, send and unread count, so the set is
+kept in the shared cache (one query on a miss, none on a hit). Every
+BlockedUser save or delete — BlockUserView, UnblockUserView, account
+deletion, the admin, cascades — drops the cached sets of both users (see
+``signals.py``), immediately and again on commit so a concurrent request
+cannot re-cache the old set.
+
+Invalidation only reaches other workers through a shared backend (see
+``CACHES`` in settings). On a per-process backend (LocMem) a worker would keep
+serving a user whose block it never saw, so sets live there at most
+``PROCESS_LOCAL_TIMEOUT`` seconds.
+
+Settings: ``BLOCK_CACHE_ALIAS`` (default ``"default"``) and
+``BLOCK_CACHE_TIMEOUT`` (seconds, default 3600; bounds the damage if an
+invalidation is ever missed).
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Q
+
+from .listing_cache import is_process_local
+from .models import BlockedUser
+
+KEY = "blocks:{}"
+DEFAULT_TIMEOUT = 3600
+PROCESS_LOCAL_TIMEOUT = 30
+
+
+def _cache():
+    return caches[getattr(settings, "BLOCK_CACHE_ALIAS", "default")]
+
+
+def timeout() -> int:
+    ttl = getattr(settings, "BLOCK_CACHE_TIMEOUT", DEFAULT_TIMEOUT)
+    if is_process_local(_cache()):
+        return min(ttl, PROCESS_LOCAL_TIMEOUT)
+    return ttl
+
+
+def blocked_user_ids(user) -> set:
+    """User IDs that cannot interact in chat with ``user`` (either direction)."""
+    user_id = getattr(user, "pk", user)
+    key = KEY.format(user_id)
+    cached = _cache().get(key)
+    if cached is not None:
+        return set(cached)
+    ids = set()
+    rows = BlockedUser.objects.filter(Q(blocker_id=user_id) | Q(blocked_id=user_id)).values_list(
+        "blocker_id", "blocked_id"
+    )
+    for blocker_id, blocked_id in rows:
+        ids.add(blocked_id if blocker_id == user_id else blocker_id)
+    _cache().set(key, frozenset(ids), timeout())
+    return ids
+
+
+def invalidate(*user_ids) -> None:
+    keys = [KEY.format(user_id) for user_id in user_ids]
+    _cache().delete_many(keys)
+    transaction.on_commit(lambda: _cache().delete_many(keys))
@@ -0,0 +1,251 @@
+"""
+Bulk listing import for hosts with large catalogs.
+
+Input is a manifest, either CSV with a header row or JSON Lines, with one
+listing per row. Columns are those of ``ListingImportRowSerializer``. In CSV,
+``images`` is a ``|``-separated list of paths inside an optional ZIP archive
+of photos. ``POST /api/listings/import/`` and ``python manage.py
+import_listings`` both call ``run()``.
+
+The manifest is read as a stream and handled CHUNK_SIZE rows at a time, so a
+10k-row import holds one chunk in memory, never the whole file. The archive
+is read through its central directory, and members are opened only when
+their chunk is stored. For each chunk:
+
+- rows are validated one by one, and invalid rows are reported and skipped;
+- the chunk's photos are stored concurrently and deduplicated
+  (``blobs.store_many``);
+- listings and their ListingImage rows are inserted with one ``bulk_create``
+  each, inside a transaction, so a listing never appears without its photos.
+
+``bulk_create`` sends no signals, so ``run()`` does what the Listing and
+ListingImage signals would have done:
+
+- coordinate jitter and geohash;
+- search documents (``search.rebuild_index(ids)``);
+- the suggest journal;
+- the listing page cache version;
+- the owner's Super Host flag;
+- similar-listing neighbors (one ``similarity.refresh`` for the import).
+
+New photos wait for the image worker like any upload.
+
+The report has one entry per row: ``{"row": n, "id": pk}`` or
+``{"row": n, "errors": {...}}``. Rows are numbered from 1, not counting the
+CSV header.
+"""
+import codecs
+import csv
+import json
+import posixpath
+import zipfile
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+
+from . import blobs, listing_cache, ranking, search, similarity, suggest, uploads
+from .models import Category, DirectUpload, Listing, ListingImage
+
+CHUNK_SIZE = 200
+DEFAULT_MAX_ROWS = 10000
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+MAX_IMAGE_BYTES = uploads.RULES[DirectUpload.Kind.LISTING_IMAGE][2]
+IMAGE_SEPARATOR = "|"
+
+
+class ManifestError(ValueError):
+    """The manifest or archive cannot be read at all (as opposed to a bad row)."""
+
+
+def max_rows() -> int:
+    return int(getattr(settings, "LISTING_IMPORT_MAX_ROWS", DEFAULT_MAX_ROWS))
+
+
+def _clean(raw: dict) -> dict:
+    """Drop blank values, so optional columns left empty in CSV are simply absent."""
+    data = {}
+    for key, value in raw.items():
+        if key is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+            if not value:
+                continue
+        if value is None:
+            continue
+        data[key.strip()] = value
+    images = data.get("images")
+    if isinstance(images, str):
+        data["images"] = [name.strip() for name in images.split(IMAGE_SEPARATOR) if name.strip()]
+    return data
+
+
+def read_manifest(file, name):
+    """Yield ``(row_number, data)`` pairs; ``data`` is a ValueError for unreadable rows."""
+    extension = posixpath.splitext(name or "")[1].lower()
+    lines = codecs.iterdecode(file, "utf-8-sig")
+    if extension == ".csv":
+        for number, raw in enumerate(csv.DictReader(lines), start=1):
+            yield number, _clean(raw)
+    elif extension in (".jsonl", ".ndjson"):
+        number = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                raw = json.loads(line)
+            except ValueError as exc:
+                yield number, ValueError(f"Invalid JSON: {exc}")
+                continue
+            if not isinstance(raw, dict):
+                yield number, ValueError("Each line must be a JSON object.")
+                continue
+            yield number, _clean(raw)
+    else:
+        raise ManifestError("The manifest must be a .csv or .jsonl file.")
+
+
+class Archive:
+    """Photos of an import, read lazily from a ZIP file."""
+
+    def __init__(self, file):
+        try:
+            self._zip = zipfile.ZipFile(file)
+        except zipfile.BadZipFile:
+            raise ManifestError("The image archive must be a ZIP file.")
+        # Only photos within the size limit can be referenced by rows.
+        self._members = {
+            info.filename: info
+            for info in self._zip.infolist()
+            if not info.is_dir()
+            and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+            and info.file_size <= MAX_IMAGE_BYTES
+        }
+
+    @property
+    def names(self):
+        return self._members.keys()
+
+    def open(self, name) -> File:
+        info = self._members[name]
+        file = File(self._zip.open(info), name=posixpath.basename(name))
+        file.size = info.file_size
+        return file
+
+    def close(self):
+        self._zip.close()
+
+
+def _category_lookup() -> dict:
+    return {name.lower(): pk for pk, name in Category.objects.values_list("id", "name")}
+
+
+def _store_images(names, archive) -> dict:
+    """Archive member -> MediaBlob (or the exception that prevented storing it)."""
+    if not names:
+        return {}
+    files = [archive.open(name) for name in names]
+    try:
+        return dict(zip(names, blobs.store_many(files, return_exceptions=True)))
+    finally:
+        for file in files:
+            file.close()
+
+
+def _import_chunk(owner, rows, archive, report) -> list:
+    """Create the listings of one chunk of valid rows; returns their ids."""
+    names = list(dict.fromkeys(name for _, data in rows for name in data.get("images", ())))
+    stored = _store_images(names, archive)
+
+    listings, images_per_listing = [], []
+    for number, data in rows:
+        failed = [name for name in data.get("images", ()) if isinstance(stored[name], Exception)]
+        if failed:
+            errors = [f"Could not store {name}." for name in failed]
+            report["rows"].append({"row": number, "errors": {"images": errors}})
+            continue
+        data = dict(data)
+        image_blobs = [stored[name] for name in data.pop("images", ())]
+        listing = Listing(owner=owner, category_id=data.pop("category", None), **data)
+        listing.jitter_new_coordinates()
+        listings.append((number, listing))
+        images_per_listing.append(image_blobs)
+    if not listings:
+        return []
+
+    with transaction.atomic():
+        Listing.objects.bulk_create([listing for _, listing in listings])
+        ListingImage.objects.bulk_create(
+            ListingImage(listing=listing, image=blob.name, blob=blob, position=position)
+            for (_, listing), image_blobs in zip(listings, images_per_listing)
+            for position, blob in enumerate(image_blobs)
+        )
+        ids = [listing.pk for _, listing in listings]
+        search.rebuild_index(ids)
+        suggest.record_listing_changes(ids)
+    report["rows"].extend({"row": number, "id": listing.pk} for number, listing in listings)
+    return ids
+
+
+def run(owner, manifest, manifest_name, archive_file=None, chunk_size=CHUNK_SIZE, limit=None) -> dict:
+    """
+    Import up to ``limit`` rows (default ``LISTING_IMPORT_MAX_ROWS``) of
+    ``manifest`` for ``owner``. Raises ManifestError when the files cannot be
+    read at all; row problems go into the report.
+    """
+    archive = Archive(archive_file) if archive_file is not None else None
+    context = {
+        "categories": _category_lookup(),
+        "archive_names": archive.names if archive else None,
+    }
+    report = {"created": 0, "failed": 0, "truncated": False, "rows": []}
+    limit = limit or max_rows()
+    created = []
+
+    def flush(chunk):
+        created.extend(_import_chunk(owner, chunk, archive, report))
+
+    from .serializers import ListingImportRowSerializer
+
+    # One serializer for every row: a ModelSerializer builds its fields per
+    # instance, which would otherwise dominate a large import.
+    validator = ListingImportRowSerializer(context=context)
+    chunk = []
+    try:
+        for number, data in read_manifest(manifest, manifest_name):
+            if number > limit:
+                report["truncated"] = True
+                break
+            if isinstance(data, ValueError):
+                report["rows"].append({"row": number, "errors": {"non_field_errors": [str(data)]}})
+                continue
+            try:
+                validated = validator.run_validation(data)
+            except ValidationError as exc:
+                report["rows"].append({"row": number, "errors": as_serializer_error(exc)})
+                continue
+            chunk.append((number, validated))
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise ManifestError(f"The manifest could not be read: {exc}")
+    finally:
+        if archive:
+            archive.close()
+
+    if created:
+        # What the Listing signals would have done, once for the whole import.
+        listing_cache.bump_version()
+        ranking.refresh_super_hosts([owner.pk])
+        similarity.schedule_refresh(created)
+    report["rows"].sort(key=lambda entry: entry["row"])
+    report["created"] = len(created)
+    report["failed"] = len(report["rows"]) - len(created)
+    return report
@@ -0,0 +1,104 @@
+"""
+Bulk owner edits: reprice, pause/resume or recategorize many listings at once.
+
+``POST /api/listings/bulk-update/`` applies one change to every listing of the
+caller that matches a filter (ids, category, active flag; no filter means the
+whole catalog). Without it, a seasonal price change is one PATCH per listing,
+each re-serializing the nested detail payload.
+
+The change is a single ``UPDATE ... WHERE owner_id = <caller> AND ...``.
+Prices are computed in SQL (``price * (1 + pct/100)`` or ``price + amount``,
+rounded to cents) and never read into Python. One aggregate of the matched
+prices checks first that none would leave the column's range.
+
+``QuerySet.update()`` sends no signals, so derived data is refreshed here,
+once for the whole batch:
+
+- ``updated_at`` is set in the same UPDATE, which moves detail ETags;
+- the listing page cache version is bumped;
+- the suggest journal gets one entry (active titles and their categories);
+- similar-listing neighbors are refreshed after commit when price or
+  category changed.
+
+Search documents hold title, city and description only, so they are left
+alone.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Max, Min
+from django.db.models.functions import Round
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from . import listing_cache, similarity, suggest
+from .models import Listing
+
+MIN_PRICE = Decimal("0.01")
+MAX_PRICE = Decimal("999999.99")  # price_per_day: max_digits=8, decimal_places=2
+HUNDRED = Decimal(100)
+
+
+def _new_price(price, percent=None, amount=None):
+    """``price`` after the change; works on Decimals and on F() expressions alike."""
+    if percent is not None:
+        return price * (1 + percent / HUNDRED)
+    return price + amount
+
+
+def _price_expression(percent=None, amount=None):
+    output = DecimalField(max_digits=8, decimal_places=2)
+    new_price = _new_price(F("price_per_day"), percent, amount)
+    return Round(ExpressionWrapper(new_price, output_field=output), 2, output_field=output)
+
+
+def _check_prices(listings, percent, amount) -> None:
+    bounds = listings.aggregate(low=Min("price_per_day"), high=Max("price_per_day"))
+    if bounds["low"] is None:
+        return
+    # The change is monotonic, so the extremes stay the extremes (or swap).
+    results = [_new_price(bounds[key], percent, amount) for key in ("low", "high")]
+    if min(results) < MIN_PRICE or max(results) > MAX_PRICE:
+        raise ValidationError(
+            {"price": f"The new prices must stay between {MIN_PRICE} and {MAX_PRICE}."}
+        )
+
+
+def apply(owner, filters: dict, changes: dict) -> dict:
+    """
+    Apply ``changes`` (``price_percent`` | ``price_amount``, ``is_active``,
+    ``category``) to ``owner``'s listings matching ``filters`` (``ids``,
+    ``category``, ``is_active``). Returns ``{"updated": n, "ids": [...]}``.
+    """
+    listings = Listing.objects.filter(owner=owner)
+    if "ids" in filters:
+        listings = listings.filter(pk__in=filters["ids"])
+    if "category" in filters:
+        listings = listings.filter(category=filters["category"])
+    if "is_active" in filters:
+        listings = listings.filter(is_active=filters["is_active"])
+
+    percent, amount = changes.get("price_percent"), changes.get("price_amount")
+    values = {"updated_at": timezone.now()}
+    if percent is not None or amount is not None:
+        values["price_per_day"] = _price_expression(percent, amount)
+    if "is_active" in changes:
+        values["is_active"] = changes["is_active"]
+    if "category" in changes:
+        values["category"] = changes["category"]
+
+    with transaction.atomic():
+        # Ids first (rows locked where supported): the filter may not match
+        # the rows anymore once they are updated, and the caches need them.
+        ids = list(listings.select_for_update().order_by("pk").values_list("pk", flat=True))
+        if not ids:
+            return {"updated": 0, "ids": []}
+        if "price_per_day" in values:
+            _check_prices(Listing.objects.filter(pk__in=ids), percent, amount)
+        updated = Listing.objects.filter(owner=owner, pk__in=ids).update(**values)
+
+        listing_cache.bump_version()
+        suggest.record_listing_changes(ids)
+        if "price_per_day" in values or "category" in values:
+            similarity.schedule_refresh(ids)
+    return {"updated": updated, "ids": ids}
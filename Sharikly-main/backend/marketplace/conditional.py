@@ -0,0 +1,66 @@
+"""
+Conditional GET (``ETag`` / ``Last-Modified`` -> ``304 Not Modified``).
+
+Views compute a cheap validator first — one small query — and only load and
+serialize the resource when the client's copy is stale:
+
+- listing detail: the latest of ``Listing.updated_at`` (touched whenever the
+  listing, its images, reviews, review votes or favorites change) and the
+  ``profile_updated_at`` of its owner and reviewers, whose profile stats the
+  page embeds;
+- blog post detail: the latest of ``BlogPost.updated_at`` and the author's
+  ``profile_updated_at``;
+- categories: the number of categories and the latest
+  ``Category.updated_at`` (the count catches deletions).
+
+``User.profile_updated_at`` moves on every write that changes what
+UserSerializer shows (see ``signals.py``), so a page stays 304 for as long as
+nothing in it changed. The ETag and ``Last-Modified`` come from the same
+timestamp, so ``If-None-Match`` and ``If-Modified-Since`` agree (the latter
+at one-second resolution). ETags include the viewer, as responses carry
+per-user fields (``is_favorited``, the viewer's review votes).
+
+Precondition evaluation is Django's own ``get_conditional_response``.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+def latest(*timestamps):
+    """The most recent of ``timestamps``, ignoring None (no reviewers, ...)."""
+    return max(timestamp for timestamp in timestamps if timestamp is not None)
+
+
+def make_etag(request, *parts, personal=True) -> str:
+    """
+    Strong ETag over ``parts`` and the negotiated media type. ``personal``
+    responses (per-viewer fields) also key on the viewer.
+    """
+    raw_parts = [getattr(request, "accepted_media_type", "") or "", *parts]
+    if personal:
+        user = request.user
+        raw_parts.append(f"u{user.pk}" if user.is_authenticated else "anon")
+    raw = "|".join(str(part) for part in raw_parts)
+    return quote_etag(hashlib.sha256(raw.encode()).hexdigest()[:32])
+
+
+def not_modified(request, etag=None, last_modified=None):
+    """A 304 response if the request's preconditions match, else None."""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request._request, etag=etag, last_modified=timestamp)
+
+
+def set_validators(response, etag=None, last_modified=None, personal=True):
+    if etag:
+        response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    # Clients may reuse their copy only after revalidating it.
+    if personal:
+        response["Cache-Control"] = "private, no-cache"
+        patch_vary_headers(response, ["Authorization"])
+    else:
+        response["Cache-Control"] = "no-cache"
+    return response
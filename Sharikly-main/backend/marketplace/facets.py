@@ -0,0 +1,89 @@
+"""
+Facet counts for the listings filter panel (``GET /listings/facets/``).
+
+All facets come from one grouped query over the filtered listings: rows are
+grouped by (category, city, price bucket, rating bucket) and the per-facet
+counts are rolled up in Python. The number of groups is bounded by the
+product of the facet cardinalities, not by the number of listings.
+
+Counts describe the current result set, i.e. every active filter (including
+the facet's own) is applied.
+"""
+from django.db.models import Case, Count, IntegerField, Value, When
+
+# Price buckets: [0, 50), [50, 100), ... [1000, ∞)
+PRICE_EDGES = (0, 50, 100, 200, 500, 1000)
+# "N stars & up", matching the ?rating_min= filter.
+RATING_THRESHOLDS = (4.5, 4.0, 3.0, 2.0, 1.0)
+
+
+def _price_bucket():
+    whens = [
+        When(price_per_day__lt=upper, then=Value(i))
+        for i, upper in enumerate(PRICE_EDGES[1:])
+    ]
+    return Case(*whens, default=Value(len(PRICE_EDGES) - 1), output_field=IntegerField())
+
+
+def _rating_bucket():
+    # Index of the highest threshold reached; -1 = unrated or below the lowest.
+    whens = [
+        When(rating_avg__gte=threshold, then=Value(i))
+        for i, threshold in enumerate(RATING_THRESHOLDS)
+    ]
+    return Case(*whens, default=Value(-1), output_field=IntegerField())
+
+
+def compute(qs) -> dict:
+    rows = (
+        qs.order_by()
+        .annotate(price_bucket=_price_bucket(), rating_bucket=_rating_bucket())
+        .values("category_id", "category__name", "city", "price_bucket", "rating_bucket")
+        .annotate(n=Count("id"))
+    )
+    total = 0
+    categories = {}
+    cities = {}  # casefolded name -> {spelling: count}
+    prices = [0] * len(PRICE_EDGES)
+    ratings = [0] * len(RATING_THRESHOLDS)
+    for row in rows:
+        n = row["n"]
+        total += n
+        if row["category_id"] is not None:
+            entry = categories.setdefault(
+                row["category_id"],
+                {"id": row["category_id"], "name": row["category__name"], "count": 0},
+            )
+            entry["count"] += n
+        city = (row["city"] or "").strip()
+        if city:
+            spellings = cities.setdefault(city.casefold(), {})
+            spellings[city] = spellings.get(city, 0) + n
+        prices[row["price_bucket"]] += n
+        if row["rating_bucket"] >= 0:
+            ratings[row["rating_bucket"]] += n
+
+    city_counts = [
+        # Show the most common spelling of each city.
+        {"name": max(spellings, key=spellings.get), "count": sum(spellings.values())}
+        for spellings in cities.values()
+    ]
+    # Cumulative: a 4.5 listing also counts for "4+", "3+", ...
+    cumulative, running = [], 0
+    for threshold, n in zip(RATING_THRESHOLDS, ratings):
+        running += n
+        cumulative.append({"min": threshold, "count": running})
+    return {
+        "count": total,
+        "categories": sorted(categories.values(), key=lambda c: (-c["count"], c["name"])),
+        "cities": sorted(city_counts, key=lambda c: (-c["count"], c["name"])),
+        "price": [
+            {
+                "min": lower,
+                "max": PRICE_EDGES[i + 1] if i + 1 < len(PRICE_EDGES) else None,
+                "count": prices[i],
+            }
+            for i, lower in enumerate(PRICE_EDGES)
+        ],
+        "ratings": cumulative,
+    }
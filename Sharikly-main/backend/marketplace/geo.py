@@ -0,0 +1,139 @@
+"""
+Geohash helpers and "near me" filtering for listings.
+
+Each listing stores the geohash of its (already privacy-jittered) coordinates in
+``Listing.geohash`` (precision 7, ~150 m cells) behind an (is_active, geohash)
+index. A radius query is answered in three steps:
+
+1. Candidate pruning: the 3x3 block of geohash cells around the point, at the
+   finest precision whose cells are still at least ``radius_km`` wide, becomes a
+   handful of indexed prefix scans (``geohash LIKE 'p%'``). On PostgreSQL the
+   index uses ``varchar_pattern_ops``, so the scans work under any database
+   collation, where a ``[p, p + "{")`` string range would not.
+2. A latitude/longitude bounding box trims the corners of those cells.
+3. The exact haversine distance is computed only for the survivors and
+   annotated as ``distance_km``.
+"""
+import math
+
+from django.db.models import F, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+GEOHASH_PRECISION = 7
+MAX_RADIUS_KM = 200.0
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode(latitude: float, longitude: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # geohash interleaves bits starting with longitude
+    while len(chars) < precision:
+        rng, value = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def cell_size_degrees(precision: int):
+    """(lat_degrees, lng_degrees) covered by one geohash cell of ``precision``."""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def _km_per_degree_lng(latitude: float) -> float:
+    return KM_PER_DEGREE_LAT * max(math.cos(math.radians(latitude)), 0.01)
+
+
+def covering_prefixes(latitude: float, longitude: float, radius_km: float) -> set:
+    """Geohash prefixes of the 3x3 cell block that fully covers the search circle."""
+    precision = 1
+    for candidate in range(GEOHASH_PRECISION, 0, -1):
+        lat_deg, lng_deg = cell_size_degrees(candidate)
+        if (
+            lat_deg * KM_PER_DEGREE_LAT >= radius_km
+            and lng_deg * _km_per_degree_lng(latitude) >= radius_km
+        ):
+            precision = candidate
+            break
+    lat_deg, lng_deg = cell_size_degrees(precision)
+    prefixes = set()
+    for dlat in (-lat_deg, 0.0, lat_deg):
+        for dlng in (-lng_deg, 0.0, lng_deg):
+            lat = min(90.0, max(-90.0, latitude + dlat))
+            lng = (longitude + dlng + 180.0) % 360.0 - 180.0
+            prefixes.add(encode(lat, lng, precision))
+    return prefixes
+
+
+def bounding_box(latitude: float, longitude: float, radius_km: float):
+    """(min_lat, max_lat, min_lng, max_lng); longitude bounds are None across the antimeridian."""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    dlng = radius_km / _km_per_degree_lng(latitude)
+    min_lng, max_lng = longitude - dlng, longitude + dlng
+    if min_lng < -180.0 or max_lng > 180.0:
+        min_lng = max_lng = None
+    return latitude - dlat, latitude + dlat, min_lng, max_lng
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def parse_point(value: str):
+    """Parse "lat,lng" into floats; returns None when malformed or out of range."""
+    try:
+        lat_str, lng_str = (value or "").split(",")
+        lat, lng = float(lat_str), float(lng_str)
+    except (TypeError, ValueError):
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+        return None
+    return lat, lng
+
+
+def _distance_expression(latitude: float, longitude: float):
+    dlat = Radians(F("latitude") - Value(latitude))
+    dlng = Radians(F("longitude") - Value(longitude))
+    a = Power(Sin(dlat / Value(2.0)), 2) + Value(math.cos(math.radians(latitude))) * Cos(
+        Radians(F("latitude"))
+    ) * Power(Sin(dlng / Value(2.0)), 2)
+    return Value(2.0 * EARTH_RADIUS_KM) * ASin(Sqrt(Least(Value(1.0), a)))
+
+
+def filter_near(qs, latitude: float, longitude: float, radius_km: float):
+    """Listings within ``radius_km`` of the point, annotated with ``distance_km``."""
+    radius_km = min(max(radius_km, 0.1), MAX_RADIUS_KM)
+    cells = Q()
+    for prefix in covering_prefixes(latitude, longitude, radius_km):
+        cells |= Q(geohash__startswith=prefix)
+    min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude, radius_km)
+    qs = qs.filter(cells).filter(latitude__gte=min_lat, latitude__lte=max_lat)
+    if min_lng is not None:
+        qs = qs.filter(longitude__gte=min_lng, longitude__lte=max_lng)
+    return qs.annotate(
+        distance_km=_distance_expression(latitude, longitude)
+    ).filter(distance_km__lte=radius_km)
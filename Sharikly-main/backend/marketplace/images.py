@@ -0,0 +1,223 @@
+"""
+Listing photo derivatives, produced by a worker outside the request thread.
+
+Uploads are stored as-is and saved with ``processing_status=PENDING``. The
+worker (``python manage.py process_listing_images``) claims pending images,
+then for each one:
+
+- applies the EXIF orientation and renders ``thumb`` / ``card`` / ``full``
+  variants (longest edge 320 / 640 / 1600 px, never upscaled) as WebP and
+  progressive JPEG, without metadata;
+- re-saves the original without EXIF (GPS position, camera serial) when it
+  carried any (as a new blob when the image is deduplicated, see blobs.py);
+- records the original's dimensions and the variant names on the row and
+  marks it READY.
+
+Claiming is a conditional UPDATE (PENDING -> PROCESSING), so several workers
+can run side by side on any database. Rows stuck in PROCESSING longer than
+STALE_AFTER (a crashed worker) are claimed again; a row that fails
+MAX_ATTEMPTS times is marked FAILED and keeps serving the original.
+
+Everything goes through the image field's storage, so it runs the same
+against R2 and against the local FileSystemStorage used without R2
+credentials.
+"""
+import io
+import logging
+import posixpath
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from . import blobs
+from .models import ListingImage
+
+logger = logging.getLogger(__name__)
+
+# (name, longest edge in px)
+VARIANTS = (("thumb", 320), ("card", 640), ("full", 1600))
+# (key, Pillow format, extension, save options)
+FORMATS = (
+    ("webp", "WEBP", "webp", {"quality": 80, "method": 4}),
+    ("jpeg", "JPEG", "jpg", {"quality": 82, "optimize": True, "progressive": True}),
+)
+DERIVED_DIR = "listing_images/derived"
+MAX_ATTEMPTS = 3
+STALE_AFTER = timedelta(minutes=10)
+
+Status = ListingImage.ProcessingStatus
+
+
+def variant_name(listing_image, variant: str, extension: str) -> str:
+    # Keyed by the row, not only the file: images sharing a blob (see
+    # blobs.py) must not delete each other's variants when reprocessed.
+    stem = posixpath.splitext(posixpath.basename(listing_image.image.name))[0]
+    return f"{DERIVED_DIR}/{listing_image.pk}/{stem}_{variant}.{extension}"
+
+
+def _flatten(img, pil_format):
+    """Modes each format can encode: JPEG has no alpha, so composite on white."""
+    if pil_format == "JPEG":
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            rgba = img.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            return background
+        return img.convert("RGB") if img.mode != "RGB" else img
+    if img.mode not in ("RGB", "RGBA"):
+        return img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+    return img
+
+
+def _encode(img, pil_format, options) -> bytes:
+    buffer = io.BytesIO()
+    # No exif=/icc_profile= arguments: derivatives carry no metadata.
+    _flatten(img, pil_format).save(buffer, format=pil_format, **options)
+    return buffer.getvalue()
+
+
+def _resized(img, max_edge):
+    if max(img.size) <= max_edge:
+        return img
+    copy = img.copy()
+    copy.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    return copy
+
+
+def _strip_original(listing_image, source, oriented) -> None:
+    """Replace the stored original with a metadata-free copy, if it had EXIF."""
+    if not source.getexif():
+        return
+    storage = listing_image.image.storage
+    old_name = listing_image.image.name
+    pil_format = source.format or "JPEG"
+    options = {}
+    if pil_format == "JPEG":
+        # Unrotated JPEGs reuse their quantization tables: no visible loss.
+        options = {"quality": "keep"} if oriented is source else {"quality": 95}
+        image = oriented if oriented is source else _flatten(oriented, "JPEG")
+    else:
+        image = oriented
+    buffer = io.BytesIO()
+    image.save(buffer, format=pil_format, **options)
+    if listing_image.blob_id is not None:
+        # The blob may be shared: store the stripped copy as a blob of its own
+        # and leave the old one to the collector once nothing references it.
+        blob = blobs.store(ContentFile(buffer.getvalue(), name=old_name))
+        listing_image.blob = blob
+        listing_image.image.name = blob.name
+        return
+    # S3-style storages overwrite in place; FileSystemStorage picks a new name.
+    new_name = storage.save(old_name, ContentFile(buffer.getvalue()))
+    if new_name != old_name:
+        storage.delete(old_name)
+    listing_image.image.name = new_name
+
+
+def process(listing_image) -> None:
+    """Render and store every derivative of one image, then mark it READY."""
+    storage = listing_image.image.storage
+    with listing_image.image.open("rb") as handle:
+        source = Image.open(handle)
+        source.load()
+    oriented = ImageOps.exif_transpose(source)
+    if oriented is None:  # Pillow < 9.4 returns None when there is nothing to rotate
+        oriented = source
+
+    previous = listing_image.variants or {}
+    variants = {}
+    for variant, max_edge in VARIANTS:
+        resized = _resized(oriented, max_edge)
+        entry = {"width": resized.width, "height": resized.height}
+        for key, pil_format, extension, options in FORMATS:
+            name = variant_name(listing_image, variant, extension)
+            old = previous.get(variant, {}).get(key)
+            if old:
+                storage.delete(old)
+            entry[key] = storage.save(name, ContentFile(_encode(resized, pil_format, options)))
+        variants[variant] = entry
+
+    _strip_original(listing_image, source, oriented)
+    listing_image.width, listing_image.height = oriented.size
+    listing_image.variants = variants
+    listing_image.processing_status = Status.READY
+    listing_image.processing_started_at = None
+    listing_image.save(
+        update_fields=[
+            "image",
+            "blob",
+            "width",
+            "height",
+            "variants",
+            "processing_status",
+            "processing_started_at",
+        ]
+    )
+
+
+def _claimable():
+    stale = timezone.now() - STALE_AFTER
+    return ListingImage.objects.filter(
+        Q(processing_status=Status.PENDING)
+        | Q(processing_status=Status.PROCESSING, processing_started_at__lt=stale)
+    )
+
+
+def claim(limit: int) -> list:
+    """Atomically take up to ``limit`` images off the queue for this worker."""
+    claimed = []
+    for pk in _claimable().order_by("id").values_list("pk", flat=True)[: limit * 2]:
+        # Only one worker's UPDATE can match the row while it is still claimable.
+        taken = _claimable().filter(pk=pk).update(
+            processing_status=Status.PROCESSING,
+            processing_started_at=timezone.now(),
+            processing_attempts=F("processing_attempts") + 1,
+        )
+        if taken:
+            claimed.append(pk)
+            if len(claimed) >= limit:
+                break
+    return list(ListingImage.objects.filter(pk__in=claimed).order_by("id"))
+
+
+def run_pending(limit: int = 20) -> dict:
+    """Process one batch from the queue; returns counts by outcome."""
+    counts = {"ready": 0, "retry": 0, "failed": 0}
+    for listing_image in claim(limit):
+        try:
+            process(listing_image)
+            counts["ready"] += 1
+        except Exception:
+            logger.exception("Processing listing image %s failed", listing_image.pk)
+            failed = listing_image.processing_attempts >= MAX_ATTEMPTS
+            ListingImage.objects.filter(pk=listing_image.pk).update(
+                processing_status=Status.FAILED if failed else Status.PENDING,
+                processing_started_at=None,
+            )
+            counts["failed" if failed else "retry"] += 1
+    return counts
+
+
+def srcset(listing_image, key: str, build_url=None) -> str:
+    """``"<url> 320w, <url> 640w, ..."`` for one format, or "" until processed."""
+    if listing_image.processing_status != Status.READY:
+        return ""
+    storage = listing_image.image.storage
+    parts = []
+    for variant, _ in VARIANTS:
+        entry = (listing_image.variants or {}).get(variant) or {}
+        if entry.get(key):
+            url = storage.url(entry[key])
+            parts.append(f"{build_url(url) if build_url else url} {entry['width']}w")
+    return ", ".join(parts)
+
+
+def variant_url(listing_image, variant: str, key: str = "jpeg"):
+    """Storage URL of one derivative, or None until processed."""
+    if listing_image.processing_status != Status.READY:
+        return None
+    name = ((listing_image.variants or {}).get(variant) or {}).get(key)
+    return listing_image.image.storage.url(name) if name else None
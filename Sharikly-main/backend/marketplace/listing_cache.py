@@ -0,0 +1,148 @@
+"""
+Versioned response cache for ``GET /listings/`` and ``GET /listings/facets/``.
+
+Pages are cached under a key made of the current *version*, the normalized
+query string, the host, and the viewer (anonymous viewers share entries;
+signed-in viewers get their own because ``is_favorited`` and their block list
+change the page). Instead of guessing TTLs, every write that can change a
+listing page bumps the version (see ``signals.py``), so all earlier entries
+become unreachable at once and simply age out of the cache.
+
+Data that the listing payload embeds but that does not bump the version
+(owner profile fields, chat response stats) is bounded by
+``LISTING_CACHE_TIMEOUT`` seconds (default 600).
+
+The version only works if every process reads the same counter, so the
+alias must be a shared backend (Redis or the database cache; see
+``CACHES`` in settings). On a per-process backend (LocMem) a bump in one
+worker is invisible to the others, so entries there live at most
+``PROCESS_LOCAL_TIMEOUT`` seconds.
+
+Settings: ``LISTING_CACHE_ALIAS`` (default ``"default"``),
+``LISTING_CACHE_TIMEOUT``; a timeout of 0 disables the cache.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+VERSION_KEY = "listings:version"
+HITS_KEY = "listings:stats:hits"
+MISSES_KEY = "listings:stats:misses"
+DEFAULT_TIMEOUT = 600
+PROCESS_LOCAL_TIMEOUT = 30
+
+
+def _cache():
+    return caches[getattr(settings, "LISTING_CACHE_ALIAS", "default")]
+
+
+def is_process_local(cache) -> bool:
+    """Whether ``cache`` lives in this process only, unseen by other workers."""
+    return isinstance(cache, LocMemCache)
+
+
+def timeout() -> int:
+    ttl = getattr(settings, "LISTING_CACHE_TIMEOUT", DEFAULT_TIMEOUT)
+    if ttl > 0 and is_process_local(_cache()):
+        return min(ttl, PROCESS_LOCAL_TIMEOUT)
+    return ttl
+
+
+def is_enabled() -> bool:
+    return timeout() > 0
+
+
+def _incr(key) -> int:
+    cache = _cache()
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr().
+        cache.set(key, 1, None)
+        return 1
+
+
+def current_version() -> int:
+    cache = _cache()
+    cache.add(VERSION_KEY, 1, None)
+    return cache.get(VERSION_KEY) or 1
+
+
+def bump_version() -> None:
+    """
+    Invalidate every cached page. Bumped immediately (so the writing request
+    never reads its own stale page) and again on commit (so a page cached by a
+    concurrent request between the two still sees the committed write).
+    """
+    _incr(VERSION_KEY)
+    transaction.on_commit(lambda: _incr(VERSION_KEY))
+
+
+def normalized_params(query_params, ignore=()) -> list:
+    """Sorted (name, value) pairs without blanks; ``page=1`` is the same as no page."""
+    pairs = []
+    for name in sorted(query_params):
+        if name in ignore:
+            continue
+        values = sorted(v.strip() for v in query_params.getlist(name) if v.strip())
+        if name == "page" and values == ["1"]:
+            continue
+        pairs.extend((name, value) for value in values)
+    return pairs
+
+
+def page_key(request, blocked_ids=(), namespace="page", ignore=()) -> str:
+    """
+    Cache key for a response to ``request``. ``namespace`` separates payload
+    kinds (list pages, facets); ``ignore`` names params that do not affect it.
+    """
+    user = request.user
+    if user.is_authenticated:
+        viewer = f"u{user.pk}:" + ",".join(map(str, sorted(blocked_ids)))
+    else:
+        viewer = "anon"
+    raw = "|".join(
+        [
+            request.get_host(),
+            request.scheme,
+            viewer,
+            "&".join(
+                f"{name}={value}"
+                for name, value in normalized_params(request.query_params, ignore)
+            ),
+        ]
+    )
+    digest = hashlib.sha256(raw.encode()).hexdigest()
+    return f"listings:v{current_version()}:{namespace}:{digest}"
+
+
+def get_page(key):
+    data = _cache().get(key)
+    _incr(HITS_KEY if data is not None else MISSES_KEY)
+    return data
+
+
+def set_page(key, data) -> None:
+    _cache().set(key, data, timeout())
+
+
+def stats() -> dict:
+    cache = _cache()
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    total = hits + misses
+    return {
+        "version": current_version(),
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 4) if total else None,
+        "timeout": timeout(),
+    }
+
+
+def reset_stats() -> None:
+    _cache().delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,119 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from marketplace import availability
+from marketplace.models import AvailabilityBlock, Booking, Listing
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the available_from/available_to listing filter: occupancy index "
+        "vs. the old per-listing Exists over bookings. Synthetic data is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=50_000)
+        parser.add_argument("--bookings-per-listing", type=int, default=4)
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        today = date.today()
+        windows = [
+            (today + timedelta(days=offset), today + timedelta(days=offset + length))
+            for offset, length in ((3, 2), (20, 7), (60, 30))
+        ]
+        with transaction.atomic():
+            self._seed(rng, options, today)
+            self.stdout.write(f"{'window':<24} {'exists ms':>10} {'index ms':>9} {'available':>10}")
+            for start, end in windows:
+                legacy = self._time(lambda: self._run_exists(start, end), options["repeat"])
+                indexed = self._time(lambda: self._run_index(start, end), options["repeat"])
+                hits = availability.filter_available(self._base(), start, end).count()
+                label = f"{start}..{end}"
+                self.stdout.write(f"{label:<24} {legacy:>10.2f} {indexed:>9.2f} {hits:>10}")
+            transaction.set_rollback(True)
+
+    def _seed(self, rng, options, today):
+        owner = User.objects.create_user(
+            username="bench_avail_owner", email="bench-avail@example.invalid", password=None
+        )
+        renter = User.objects.create_user(
+            username="bench_avail_renter", email="bench-avail-r@example.invalid", password=None
+        )
+        listings = Listing.objects.bulk_create(
+            Listing(owner=owner, title=f"Item {i}", description="", price_per_day=10, city="Riyadh")
+            for i in range(options["listings"])
+        )
+        statuses = [Booking.Status.PENDING, Booking.Status.CONFIRMED, Booking.Status.CANCELLED]
+        bookings, blocks = [], []
+        for listing in listings:
+            # Mostly past rentals, as in a mature catalog, plus a few upcoming ones.
+            for _ in range(options["bookings_per_listing"]):
+                start = today + timedelta(days=rng.randint(-700, 90))
+                bookings.append(
+                    Booking(
+                        listing=listing,
+                        renter=renter,
+                        start_date=start,
+                        end_date=start + timedelta(days=rng.randint(0, 6)),
+                        total_price=Decimal("10.00"),
+                        status=rng.choice(statuses),
+                    )
+                )
+            if rng.random() < 0.1:
+                start = today + timedelta(days=rng.randint(0, 90))
+                blocks.append(
+                    AvailabilityBlock(
+                        listing=listing, start_date=start, end_date=start + timedelta(days=3)
+                    )
+                )
+        Booking.objects.bulk_create(bookings, batch_size=5000)
+        AvailabilityBlock.objects.bulk_create(blocks, batch_size=5000)
+        # bulk_create bypasses the signals that maintain the index.
+        availability.rebuild()
+        self.stdout.write(
+            f"Seeded {len(listings)} listings, {len(bookings)} bookings, {len(blocks)} blocks."
+        )
+
+    @staticmethod
+    def _base():
+        return Listing.objects.filter(is_active=True)
+
+    @staticmethod
+    def _page(qs):
+        # Mirrors a paginated list request: COUNT(*) plus the first page of ids.
+        qs.count()
+        return list(qs.order_by("-created_at").values_list("id", flat=True)[:12])
+
+    def _run_exists(self, start, end):
+        overlap = Booking.objects.filter(
+            listing_id=OuterRef("pk"),
+            status__in=[Booking.Status.PENDING, Booking.Status.CONFIRMED],
+            start_date__lte=end,
+            end_date__gte=start,
+        )
+        return self._page(self._base().annotate(has_overlap=Exists(overlap)).filter(has_overlap=False))
+
+    def _run_index(self, start, end):
+        return self._page(availability.filter_available(self._base(), start, end))
+
+    @staticmethod
+    def _time(fn, repeat):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
@@ -0,0 +1,100 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from marketplace.models import Category, Listing, ListingImage, Review
+from marketplace.views import ListingRetrieveUpdateView
+
+from .bench_listing_payloads import BENCH_STORAGES
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the listing detail hot path: full 200 response vs. a revalidation "
+        "answered with 304 Not Modified. Reports queries, median latency and bytes "
+        "on the wire. Synthetic data is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", type=int, default=6)
+        parser.add_argument("--reviews", type=int, default=30)
+        parser.add_argument("--repeat", type=int, default=50)
+
+    def handle(self, *args, **options):
+        with override_settings(STORAGES=BENCH_STORAGES), transaction.atomic():
+            listing, viewer = self._seed(options)
+            view = ListingRetrieveUpdateView.as_view(throttle_classes=[])
+            factory = APIRequestFactory()
+
+            def fetch(etag=None):
+                headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+                request = factory.get(f"/api/listings/{listing.pk}/", **headers)
+                force_authenticate(request, user=viewer)
+                response = view(request, pk=listing.pk)
+                if hasattr(response, "render"):
+                    response.render()
+                return response
+
+            etag = fetch()["ETag"]
+            self.stdout.write(
+                f"{'variant':<14} {'status':>6} {'queries':>8} {'median ms':>10} {'bytes':>8}"
+            )
+            results = {}
+            for label, header in (("full", None), ("revalidated", etag)):
+                reset_queries()  # the query log is capped; seeding would overflow it
+                with CaptureQueriesContext(connection) as captured:
+                    response = fetch(header)
+                samples = []
+                for _ in range(options["repeat"]):
+                    start = time.perf_counter()
+                    fetch(header)
+                    samples.append((time.perf_counter() - start) * 1000)
+                results[label] = (statistics.median(samples), len(response.content))
+                self.stdout.write(
+                    f"{label:<14} {response.status_code:>6} {len(captured):>8} "
+                    f"{results[label][0]:>10.2f} {results[label][1]:>8}"
+                )
+            full_ms, full_bytes = results["full"]
+            cond_ms, cond_bytes = results["revalidated"]
+            self.stdout.write(
+                f"Saved per revalidation: {full_bytes - cond_bytes} bytes, "
+                f"{full_ms - cond_ms:.2f} ms ({(1 - cond_ms / full_ms) * 100:.0f}% of server time)."
+            )
+            transaction.set_rollback(True)
+
+    def _seed(self, options):
+        owner = User.objects.create_user(
+            username="bench_cond_owner", email="bench-cond@example.invalid", password=None
+        )
+        listing = Listing.objects.create(
+            owner=owner,
+            category=Category.objects.create(name="Bench conditional"),
+            title="Bench camera kit",
+            description="Synthetic listing used by bench_conditional_get. " * 10,
+            price_per_day=120,
+            city="Riyadh",
+        )
+        ListingImage.objects.bulk_create(
+            ListingImage(listing=listing, image=f"listing_images/bench_cond_{pos}.jpg", position=pos)
+            for pos in range(options["images"])
+        )
+        reviewers = [
+            User.objects.create_user(
+                username=f"bench_cond_reviewer_{i}",
+                email=f"bench-cond-reviewer-{i}@example.invalid",
+                password=None,
+            )
+            for i in range(options["reviews"])
+        ]
+        for i, reviewer in enumerate(reviewers):
+            Review.objects.create(
+                listing=listing, user=reviewer, rating=1 + i % 5, comment="Worked great, would rent again."
+            )
+        return listing, reviewers[0] if reviewers else owner
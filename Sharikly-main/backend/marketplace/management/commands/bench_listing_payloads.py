@@ -0,0 +1,126 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from marketplace.models import Category, Favorite, Listing, ListingImage, Review
+from marketplace.views import ListingListCreateView
+
+User = get_user_model()
+
+# Media URLs only need to be built, not served.
+BENCH_STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark a /listings/ page: full ListingSerializer vs. ?view=card, uncached "
+        "and served from the listing page cache. Reports queries and median latency "
+        "per page. Synthetic data is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=200)
+        parser.add_argument("--page-size", type=int, default=20)
+        parser.add_argument("--images", type=int, default=4, help="Images per listing.")
+        parser.add_argument("--reviews", type=int, default=5, help="Reviews per listing.")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        with override_settings(STORAGES=BENCH_STORAGES), transaction.atomic():
+            viewer = self._seed(rng, options)
+            view = ListingListCreateView.as_view(throttle_classes=[])
+            factory = APIRequestFactory()
+            self.stdout.write(f"{'variant':<12} {'queries':>8} {'median ms':>10} {'bytes':>8}")
+            variants = (
+                ("full", {}, 0),
+                ("card", {"view": "card"}, 0),
+                ("full+cache", {}, 600),
+                ("card+cache", {"view": "card"}, 600),
+            )
+            for label, params, cache_timeout in variants:
+                params = {**params, "page_size": options["page_size"]}
+
+                def fetch():
+                    request = factory.get("/api/listings/", params)
+                    force_authenticate(request, user=viewer)
+                    with override_settings(LISTING_CACHE_TIMEOUT=cache_timeout):
+                        response = view(request)
+                    response.render()
+                    return response
+
+                if cache_timeout:
+                    fetch()  # warm the cache; the samples below are hits
+
+                reset_queries()  # the query log is capped; seeding would overflow it
+                with CaptureQueriesContext(connection) as captured:
+                    response = fetch()
+                samples = []
+                for _ in range(options["repeat"]):
+                    start = time.perf_counter()
+                    fetch()
+                    samples.append((time.perf_counter() - start) * 1000)
+                self.stdout.write(
+                    f"{label:<12} {len(captured):>8} {statistics.median(samples):>10.2f} "
+                    f"{len(response.content):>8}"
+                )
+            transaction.set_rollback(True)
+
+    def _seed(self, rng, options):
+        category = Category.objects.create(name="Bench payloads")
+        owners = [
+            User.objects.create_user(
+                username=f"bench_payload_owner_{i}",
+                email=f"bench-payload-{i}@example.invalid",
+                password=None,
+            )
+            for i in range(10)
+        ]
+        reviewers = [
+            User.objects.create_user(
+                username=f"bench_payload_reviewer_{i}",
+                email=f"bench-payload-reviewer-{i}@example.invalid",
+                password=None,
+            )
+            for i in range(options["reviews"])
+        ]
+        viewer = reviewers[0] if reviewers else owners[0]
+        listings = [
+            Listing.objects.create(
+                owner=rng.choice(owners),
+                category=category,
+                title=f"Bench item {i}",
+                description="Synthetic listing used by bench_listing_payloads.",
+                price_per_day=rng.randint(10, 500),
+                city="Riyadh",
+                latitude=24.7 + rng.random() / 10,
+                longitude=46.6 + rng.random() / 10,
+            )
+            for i in range(options["listings"])
+        ]
+        ListingImage.objects.bulk_create(
+            ListingImage(listing=listing, image=f"listing_images/bench_{listing.pk}_{pos}.jpg", position=pos)
+            for listing in listings
+            for pos in range(options["images"])
+        )
+        for listing in listings:
+            for reviewer in reviewers:
+                Review.objects.create(
+                    listing=listing, user=reviewer, rating=rng.randint(1, 5), comment="ok"
+                )
+            if rng.random() < 0.3:
+                Favorite.objects.create(user=viewer, listing=listing)
+        self.stdout.write(
+            f"Seeded {len(listings)} listings x {options['images']} images x {len(reviewers)} reviews."
+        )
+        return viewer
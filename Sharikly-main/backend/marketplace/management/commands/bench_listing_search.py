@@ -0,0 +1,105 @@
+import random
+import statistics
+import string
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from marketplace import search
+from marketplace.models import Listing
+
+User = get_user_model()
+
+WORDS = (
+    "camera lens tripod drone bike tent projector speaker guitar drill ladder "
+    "kayak scooter console laptop stroller generator mixer canon sony nikon "
+    "portable professional wireless electric outdoor camping studio party "
+    "كاميرا عدسة دراجة خيمة مكبر صوت سماعة جيتار مثقاب سلم"
+).split()
+CITIES = ["Riyadh", "Jeddah", "Dammam", "Mecca", "Medina", "Khobar", "Abha", "Tabuk"]
+DEFAULT_QUERIES = ["camera", "cam", "sony lens", "كاميرا", "portable drill", "zzzz"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark listing search: full-text index vs. the old icontains scan. "
+        "Synthetic listings are created inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=100_000)
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument("--query", action="append", dest="queries")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        queries = options["queries"] or DEFAULT_QUERIES
+        with transaction.atomic():
+            self._seed(rng, options["listings"])
+            self.stdout.write(f"{'query':<16} {'icontains ms':>13} {'fts ms':>9} {'hits':>7}")
+            for q in queries:
+                legacy = self._time(lambda: self._run_icontains(q), options["repeat"])
+                fts = self._time(lambda: self._run_fts(q), options["repeat"])
+                hits = search.filter_queryset(Listing.objects.filter(is_active=True), q, rank=False).count()
+                self.stdout.write(f"{q:<16} {legacy:>13.2f} {fts:>9.2f} {hits:>7}")
+            transaction.set_rollback(True)
+
+    def _seed(self, rng, count):
+        owner = User.objects.create_user(
+            username="bench_search_owner", email="bench-search@example.invalid", password=None
+        )
+        # Descriptions are mostly filler from a large vocabulary so product words
+        # are about as selective as they are in real listings.
+        filler = [
+            "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9)))
+            for _ in range(20_000)
+        ]
+        batch = []
+        for _ in range(count):
+            description = rng.choices(filler, k=35) + rng.choices(WORDS, k=2)
+            rng.shuffle(description)
+            batch.append(
+                Listing(
+                    owner=owner,
+                    title=" ".join(rng.choices(WORDS, k=3)),
+                    description=" ".join(description),
+                    price_per_day=rng.randint(10, 500),
+                    city=rng.choice(CITIES),
+                )
+            )
+            if len(batch) >= 5000:
+                Listing.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Listing.objects.bulk_create(batch)
+        search.rebuild_index()
+        self.stdout.write(f"Seeded {count} listings.")
+
+    @staticmethod
+    def _page(qs):
+        # Mirrors a paginated list request: COUNT(*) plus the first page of ids.
+        qs.count()
+        return list(qs.values_list("id", flat=True)[:12])
+
+    def _run_icontains(self, q):
+        qs = Listing.objects.filter(is_active=True).filter(
+            Q(title__icontains=q) | Q(description__icontains=q) | Q(city__icontains=q)
+        )
+        return self._page(qs.order_by("-created_at"))
+
+    def _run_fts(self, q):
+        qs = search.filter_queryset(Listing.objects.filter(is_active=True), q)
+        return self._page(qs.order_by("-search_rank", "-created_at"))
+
+    @staticmethod
+    def _time(fn, repeat):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
@@ -0,0 +1,105 @@
+import random
+import statistics
+import string
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from marketplace import suggest
+from marketplace.models import Category, Listing
+
+User = get_user_model()
+
+WORDS = (
+    "camera lens tripod drone bike tent projector speaker guitar drill ladder "
+    "kayak scooter console laptop stroller generator mixer canon sony nikon "
+    "portable professional wireless electric outdoor camping studio party "
+    "كاميرا عدسة دراجة خيمة مكبر صوت سماعة جيتار مثقاب سلم الكاميرا الاحترافية"
+).split()
+CITIES = ["Riyadh", "Jeddah", "Dammam", "Mecca", "Medina", "Khobar", "Abha", "Tabuk", "الرياض", "جدة"]
+CATEGORIES = ["Cameras", "Camping", "Tools", "Electronics", "Music", "Sports", "كاميرات", "أدوات"]
+DEFAULT_QUERIES = ["ca", "cam", "sony ca", "ri", "كام", "الكا", "zzzz"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark /listings/suggest/: in-memory prefix index vs. the old icontains "
+        "queries. Synthetic listings are created inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=200_000)
+        parser.add_argument("--repeat", type=int, default=200)
+        parser.add_argument("--query", action="append", dest="queries")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        queries = options["queries"] or DEFAULT_QUERIES
+        with transaction.atomic():
+            self._seed(rng, options["listings"])
+            index = suggest.SuggestIndex()
+            start = time.perf_counter()
+            index.rebuild()
+            build_ms = (time.perf_counter() - start) * 1000
+            self.stdout.write(
+                f"Index build: {build_ms:.0f} ms, {len(index.titles)} distinct titles, "
+                f"{index.titles.entry_count} title keys."
+            )
+            self.stdout.write(f"{'query':<10} {'icontains ms':>13} {'index us':>9} {'titles':>7}")
+            for q in queries:
+                legacy = self._time(lambda: self._run_icontains(q), max(options["repeat"] // 20, 3))
+                indexed = self._time(lambda: index.suggest(q), options["repeat"]) * 1000
+                hits = len(index.suggest(q)["titles"])
+                self.stdout.write(f"{q:<10} {legacy:>13.2f} {indexed:>9.1f} {hits:>7}")
+            transaction.set_rollback(True)
+
+    def _seed(self, rng, count):
+        owner = User.objects.create_user(
+            username="bench_suggest_owner", email="bench-suggest@example.invalid", password=None
+        )
+        for name in CATEGORIES:
+            Category.objects.get_or_create(name=name)
+        batch = []
+        for _ in range(count):
+            # Mostly unique titles, like real catalogs: product words plus a model code.
+            code = "".join(rng.choices(string.ascii_uppercase + string.digits, k=5))
+            batch.append(
+                Listing(
+                    owner=owner,
+                    title=" ".join(rng.choices(WORDS, k=rng.randint(2, 4)) + [code]),
+                    description="",
+                    price_per_day=rng.randint(10, 500),
+                    city=rng.choice(CITIES),
+                )
+            )
+            if len(batch) >= 5000:
+                Listing.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Listing.objects.bulk_create(batch)
+        self.stdout.write(f"Seeded {count} listings.")
+
+    @staticmethod
+    def _run_icontains(q):
+        # The three queries ListingSuggestView used to run per keystroke.
+        base = Listing.objects.filter(is_active=True)
+        list(base.filter(title__icontains=q).values_list("title", flat=True).order_by("title").distinct()[:8])
+        list(
+            base.filter(city__isnull=False, city__icontains=q)
+            .values_list("city", flat=True)
+            .order_by("city")
+            .distinct()[:8]
+        )
+        list(Category.objects.filter(name__icontains=q).values("id", "name").order_by("name").distinct()[:8])
+
+    @staticmethod
+    def _time(fn, repeat):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
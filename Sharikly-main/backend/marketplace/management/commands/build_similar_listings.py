@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from marketplace import similarity
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute content-based similar listings (TF-IDF over hashed title/description "
+        "words, category and price band) into the SimilarListing table. Run nightly; "
+        "run with --incremental every few minutes for listings still without neighbors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only compute active listings without neighbors (e.g. a failed refresh after save).",
+        )
+        parser.add_argument("--top-k", type=int, default=similarity.TOP_K)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        corpus = similarity.Corpus.load()
+        loaded = time.perf_counter()
+        if options["incremental"]:
+            result = similarity.refresh(corpus=corpus, k=options["top_k"])
+            summary = (
+                f"Refreshed {result['listings']} listing(s); "
+                f"updated {result['updated']} neighbor list(s)"
+            )
+        else:
+            result = similarity.rebuild(corpus=corpus, k=options["top_k"])
+            summary = f"Stored {result['rows']} neighbor(s) for {result['listings']} listing(s)"
+        done = time.perf_counter()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{summary} (vectors {loaded - start:.1f}s, neighbors {done - loaded:.1f}s)."
+            )
+        )
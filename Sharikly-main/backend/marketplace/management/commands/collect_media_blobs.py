@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from marketplace import blobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Deduplicate listing photos: hash listing images that have no "
+        "blob yet (direct uploads, files from before deduplication), re-pointing "
+        "duplicates at the stored copy, then delete blobs nothing references. "
+        "Run hourly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--skip-adopt", action="store_true", help="Only collect unreferenced blobs."
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        if not options["skip_adopt"]:
+            totals = {"hashed": 0, "deduplicated": 0, "errors": 0}
+            while True:
+                counts = blobs.adopt_pending(limit=options["batch_size"])
+                for key, n in counts.items():
+                    totals[key] += n
+                # Rows that failed stay pending; stop rather than retry them forever.
+                if not counts["hashed"] or counts["errors"]:
+                    break
+            self.stdout.write(
+                f"Hashed {totals['hashed']} file(s), {totals['deduplicated']} duplicate(s) "
+                f"removed, {totals['errors']} error(s)."
+            )
+        collected = blobs.collect_garbage(batch_size=options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Deleted {collected['blobs']} unreferenced blob(s), "
+                f"{collected['bytes']} bytes."
+            )
+        )
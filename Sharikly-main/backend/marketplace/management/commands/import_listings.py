@@ -0,0 +1,59 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from marketplace import bulk_import
+
+
+class Command(BaseCommand):
+    help = (
+        "Create listings for one owner from a CSV or JSONL manifest and an optional "
+        "ZIP of photos, like POST /api/listings/import/ but without its row limit."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("manifest", help="Path to a .csv or .jsonl manifest.")
+        parser.add_argument("--images", help="Path to a .zip with the photos the rows name.")
+        parser.add_argument("--owner", required=True, help="Owner's email or user id.")
+        parser.add_argument("--chunk-size", type=int, default=bulk_import.CHUNK_SIZE)
+        parser.add_argument("--report", help="Write the per-row JSON report to this path.")
+
+    def _owner(self, value):
+        User = get_user_model()
+        lookup = {"pk": int(value)} if value.isdigit() else {"email__iexact": value}
+        try:
+            return User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f"No user {value!r}.")
+
+    def handle(self, *args, **options):
+        owner = self._owner(options["owner"])
+        archive = open(options["images"], "rb") if options["images"] else None
+        try:
+            with open(options["manifest"], "rb") as manifest:
+                report = bulk_import.run(
+                    owner,
+                    manifest,
+                    options["manifest"],
+                    archive_file=archive,
+                    chunk_size=options["chunk_size"],
+                    limit=float("inf"),
+                )
+        except bulk_import.ManifestError as exc:
+            raise CommandError(str(exc))
+        finally:
+            if archive:
+                archive.close()
+
+        if options["report"]:
+            with open(options["report"], "w") as handle:
+                json.dump(report, handle, indent=2)
+        for entry in report["rows"]:
+            if "errors" in entry:
+                self.stdout.write(f"Row {entry['row']}: {json.dumps(entry['errors'])}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {report['created']} listing(s); {report['failed']} row(s) failed."
+            )
+        )
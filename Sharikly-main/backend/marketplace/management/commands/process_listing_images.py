@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from marketplace import images
+
+
+class Command(BaseCommand):
+    help = (
+        "Image worker: render thumb/card/full WebP and JPEG variants of uploaded "
+        "listing photos, strip their EXIF and record their dimensions. Runs until "
+        "stopped; use --once from cron to drain the queue and exit."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit when the queue is empty.")
+        parser.add_argument("--batch-size", type=int, default=20)
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=5.0,
+            help="Seconds to wait before polling an empty queue again.",
+        )
+
+    def handle(self, *args, **options):
+        totals = {"ready": 0, "retry": 0, "failed": 0}
+        while True:
+            counts = images.run_pending(limit=options["batch_size"])
+            for outcome, n in counts.items():
+                totals[outcome] += n
+            if any(counts.values()):
+                self.stdout.write(
+                    f"Processed {counts['ready']} image(s); "
+                    f"{counts['retry']} to retry, {counts['failed']} failed."
+                )
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["sleep"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Done: {totals['ready']} ready, {totals['retry']} to retry, "
+                f"{totals['failed']} failed."
+            )
+        )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from marketplace import uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete direct uploads that expired without being attached to a listing "
+        "or message, together with their stored objects. Run hourly."
+    )
+
+    def handle(self, *args, **options):
+        deleted = uploads.purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Purged {deleted} expired upload(s)."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from marketplace import availability
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the listing availability index (ListingOccupancy) from bookings "
+        "and availability blocks. Safe to re-run; use after bulk imports or restores."
+    )
+
+    def handle(self, *args, **options):
+        count = availability.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} occupied date range(s)."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from marketplace import search
+from marketplace.models import Listing
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the listings full-text search index from the listings table. "
+        "Safe to re-run; use after bulk imports or restoring a database dump."
+    )
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(self.style.WARNING("Full-text search is not supported on this database; nothing to do."))
+            return
+        with transaction.atomic():
+            search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {Listing.objects.count()} listing(s)."))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from marketplace import ranking
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount listing favorites and refresh the owner Super Host flags used by "
+        "order=relevance. Run periodically (e.g. hourly) so chat response-rate "
+        "changes reach the ranking."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            result = ranking.sync_all()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Ranking signals refreshed; {result['super_hosts']} owner(s) qualify as Super Host."
+            )
+        )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from marketplace import ratings
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill and verify the denormalized listing rating aggregates "
+        "(rating_avg, rating_count, rating_histogram) against the reviews table. "
+        "Use --verify to only report drift (exits non-zero if any is found)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Report listings whose stored aggregates are wrong without fixing them.",
+        )
+
+    def handle(self, *args, **options):
+        verify_only = options["verify"]
+        with transaction.atomic():
+            drifted = ratings.sync_all(dry_run=verify_only)
+
+        if verify_only:
+            if drifted:
+                preview = ", ".join(str(pk) for pk in drifted[:20])
+                raise CommandError(
+                    f"{len(drifted)} listing(s) have stale rating aggregates: {preview}"
+                    + (" ..." if len(drifted) > 20 else "")
+                )
+            self.stdout.write(self.style.SUCCESS("All listing rating aggregates are up to date."))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f"Fixed rating aggregates on {len(drifted)} listing(s)."))
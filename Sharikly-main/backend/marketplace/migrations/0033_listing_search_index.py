@@ -0,0 +1,67 @@
+from django.db import migrations
+
+
+PG_FORWARD = [
+    """
+    CREATE TABLE IF NOT EXISTS marketplace_listing_search (
+        listing_id bigint PRIMARY KEY
+            REFERENCES marketplace_listing (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        document tsvector NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS marketplace_listing_search_document_gin
+        ON marketplace_listing_search USING gin (document)
+    """,
+    """
+    INSERT INTO marketplace_listing_search (listing_id, document)
+    SELECT id,
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(city, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+    FROM marketplace_listing
+    ON CONFLICT (listing_id) DO NOTHING
+    """,
+]
+PG_BACKWARD = ["DROP TABLE IF EXISTS marketplace_listing_search"]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS marketplace_listing_fts USING fts5(
+        title, city, description,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO marketplace_listing_fts (rowid, title, city, description)
+    SELECT id, coalesce(title, ''), coalesce(city, ''), coalesce(description, '')
+    FROM marketplace_listing
+    """,
+]
+SQLITE_BACKWARD = ["DROP TABLE IF EXISTS marketplace_listing_fts"]
+
+
+def create_search_index(apps, schema_editor):
+    """Vendor-specific search document storage (see marketplace/search.py)."""
+    vendor = schema_editor.connection.vendor
+    statements = {"postgresql": PG_FORWARD, "sqlite": SQLITE_FORWARD}.get(vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {"postgresql": PG_BACKWARD, "sqlite": SQLITE_BACKWARD}.get(vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0032_listing_deposit'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
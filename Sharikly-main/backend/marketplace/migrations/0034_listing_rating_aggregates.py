@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:20
+
+import marketplace.models
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Avg, Count, Q
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Listing = apps.get_model("marketplace", "Listing")
+    Review = apps.get_model("marketplace", "Review")
+    expressions = {"count": Count("id"), "avg": Avg("rating")}
+    for stars in range(6):
+        expressions[f"stars_{stars}"] = Count("id", filter=Q(rating=stars))
+    rows = Review.objects.order_by().values("listing_id").annotate(**expressions)
+    for row in rows:
+        Listing.objects.filter(pk=row["listing_id"]).update(
+            rating_avg=float(row["avg"]),
+            rating_count=row["count"],
+            rating_histogram=[row[f"stars_{stars}"] for stars in range(6)],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0033_listing_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='rating_avg',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_histogram',
+            field=models.JSONField(default=marketplace.models.empty_rating_histogram, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['is_active', 'rating_avg'], name='marketplace_is_acti_2e6c48_idx'),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0034_listing_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', 'created_at'], name='marketplace_user_id_0cd3a5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'created_at'], name='marketplace_user_id_7f20fa_idx'),
+        ),
+    ]
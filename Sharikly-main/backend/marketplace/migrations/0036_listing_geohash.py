@@ -0,0 +1,63 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of marketplace.geo.encode at precision 7, so later changes to
+# the app code cannot change what this migration writes.
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+PRECISION = 7
+
+
+def encode(latitude, longitude):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # geohash interleaves bits starting with longitude
+    while len(chars) < PRECISION:
+        rng, value = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def backfill_geohash(apps, schema_editor):
+    """Geohash the stored coordinates as-is (no extra jitter)."""
+    Listing = apps.get_model("marketplace", "Listing")
+    rows = Listing.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    for pk, lat, lng in list(rows.values_list("pk", "latitude", "longitude")):
+        Listing.objects.filter(pk=pk).update(geohash=encode(lat, lng))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0035_list_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='geohash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=12),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['is_active', 'geohash'], name='marketplace_is_acti_367030_idx'),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_occupancy(apps, schema_editor):
+    Booking = apps.get_model("marketplace", "Booking")
+    AvailabilityBlock = apps.get_model("marketplace", "AvailabilityBlock")
+    ListingOccupancy = apps.get_model("marketplace", "ListingOccupancy")
+    rows = [
+        ListingOccupancy(
+            booking_id=pk, listing_id=listing_id, start_date=start, end_date=end
+        )
+        for pk, listing_id, start, end in Booking.objects.filter(
+            status__in=["PENDING", "CONFIRMED"]
+        ).values_list("pk", "listing_id", "start_date", "end_date")
+    ]
+    rows += [
+        ListingOccupancy(block_id=pk, listing_id=listing_id, start_date=start, end_date=end)
+        for pk, listing_id, start, end in AvailabilityBlock.objects.values_list(
+            "pk", "listing_id", "start_date", "end_date"
+        )
+    ]
+    ListingOccupancy.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0036_listing_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('block', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='marketplace.availabilityblock')),
+                ('booking', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='marketplace.booking')),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='marketplace.listing')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['listing', 'start_date', 'end_date'], name='marketplace_listing_3c27a4_idx'), models.Index(fields=['end_date', 'start_date', 'listing'], name='marketplace_end_dat_e8f898_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('block__isnull', True), ('booking__isnull', False)), models.Q(('block__isnull', False), ('booking__isnull', True)), _connector='OR'), name='listing_occupancy_single_source')],
+            },
+        ),
+        migrations.RunPython(backfill_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:50
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_favorites_count(apps, schema_editor):
+    # Super Host flags need the chat response stats; they are filled in by
+    # ``python manage.py refresh_ranking_signals``.
+    Favorite = apps.get_model("marketplace", "Favorite")
+    Listing = apps.get_model("marketplace", "Listing")
+    per_listing = (
+        Favorite.objects.filter(listing_id=OuterRef("pk"))
+        .order_by()
+        .values("listing_id")
+        .annotate(n=Count("id"))
+        .values("n")
+    )
+    Listing.objects.update(
+        favorites_count=Coalesce(Subquery(per_listing, output_field=IntegerField()), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0037_listing_occupancy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='owner_is_super_host',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(backfill_favorites_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0038_listing_ranking_signals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarListing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='marketplace.listing')),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbor_of', to='marketplace.listing')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('listing', 'rank'), name='similar_listing_rank_unique')],
+            },
+        ),
+    ]
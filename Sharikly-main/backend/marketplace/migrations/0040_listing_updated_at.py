@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:07
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    # Existing rows got the migration time; their last known change is creation.
+    Listing = apps.get_model("marketplace", "Listing")
+    Listing.objects.update(updated_at=F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0039_similar_listings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0040_listing_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listingimage',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='listingimage',
+            name='processing_attempts',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listingimage',
+            name='processing_started_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='listingimage',
+            name='processing_status',
+            field=models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('READY', 'Ready'), ('FAILED', 'Failed')], default='PENDING', editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='listingimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listingimage',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='listingimage',
+            index=models.Index(fields=['processing_status', 'id'], name='marketplace_process_5a9a23_idx'),
+        ),
+    ]
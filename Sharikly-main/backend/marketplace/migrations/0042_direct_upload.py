@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0041_listing_image_derivatives'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('listing_image', 'Listing image'), ('chat_image', 'Chat image'), ('chat_audio', 'Chat audio'), ('chat_file', 'Chat file')], max_length=20)),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('content_type', models.CharField(max_length=100)),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+                ('consumed_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='direct_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['consumed_at', 'expires_at'], name='marketplace_consume_4dd0e8_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0042_direct_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='directupload',
+            name='key',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.AddField(
+            model_name='directupload',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='marketplace.mediablob'),
+        ),
+        migrations.AddField(
+            model_name='listingimage',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='listing_images', to='marketplace.mediablob'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='blobs',
+            field=models.ManyToManyField(blank=True, related_name='messages', to='marketplace.mediablob'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0043_media_blobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['renter', 'created_at'], name='marketplace_renter__9b7c93_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['listing', 'created_at'], name='marketplace_listing_2d6361_idx'),
+        ),
+    ]
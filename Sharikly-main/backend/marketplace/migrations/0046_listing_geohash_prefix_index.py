@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0045_category_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='listing',
+            name='marketplace_is_acti_367030_idx',
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['is_active', 'geohash'], name='listing_active_geohash_prefix', opclasses=['bool_ops', 'varchar_pattern_ops']),
+        ),
+    ]
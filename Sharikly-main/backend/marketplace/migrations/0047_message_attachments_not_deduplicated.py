@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:15
+
+from django.db import migrations
+
+
+def forget_chat_only_blobs(apps, schema_editor):
+    # Blobs only chat messages point at stop being blobs: their objects stay
+    # with the messages, and their hashes no longer answer "already stored?".
+    # The collector keeps away from objects a message still names.
+    MediaBlob = apps.get_model("marketplace", "MediaBlob")
+    MediaBlob.objects.filter(messages__isnull=False, listing_images__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0046_listing_geohash_prefix_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(forget_chat_only_blobs, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='message',
+            name='blobs',
+        ),
+    ]
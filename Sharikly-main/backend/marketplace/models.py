@@ -8,6 +8,15 @@ import random
 User = get_user_model()
 
 
+# Listing fields similar listings are computed from (see marketplace.similarity).
+SIMILARITY_FIELDS = ("title", "description", "category_id", "price_per_day")
+
+
+def empty_rating_histogram():
+    """Review counts per star value, index 0..5."""
+    return [0] * 6
+
+
 # ==========================
 # CATEGORY
 # ==========================
@@ -17,6 +26,8 @@ class Category(models.Model):
     icon = models.CharField(
         max_length=50, blank=True, null=True
     )  # For storing icon name or emoji
+    # Validator for conditional GETs of the category list (see conditional.py).
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name_plural = "Categories"
@@ -45,48 +56,200 @@ class Listing(models.Model):
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
     pickup_radius_m = models.IntegerField(default=300, validators=[MinValueValidator(100), MaxValueValidator(2000)])
+    # Geohash of the stored (jittered) coordinates, used for "near me" search (see marketplace.geo).
+    geohash = models.CharField(max_length=12, blank=True, default="", editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
+    # Last change to anything the listing detail shows from this listing's own
+    # data: the row itself, its images, reviews, review votes and favorites
+    # (touched by signals). Validator for conditional GETs (see conditional.py).
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Denormalized review aggregates, maintained by marketplace.ratings whenever a
+    # Review is saved or deleted. rating_avg is NULL while there are no reviews.
+    rating_avg = models.FloatField(null=True, blank=True, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_histogram = models.JSONField(default=empty_rating_histogram, editable=False)
+
+    # Relevance-ranking signals, maintained by marketplace.ranking: the number
+    # of favorites (kept exact by Favorite signals) and whether the owner
+    # currently qualifies as a Super Host (refreshed on review and payment writes
+    # and by ``python manage.py refresh_ranking_signals``).
+    favorites_count = models.PositiveIntegerField(default=0, editable=False)
+    owner_is_super_host = models.BooleanField(default=False, editable=False)
+
+    # Written only by those modules' UPDATEs. An ordinary save() of a loaded
+    # listing leaves them out, so it never writes back a stale copy.
+    DENORMALIZED_FIELDS = frozenset(
+        ["rating_avg", "rating_count", "rating_histogram", "favorites_count", "owner_is_super_host"]
+    )
 
     class Meta:
         indexes = [
             models.Index(fields=["owner", "created_at"]),
             models.Index(fields=["is_active", "created_at"]),
             models.Index(fields=["is_active", "price_per_day"]),
+            models.Index(fields=["is_active", "rating_avg"]),
+            # Pattern ops so "near me" prefix scans (geohash LIKE 'p%') can use
+            # the index whatever the database collation (see marketplace.geo).
+            models.Index(
+                fields=["is_active", "geohash"],
+                name="listing_active_geohash_prefix",
+                opclasses=["bool_ops", "varchar_pattern_ops"],
+            ),
         ]
 
     def __str__(self):
         return self.title
 
-    def save(self, *args, **kwargs):
-        """Slightly randomize coordinates for privacy (±~150m)"""
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_coordinates()
+        instance._remember_similarity_fields()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_coordinates()
+        self._remember_similarity_fields()
+
+    def _remember_coordinates(self):
+        if not {"latitude", "longitude"} & self.get_deferred_fields():
+            self._stored_coordinates = (self.latitude, self.longitude)
+
+    def _remember_similarity_fields(self):
+        deferred = self.get_deferred_fields()
+        self._stored_similarity_fields = {
+            name: getattr(self, name) for name in SIMILARITY_FIELDS if name not in deferred
+        }
+
+    def similarity_fields_changed(self) -> bool:
+        """
+        Whether anything similar listings are computed from (title,
+        description, category, price) changed since the listing was loaded or
+        last saved. Unknown (never loaded) counts as changed.
+        """
+        stored = getattr(self, "_stored_similarity_fields", None)
+        if stored is None:
+            return True
+        deferred = self.get_deferred_fields()
+        for name in SIMILARITY_FIELDS:
+            if name in stored:
+                if getattr(self, name) != stored[name]:
+                    return True
+            elif name not in deferred:
+                # Deferred when loaded, assigned since.
+                return True
+        return False
+
+    def jitter_new_coordinates(self) -> bool:
+        """
+        Slightly randomize coordinates for privacy (±~150m) and recompute the
+        geohash, if they changed since they were loaded or saved. Returns
+        whether they did. Called by save(); bulk paths that skip save() call it
+        themselves.
+        """
+        from .geo import encode as geohash_encode
+
+        if {"latitude", "longitude"} & self.get_deferred_fields():
+            return False
+        coordinates = (self.latitude, self.longitude)
+        if coordinates == getattr(self, "_stored_coordinates", None):
+            return False
         if self.latitude is not None and self.longitude is not None:
             # ~150m randomization in degrees (~0.00135 degrees ≈ 150m at equator)
             self.latitude += random.uniform(-0.00135, 0.00135)
             self.longitude += random.uniform(-0.00135, 0.00135)
+            self.geohash = geohash_encode(self.latitude, self.longitude)
+        else:
+            self.geohash = ""
+        self._remember_coordinates()
+        return True
+
+    def save(self, *args, **kwargs):
+        """
+        Saving a loaded listing updates every column except the denormalized
+        ones (DENORMALIZED_FIELDS).
+
+        The jitter is applied once, when new coordinates are set; re-saving a
+        listing keeps the stored (already jittered) point so it doesn't drift
+        and its geohash stays stable.
+        """
+        if (
+            not self._state.adding
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.DENORMALIZED_FIELDS
+                and field.attname not in deferred
+            ]
+        if self.jitter_new_coordinates():
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None and {"latitude", "longitude"} & set(update_fields):
+                kwargs["update_fields"] = set(update_fields) | {"geohash"}
         super().save(*args, **kwargs)
+        self._remember_coordinates()
+        self._remember_similarity_fields()
 
     # Average rating helper (optional)
     @property
     def average_rating(self):
-        reviews = self.reviews.all()
-        if not reviews.exists():
+        if self.rating_avg is None:
             return 0
-        return round(sum(r.rating for r in reviews) / reviews.count(), 1)
+        return round(self.rating_avg, 1)
 
 
 class ListingImage(models.Model):
+    class ProcessingStatus(models.TextChoices):
+        PENDING = "PENDING", _("Pending")
+        PROCESSING = "PROCESSING", _("Processing")
+        READY = "READY", _("Ready")
+        FAILED = "FAILED", _("Failed")
+
     listing = models.ForeignKey(
         Listing, on_delete=models.CASCADE, related_name="images"
     )
     image = models.ImageField(upload_to="listing_images/")
+    # The deduplicated object ``image`` points at (see marketplace.blobs); null
+    # until the upload has been hashed.
+    blob = models.ForeignKey(
+        "MediaBlob",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="listing_images",
+    )
     position = models.PositiveIntegerField(
         default=0,
         help_text="Display order (0 = cover). Smaller numbers appear first.",
     )
 
+    # Derivatives, filled in by the image worker (see marketplace.images):
+    # {"thumb": {"width": .., "height": .., "webp": <name>, "jpeg": <name>}, ...}
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    variants = models.JSONField(default=dict, blank=True, editable=False)
+    processing_status = models.CharField(
+        max_length=16,
+        choices=ProcessingStatus.choices,
+        default=ProcessingStatus.PENDING,
+        editable=False,
+    )
+    processing_started_at = models.DateTimeField(null=True, blank=True, editable=False)
+    processing_attempts = models.PositiveSmallIntegerField(default=0, editable=False)
+
     class Meta:
         ordering = ["position", "id"]
+        indexes = [
+            # The worker's queue scan.
+            models.Index(fields=["processing_status", "id"]),
+        ]
 
     def __str__(self):
         return f"Image for {self.listing.title}"
@@ -131,6 +294,13 @@ class Booking(models.Model):
     owner_completion_notified = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Booking lists, newest first: "my bookings" and "requests for my listings".
+            models.Index(fields=["renter", "created_at"]),
+            models.Index(fields=["listing", "created_at"]),
+        ]
+
     def __str__(self):
         return f"Booking for {self.listing.title} by {self.renter.email}"
 
@@ -156,6 +326,70 @@ class AvailabilityBlock(models.Model):
         return f"Block for {self.listing.title}: {self.start_date} → {self.end_date}"
 
 
+class ListingOccupancy(models.Model):
+    """
+    Derived availability index: one row per date range a listing cannot be
+    booked, mirroring its PENDING/CONFIRMED bookings and its availability
+    blocks. Maintained by signals (see availability.py); never edit directly.
+    """
+
+    listing = models.ForeignKey(
+        Listing, on_delete=models.CASCADE, related_name="occupancy"
+    )
+    start_date = models.DateField()
+    end_date = models.DateField()
+    booking = models.OneToOneField(
+        Booking, on_delete=models.CASCADE, null=True, blank=True, related_name="occupancy"
+    )
+    block = models.OneToOneField(
+        AvailabilityBlock, on_delete=models.CASCADE, null=True, blank=True, related_name="occupancy"
+    )
+
+    class Meta:
+        indexes = [
+            # Per-listing calendar lookups.
+            models.Index(fields=["listing", "start_date", "end_date"]),
+            # Date-window search: ranges ending on/after the window start.
+            models.Index(fields=["end_date", "start_date", "listing"]),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(booking__isnull=False, block__isnull=True)
+                | models.Q(booking__isnull=True, block__isnull=False),
+                name="listing_occupancy_single_source",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.listing_id}: {self.start_date} → {self.end_date}"
+
+
+class SimilarListing(models.Model):
+    """
+    Precomputed content-based neighbors: the top-k most similar listings of
+    ``listing``, best first (``rank`` 0). Built by similarity.py
+    (``python manage.py build_similar_listings``); never edit directly.
+    """
+
+    listing = models.ForeignKey(
+        Listing, on_delete=models.CASCADE, related_name="neighbors"
+    )
+    neighbor = models.ForeignKey(
+        Listing, on_delete=models.CASCADE, related_name="neighbor_of"
+    )
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Also the index SimilarListingsView reads through.
+            models.UniqueConstraint(fields=["listing", "rank"], name="similar_listing_rank_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.listing_id} ~ {self.neighbor_id} ({self.score:.3f})"
+
+
 # ==========================
 # CHAT SYSTEM
 # ==========================
@@ -226,6 +460,9 @@ class Favorite(models.Model):
 
     class Meta:
         unique_together = ("user", "listing")
+        indexes = [
+            models.Index(fields=["user", "created_at"]),
+        ]
 
     def __str__(self):
         return f"{self.user.email} {self.listing.title}"
@@ -378,6 +615,9 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["user", "created_at"]),
+        ]
 
     def __str__(self):
         return f"{self.title} for {self.user.email}"
@@ -539,3 +779,65 @@ class SavedSearch(models.Model):
 
     def __str__(self):
         return self.label or f"Search #{self.pk} for {self.user.email}"
+
+
+# ==========================
+# DIRECT UPLOADS
+# ==========================
+class DirectUpload(models.Model):
+    """
+    An upload URL issued to a client, who sends the file straight to storage
+    (see marketplace.uploads). Attaching it to a listing or message consumes it.
+    """
+
+    class Kind(models.TextChoices):
+        LISTING_IMAGE = "listing_image", _("Listing image")
+        CHAT_IMAGE = "chat_image", _("Chat image")
+        CHAT_AUDIO = "chat_audio", _("Chat audio")
+        CHAT_FILE = "chat_file", _("Chat file")
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="direct_uploads")
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    # Storage name the client uploads to; becomes the FileField value on attach.
+    key = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveIntegerField()
+    # Set when the content is already stored: ``key`` is then that blob's name
+    # and there is nothing to upload.
+    blob = models.ForeignKey(
+        "MediaBlob", on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    consumed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Expired, never attached uploads are purged.
+            models.Index(fields=["consumed_at", "expires_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} upload {self.key} by {self.user_id}"
+
+
+# ==========================
+# MEDIA BLOBS
+# ==========================
+class MediaBlob(models.Model):
+    """
+    One stored object per distinct listing photo content. Listing images with
+    the same bytes point at the same blob; blobs nothing points at are
+    garbage-collected (see marketplace.blobs).
+    """
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped whenever an upload resolves to this blob, so the collector
+    # leaves alone a blob that is about to be referenced.
+    last_used_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.name
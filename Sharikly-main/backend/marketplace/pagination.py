@@ -0,0 +1,134 @@
+"""
+Pagination shared by the marketplace list endpoints.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CursorOrPageNumberPagination(PageNumberPagination):
+    """
+    Page-number pagination with an opt-in keyset ("cursor") mode.
+
+    ``?page=N`` behaves exactly as before. Sending ``?cursor=`` (empty for the
+    first page) switches to keyset pagination on the queryset's own ordering
+    plus the primary key as tie-breaker, e.g. ``-created_at, -id`` or
+    ``price_per_day, id``. There is no COUNT(*) and no OFFSET, so page 500
+    costs the same as page 1. Keyset responses look like::
+
+        {"next": <url|null>, "next_cursor": <token|null>, "previous": null, "results": [...]}
+
+    Only non-null, non-relational model fields can be keyed on; other orderings
+    (e.g. search relevance) return 400 in cursor mode.
+    """
+
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor."
+    unsupported_ordering_message = (
+        "Cursor pagination is not available for this ordering; use page instead."
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_mode = self.cursor_query_param in request.query_params
+        if not self.keyset_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        ordering, fields = self._keyset_ordering(queryset)
+        queryset = queryset.order_by(*ordering)
+
+        token = request.query_params.get(self.cursor_query_param) or ""
+        if token:
+            values = self._decode_cursor(token, ordering, fields)
+            queryset = queryset.filter(self._after(ordering, fields, values))
+
+        # One extra row tells us whether there is a next page.
+        rows = list(queryset[: page_size + 1])
+        self.next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_cursor = self._encode_cursor(rows[-1], ordering, fields)
+        return rows
+
+    def get_paginated_response(self, data):
+        if not getattr(self, "keyset_mode", False):
+            return super().get_paginated_response(data)
+        return Response(
+            {
+                "next": self._next_cursor_link(),
+                "next_cursor": self.next_cursor,
+                "previous": None,
+                "results": data,
+            }
+        )
+
+    # --- helpers ---
+
+    def _unsupported(self):
+        return ValidationError({self.cursor_query_param: self.unsupported_ordering_message})
+
+    def _keyset_ordering(self, queryset):
+        model = queryset.model
+        ordering = list(queryset.query.order_by or model._meta.ordering or [])
+        terms, fields = [], []
+        for term in ordering:
+            if not isinstance(term, str) or term == "?":
+                raise self._unsupported()
+            name = term.lstrip("-")
+            try:
+                field = model._meta.pk if name == "pk" else model._meta.get_field(name)
+            except FieldDoesNotExist:
+                raise self._unsupported()
+            if field.null or field.is_relation:
+                raise self._unsupported()
+            terms.append(term)
+            fields.append(field)
+            if field.primary_key:
+                # Already unique; later terms would never be reached.
+                return terms, fields
+        terms.append("-pk" if terms and terms[0].startswith("-") else "pk")
+        fields.append(model._meta.pk)
+        return terms, fields
+
+    @staticmethod
+    def _after(ordering, fields, values):
+        """(k1 > v1) OR (k1 = v1 AND k2 > v2) OR ... with per-key direction."""
+        condition = Q()
+        equal = {}
+        for term, field, value in zip(ordering, fields, values):
+            lookup = "lt" if term.startswith("-") else "gt"
+            condition |= Q(**equal, **{f"{field.attname}__{lookup}": value})
+            equal[field.attname] = value
+        return condition
+
+    @staticmethod
+    def _encode_cursor(obj, ordering, fields):
+        payload = {"o": ordering, "v": [field.value_to_string(obj) for field in fields]}
+        raw = json.dumps(payload, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def _decode_cursor(self, token, ordering, fields):
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+            payload = json.loads(raw)
+            # A cursor is only valid for the ordering that produced it.
+            if payload["o"] != ordering or len(payload["v"]) != len(fields):
+                raise ValueError
+            return [field.to_python(value) for field, value in zip(fields, payload["v"])]
+        except (binascii.Error, ValueError, TypeError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _next_cursor_link(self):
+        if not self.next_cursor:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
@@ -0,0 +1,108 @@
+"""
+Queryset builders that load everything a listing serializer needs up front,
+so serializing a page costs a fixed number of queries regardless of its size.
+"""
+from django.db.models import BooleanField, Count, Exists, OuterRef, Prefetch, Q, Value
+
+from .models import Favorite, Listing, ListingImage, Review, ReviewVote
+
+_USER_SUMMARY_FIELDS = ("id", "username", "first_name", "avatar")
+BOOKING_COMPACT_FIELDS = (
+    "id",
+    "start_date",
+    "end_date",
+    "total_price",
+    "status",
+    "payment_status",
+    "created_at",
+    *(f"renter__{name}" for name in _USER_SUMMARY_FIELDS),
+    "listing__id",
+    "listing__title",
+    "listing__city",
+    "listing__price_per_day",
+    *(f"listing__owner__{name}" for name in _USER_SUMMARY_FIELDS),
+)
+
+
+def _with_favorite_flag(qs, user):
+    """Annotate ``user_has_favorited`` for the requesting user (False for anonymous)."""
+    if user is not None and user.is_authenticated:
+        return qs.annotate(
+            user_has_favorited=Exists(
+                Favorite.objects.filter(user_id=user.pk, listing_id=OuterRef("pk"))
+            )
+        )
+    return qs.annotate(user_has_favorited=Value(False, output_field=BooleanField()))
+
+
+def with_cover_image(qs):
+    """Prefetch the first image of each listing as ``cover_images`` (0 or 1 items)."""
+    return qs.prefetch_related(
+        Prefetch(
+            "images",
+            queryset=ListingImage.objects.order_by("position", "id")[:1],
+            to_attr="cover_images",
+        )
+    )
+
+
+def listing_card_queryset(qs, user=None):
+    """
+    For ListingCardSerializer: owner and category joined, the cover image
+    prefetched as ``cover_images`` (at most one row per listing) and the
+    favorite flag annotated. 2 queries per page (+1 for the pagination count).
+    """
+    qs = with_cover_image(qs.select_related("owner", "category"))
+    return _with_favorite_flag(qs, user)
+
+
+def listing_detail_queryset(qs, user=None):
+    """
+    For ListingSerializer: owner and category joined; images and reviews (with
+    their authors, vote counts and the request user's vote) prefetched;
+    ``user_has_favorited`` annotated (``favorites_count`` is a column). Owner
+    and reviewer stats are loaded per page by ListingListSerializer.
+    """
+    reviews = Review.objects.select_related("user").annotate(
+        helpful_count=Count("votes", filter=Q(votes__vote_type=ReviewVote.VoteType.HELPFUL)),
+        not_helpful_count=Count(
+            "votes", filter=Q(votes__vote_type=ReviewVote.VoteType.NOT_HELPFUL)
+        ),
+    ).order_by(*Review._meta.ordering)  # Meta.ordering is dropped from GROUP BY queries
+    if user is not None and user.is_authenticated:
+        reviews = reviews.prefetch_related(
+            Prefetch(
+                "votes",
+                queryset=ReviewVote.objects.filter(user_id=user.pk),
+                to_attr="request_user_votes",
+            )
+        )
+    qs = (
+        qs.select_related("owner", "category")
+        .prefetch_related("images", Prefetch("reviews", queryset=reviews))
+    )
+    return _with_favorite_flag(qs, user)
+
+
+def booking_compact_queryset(qs):
+    """
+    For BookingCompactSerializer: renter, listing and its owner joined with
+    only the columns the row shows, cover images prefetched. 2 queries per
+    page (+1 for the pagination count).
+    """
+    return (
+        qs.select_related("renter", "listing__owner")
+        .only(*BOOKING_COMPACT_FIELDS)
+        .prefetch_related(
+            Prefetch(
+                "listing__images",
+                queryset=ListingImage.objects.order_by("position", "id")[:1],
+                to_attr="cover_images",
+            )
+        )
+    )
+
+
+def prefetch_listing_cards(user=None):
+    """Prefetch for models pointing at a listing (favorites, bookings) rendered as cards."""
+    return Prefetch("listing", queryset=listing_card_queryset(Listing.objects.all(), user))
@@ -0,0 +1,191 @@
+"""
+Relevance ranking for ``GET /listings/?order=relevance``.
+
+The score is one SQL expression over columns stored on the listing row, so
+ranking a result set adds no per-row queries and no joins:
+
+- text: full-text match rank (``search_rank``, only when searching),
+  saturated as ``rank / (rank + k)``;
+- rating: Bayesian average of ``rating_avg`` / ``rating_count`` (a single
+  5-star review does not beat fifty 4.8 ones), scaled to 0..1;
+- recency: step decay on ``created_at``;
+- favorites: ``favorites_count / (favorites_count + k)``;
+- super_host: 1 when ``owner_is_super_host`` (the "higher visibility in
+  search results" Super Host benefit).
+
+Each component lies in 0..1 and is multiplied by its weight; weights can be
+overridden with the ``LISTING_RELEVANCE_WEIGHTS`` setting, e.g.
+``{"text": 6, "super_host": 1}``.
+
+``favorites_count`` is recounted from Favorite signals. ``owner_is_super_host``
+is refreshed for the owner on review and paid-booking writes; response-rate
+changes (chat) are picked up by ``python manage.py refresh_ranking_signals``,
+which also recounts favorites.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import (
+    Case,
+    Count,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import listing_cache
+from . import search as listing_search
+from .models import Favorite, Listing
+
+DEFAULT_WEIGHTS = {
+    "text": 4.0,
+    "rating": 2.0,
+    "recency": 1.0,
+    "favorites": 1.0,
+    "super_host": 0.5,
+}
+# Bayesian prior: every listing starts with RATING_PRIOR_COUNT reviews of RATING_PRIOR_MEAN.
+RATING_PRIOR_MEAN = 3.0
+RATING_PRIOR_COUNT = 3
+# Favorites at which the favorites component reaches 0.5.
+FAVORITES_HALF_SATURATION = 10.0
+# (max age in days, score); older listings score 0.
+RECENCY_STEPS = ((7, 1.0), (30, 0.7), (90, 0.4), (365, 0.2))
+
+
+def weights() -> dict:
+    configured = getattr(settings, "LISTING_RELEVANCE_WEIGHTS", None) or {}
+    return {name: float(configured.get(name, default)) for name, default in DEFAULT_WEIGHTS.items()}
+
+
+def _float(value):
+    return Value(float(value), output_field=FloatField())
+
+
+def _text_component():
+    k = listing_search.rank_half_saturation()
+    rank = Case(When(search_rank__gt=0, then=F("search_rank")), default=_float(0))
+    return ExpressionWrapper(rank / (rank + _float(k)), output_field=FloatField())
+
+
+def _rating_component():
+    total = Coalesce(F("rating_avg"), _float(0)) * F("rating_count") + _float(
+        RATING_PRIOR_MEAN * RATING_PRIOR_COUNT
+    )
+    return ExpressionWrapper(
+        total / ((F("rating_count") + _float(RATING_PRIOR_COUNT)) * _float(5)),
+        output_field=FloatField(),
+    )
+
+
+def _recency_component(now):
+    return Case(
+        *[
+            When(created_at__gte=now - timedelta(days=days), then=_float(score))
+            for days, score in RECENCY_STEPS
+        ],
+        default=_float(0),
+        output_field=FloatField(),
+    )
+
+
+def _favorites_component():
+    return ExpressionWrapper(
+        F("favorites_count") / (F("favorites_count") + _float(FAVORITES_HALF_SATURATION)),
+        output_field=FloatField(),
+    )
+
+
+def _super_host_component():
+    return Case(When(owner_is_super_host=True, then=_float(1)), default=_float(0))
+
+
+def relevance_score(text=False, now=None):
+    """
+    The weighted score expression. ``text=True`` requires the queryset to be
+    annotated with ``search_rank`` (``search.filter_queryset(..., rank=True)``).
+    """
+    w = weights()
+    components = [
+        (w["rating"], _rating_component()),
+        (w["recency"], _recency_component(now or timezone.now())),
+        (w["favorites"], _favorites_component()),
+        (w["super_host"], _super_host_component()),
+    ]
+    if text:
+        components.append((w["text"], _text_component()))
+    score = _float(0)
+    for weight, component in components:
+        if weight:
+            score = score + _float(weight) * component
+    return ExpressionWrapper(score, output_field=FloatField())
+
+
+def order_by_relevance(qs, text=False):
+    return qs.annotate(relevance=relevance_score(text=text)).order_by("-relevance", "-created_at")
+
+
+# --- Signal maintenance ---
+
+def _favorites_subquery():
+    per_listing = (
+        Favorite.objects.filter(listing_id=OuterRef("pk"))
+        .order_by()
+        .values("listing_id")
+        .annotate(n=Count("id"))
+        .values("n")
+    )
+    return Coalesce(Subquery(per_listing, output_field=IntegerField()), 0)
+
+
+def refresh_favorites_count(listing_id) -> None:
+    """Recount one listing's favorites with a single UPDATE (no Listing.save())."""
+    Listing.objects.filter(pk=listing_id).update(
+        favorites_count=_favorites_subquery(), updated_at=timezone.now()
+    )
+
+
+def refresh_super_hosts(owner_ids=None) -> int:
+    """
+    Recompute ``owner_is_super_host`` for the listings of ``owner_ids`` (all
+    owners when None) using the same rules as the profile badge, in a fixed
+    number of grouped queries. Returns the number of qualifying owners.
+    """
+    from .serializers import prefetch_user_stats
+
+    User = get_user_model()
+    owners = User.objects.filter(listings__isnull=False).distinct()
+    if owner_ids is not None:
+        owners = owners.filter(pk__in=list(owner_ids))
+    owners = list(owners)
+    if not owners:
+        return 0
+    prefetch_user_stats(owners)
+    qualified = [owner.pk for owner in owners if owner._cached_is_super_host]
+    listings = Listing.objects.filter(owner_id__in=[owner.pk for owner in owners])
+    changed = listings.filter(owner_id__in=qualified).exclude(owner_is_super_host=True).update(
+        owner_is_super_host=True
+    )
+    changed += listings.exclude(owner_id__in=qualified).exclude(owner_is_super_host=False).update(
+        owner_is_super_host=False
+    )
+    if changed:
+        listing_cache.bump_version()
+    return len(qualified)
+
+
+def sync_all() -> dict:
+    """Recount every listing's favorites and refresh every owner's Super Host flag."""
+    # Only drifted rows are written, so updated_at (and ETags) of the rest stay put.
+    Listing.objects.annotate(actual=_favorites_subquery()).exclude(
+        favorites_count=F("actual")
+    ).update(favorites_count=_favorites_subquery(), updated_at=timezone.now())
+    return {"super_hosts": refresh_super_hosts()}
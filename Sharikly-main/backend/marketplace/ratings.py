@@ -0,0 +1,97 @@
+"""
+Denormalized review aggregates on Listing (rating_avg, rating_count, rating_histogram).
+
+Aggregates are recomputed from the Review table whenever a review is saved or
+deleted (see signals.py), so every write path — SubmitReviewView, ReviewViewSet,
+the admin, cascades — stays consistent. ``sync_all()`` re-derives everything in
+one grouped query; ``python manage.py sync_listing_ratings`` wraps it.
+"""
+from django.db import transaction
+from django.db.models import Avg, Count, Q
+from django.utils import timezone
+
+from .models import Listing, Review
+
+STAR_VALUES = range(6)  # 0–5 stars
+AGGREGATE_FIELDS = ["rating_avg", "rating_count", "rating_histogram"]
+
+
+def _aggregate_expressions():
+    expressions = {"count": Count("id"), "avg": Avg("rating")}
+    for stars in STAR_VALUES:
+        expressions[f"stars_{stars}"] = Count("id", filter=Q(rating=stars))
+    return expressions
+
+
+def _to_fields(row) -> dict:
+    count = row.get("count") or 0
+    return {
+        "rating_avg": float(row["avg"]) if count else None,
+        "rating_count": count,
+        "rating_histogram": [row.get(f"stars_{stars}") or 0 for stars in STAR_VALUES],
+    }
+
+
+def refresh_listing_rating(listing_id, listing=None) -> dict:
+    """
+    Recompute one listing's aggregates and write them with a single UPDATE
+    (no Listing.save(), so no coordinate jitter or search reindex).
+
+    The listing row is locked first so concurrent review writes serialize and
+    the last writer always sees every committed review. If ``listing`` is given,
+    the in-memory instance is updated too.
+    """
+    with transaction.atomic():
+        list(Listing.objects.select_for_update().filter(pk=listing_id).values_list("pk"))
+        fields = _to_fields(
+            Review.objects.filter(listing_id=listing_id).aggregate(**_aggregate_expressions())
+        )
+        Listing.objects.filter(pk=listing_id).update(**fields, updated_at=timezone.now())
+    if listing is not None:
+        for name, value in fields.items():
+            setattr(listing, name, value)
+    return fields
+
+
+def compute_all() -> dict:
+    """{listing_id: aggregates} for every listing that has reviews, in one grouped query."""
+    rows = (
+        Review.objects.order_by()
+        .values("listing_id")
+        .annotate(**_aggregate_expressions())
+    )
+    return {row["listing_id"]: _to_fields(row) for row in rows}
+
+
+def _differs(listing, fields) -> bool:
+    if listing.rating_count != fields["rating_count"]:
+        return True
+    if list(listing.rating_histogram or []) != fields["rating_histogram"]:
+        return True
+    current, expected = listing.rating_avg, fields["rating_avg"]
+    if current is None or expected is None:
+        return current is not expected
+    return abs(current - expected) > 1e-9
+
+
+def sync_all(dry_run: bool = False, batch_size: int = 500) -> list:
+    """
+    Compare stored aggregates against the Review table and fix any drift.
+
+    Returns the ids of listings whose stored values were wrong. With
+    ``dry_run=True`` nothing is written.
+    """
+    expected = compute_all()
+    drifted = []
+    now = timezone.now()
+    listings = Listing.objects.only("id", *AGGREGATE_FIELDS).order_by("pk")
+    for listing in listings.iterator(chunk_size=2000):
+        fields = expected.get(listing.pk) or _to_fields({})
+        if _differs(listing, fields):
+            for name, value in fields.items():
+                setattr(listing, name, value)
+            listing.updated_at = now
+            drifted.append(listing)
+    if drifted and not dry_run:
+        Listing.objects.bulk_update(drifted, AGGREGATE_FIELDS + ["updated_at"], batch_size=batch_size)
+    return [listing.pk for listing in drifted]
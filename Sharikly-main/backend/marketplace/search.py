@@ -0,0 +1,219 @@
+"""
+Full-text search for listings.
+
+The search document lives in a side table keyed by listing id, so the main
+``marketplace_listing`` table and the Listing model stay untouched:
+
+- PostgreSQL: ``marketplace_listing_search`` holds a weighted ``tsvector``
+  (title A, city B, description C) behind a GIN index.
+- SQLite: ``marketplace_listing_fts`` is an FTS5 virtual table whose rowid is
+  the listing id.
+
+Documents are refreshed from the Listing post_save/post_delete signals (see
+``signals.py``). ``rebuild_index()`` backfills everything or a set of ids, e.g.
+after ``bulk_create``; ``python manage.py rebuild_search_index`` wraps it.
+
+Other database vendors fall back to the old ``icontains`` scan.
+"""
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+PG_TABLE = "marketplace_listing_search"
+FTS_TABLE = "marketplace_listing_fts"
+# "simple" = no stemming/stop words; listings are a mix of Arabic and English.
+PG_CONFIG = "simple"
+# Keep pathological queries cheap: only the first few terms are used.
+MAX_TERMS = 8
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_PG_DOCUMENT_SQL = (
+    f"setweight(to_tsvector('{PG_CONFIG}', coalesce(%s, '')), 'A') || "
+    f"setweight(to_tsvector('{PG_CONFIG}', coalesce(%s, '')), 'B') || "
+    f"setweight(to_tsvector('{PG_CONFIG}', coalesce(%s, '')), 'C')"
+)
+_PG_DOCUMENT_FROM_ROW_SQL = (
+    f"setweight(to_tsvector('{PG_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{PG_CONFIG}', coalesce(city, '')), 'B') || "
+    f"setweight(to_tsvector('{PG_CONFIG}', coalesce(description, '')), 'C')"
+)
+
+
+def is_supported(conn=None) -> bool:
+    conn = conn or connection
+    return conn.vendor in ("postgresql", "sqlite")
+
+
+def query_terms(query: str) -> list:
+    """Lowercased word tokens of ``query`` (Arabic and Latin), capped at MAX_TERMS."""
+    return _TOKEN_RE.findall((query or "").lower())[:MAX_TERMS]
+
+
+def _pg_tsquery(terms) -> str:
+    # Every term is a prefix match: "cam" matches "camera".
+    return " & ".join(f"'{t}':*" for t in terms)
+
+
+def _fts5_query(terms) -> str:
+    return " ".join(f'"{t}"*' for t in terms)
+
+
+def _icontains_filter(qs, query):
+    return qs.filter(
+        Q(title__icontains=query)
+        | Q(description__icontains=query)
+        | Q(city__icontains=query)
+    )
+
+
+def filter_queryset(qs, query: str, rank: bool = True):
+    """
+    Restrict a Listing queryset to rows matching ``query``.
+
+    With ``rank=True`` the rows are annotated with ``search_rank`` (higher is
+    better, never negative) so callers can ``order_by("-search_rank")`` or use
+    it in expressions. The fallback path annotates a constant rank so the
+    ordering works on every backend.
+    """
+    terms = query_terms(query)
+    vendor = connection.vendor
+    if not terms or not is_supported():
+        qs = _icontains_filter(qs, query)
+        if rank:
+            qs = qs.annotate(search_rank=Value(0.0, output_field=FloatField()))
+        return qs
+
+    # The search table is joined (not probed per row) so the full-text index
+    # drives the query and the rank is computed once per matching row.
+    # The rank is a RawSQL annotation (not an extra select) so it can take part
+    # in expressions such as the relevance score in ranking.py.
+    if vendor == "postgresql":
+        tsquery = _pg_tsquery(terms)
+        qs = qs.extra(
+            tables=[PG_TABLE],
+            where=[
+                f"{PG_TABLE}.listing_id = marketplace_listing.id",
+                f"{PG_TABLE}.document @@ to_tsquery('{PG_CONFIG}', %s)",
+            ],
+            params=[tsquery],
+        )
+        if rank:
+            qs = qs.annotate(
+                search_rank=RawSQL(
+                    f"ts_rank({PG_TABLE}.document, to_tsquery('{PG_CONFIG}', %s))",
+                    [tsquery],
+                    output_field=FloatField(),
+                )
+            )
+        return qs
+
+    match = _fts5_query(terms)
+    qs = qs.extra(
+        tables=[FTS_TABLE],
+        where=[
+            f"{FTS_TABLE}.rowid = marketplace_listing.id",
+            f"{FTS_TABLE} MATCH %s",
+        ],
+        params=[match],
+    )
+    if rank:
+        # bm25() is "lower is better" (and negative); negate it so both backends
+        # sort descending. Column weights follow the declaration order: title,
+        # city, description.
+        qs = qs.annotate(
+            search_rank=RawSQL(f"-bm25({FTS_TABLE}, 10.0, 5.0, 1.0)", [], output_field=FloatField())
+        )
+    return qs
+
+
+# Rank at which the text component of the relevance score reaches 0.5
+# (score = rank / (rank + k)); ts_rank and bm25 live on different scales.
+RANK_HALF_SATURATION = {"postgresql": 0.1, "sqlite": 5.0}
+
+
+def rank_half_saturation() -> float:
+    return RANK_HALF_SATURATION.get(connection.vendor, 1.0)
+
+
+# --- Index maintenance ---
+
+def index_listing(listing) -> None:
+    """Insert or refresh the search document for one listing."""
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                f"INSERT INTO {PG_TABLE} (listing_id, document) "
+                f"VALUES (%s, {_PG_DOCUMENT_SQL}) "
+                "ON CONFLICT (listing_id) DO UPDATE SET document = EXCLUDED.document",
+                [listing.pk, listing.title, listing.city, listing.description],
+            )
+        else:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [listing.pk])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, city, description) "
+                "VALUES (%s, %s, %s, %s)",
+                [listing.pk, listing.title or "", listing.city or "", listing.description or ""],
+            )
+
+
+def remove_listing(listing_id) -> None:
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(f"DELETE FROM {PG_TABLE} WHERE listing_id = %s", [listing_id])
+        else:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [listing_id])
+
+
+def rebuild_index(listing_ids=None) -> None:
+    """
+    Rebuild search documents from ``marketplace_listing`` in one statement.
+
+    ``listing_ids=None`` rebuilds everything; otherwise only the given ids
+    (used by bulk paths that bypass model signals).
+    """
+    if not is_supported():
+        return
+    if listing_ids is not None:
+        listing_ids = list(listing_ids)
+        if not listing_ids:
+            return
+    with connection.cursor() as cursor:
+        if listing_ids is None:
+            where, params = "", []
+        else:
+            placeholders = ", ".join(["%s"] * len(listing_ids))
+            where, params = f" WHERE id IN ({placeholders})", listing_ids
+        if connection.vendor == "postgresql":
+            if listing_ids is None:
+                cursor.execute(f"TRUNCATE {PG_TABLE}")
+            else:
+                cursor.execute(
+                    f"DELETE FROM {PG_TABLE} WHERE listing_id IN ({placeholders})",
+                    params,
+                )
+            cursor.execute(
+                f"INSERT INTO {PG_TABLE} (listing_id, document) "
+                f"SELECT id, {_PG_DOCUMENT_FROM_ROW_SQL} FROM marketplace_listing{where}",
+                params,
+            )
+        else:
+            if listing_ids is None:
+                cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            else:
+                cursor.execute(
+                    f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})",
+                    params,
+                )
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, city, description) "
+                "SELECT id, coalesce(title, ''), coalesce(city, ''), coalesce(description, '') "
+                f"FROM marketplace_listing{where}",
+                params,
+            )
@@ -4,39 +4,32 @@ from django.db.models import Avg
 from django.utils import timezone
 from datetime import timedelta
 from .models import *
+from . import images as listing_images
 
 User = get_user_model()
 
 
-def _compute_user_response_stats(user: User):
+def _response_stats_from_threads(user_id, threads):
     """
-    Compute simple chat-based response statistics for a lender.
+    Chat-based response statistics for a lender.
 
-    We look at each chat room the user participates in and measure how often
-    they reply to the first inbound message from the other participant, and
-    how long that first reply typically takes.
+    ``threads`` holds, per chat room the user participates in, that room's
+    messages as ``(sender_id, created_at)`` pairs in chronological order. We
+    measure how often the user replies to the first inbound message from the
+    other participant, and how long that first reply typically takes.
     """
-    from .models import ChatRoom, Message  # Local import to avoid circulars
-
-    rooms = (
-        ChatRoom.objects.filter(participants=user)
-        .prefetch_related("participants", "messages__sender")
-        .all()
-    )
-
     total_threads = 0
     responded_threads = 0
     response_minutes: list[float] = []
 
-    for room in rooms:
-        messages = list(room.messages.all().order_by("created_at"))
+    for messages in threads:
         if not messages:
             continue
 
         # Find the first message from someone other than the user
         first_inbound = None
         for idx, msg in enumerate(messages):
-            if msg.sender_id != user.id:
+            if msg[0] != user_id:
                 first_inbound = (idx, msg)
                 break
 
@@ -49,13 +42,13 @@ def _compute_user_response_stats(user: User):
         # Find the user's first reply after that inbound message
         reply = None
         for msg in messages[start_idx + 1 :]:
-            if msg.sender_id == user.id:
+            if msg[0] == user_id:
                 reply = msg
                 break
 
         if reply:
             responded_threads += 1
-            delta = reply.created_at - inbound_msg.created_at
+            delta = reply[1] - inbound_msg[1]
             minutes = max(0.0, delta.total_seconds() / 60.0)
             response_minutes.append(minutes)
 
@@ -77,6 +70,47 @@ def _compute_user_response_stats(user: User):
     return {"response_rate": rate, "typical_minutes": round(typical)}
 
 
+def _chat_threads(user_ids):
+    """{user_id: [messages of each room they are in]} in two queries."""
+    from collections import defaultdict
+    from .models import ChatRoom, Message  # Local import to avoid circulars
+
+    memberships = ChatRoom.participants.through.objects.filter(
+        user_id__in=user_ids
+    ).values_list("chatroom_id", "user_id")
+    rooms_by_user = defaultdict(list)
+    for room_id, user_id in memberships:
+        rooms_by_user[user_id].append(room_id)
+    room_ids = {room_id for rooms in rooms_by_user.values() for room_id in rooms}
+    messages_by_room = defaultdict(list)
+    if room_ids:
+        rows = (
+            Message.objects.filter(room_id__in=room_ids)
+            .order_by("room_id", "created_at", "id")
+            .values_list("room_id", "sender_id", "created_at")
+        )
+        for room_id, sender_id, created_at in rows:
+            messages_by_room[room_id].append((sender_id, created_at))
+    return {
+        user_id: [messages_by_room[room_id] for room_id in rooms]
+        for user_id, rooms in rooms_by_user.items()
+    }
+
+
+def _compute_user_response_stats(user: User):
+    threads = _chat_threads([user.id]).get(user.id, [])
+    return _response_stats_from_threads(user.id, threads)
+
+
+def _is_super_host(rating, successful_rentals, response_rate) -> bool:
+    return bool(
+        rating >= 4.8
+        and successful_rentals > 20
+        and response_rate is not None
+        and response_rate >= 80
+    )
+
+
 def _compute_is_super_host(user: User) -> bool:
     cached = getattr(user, "_cached_is_super_host", None)
     if cached is not None:
@@ -92,16 +126,99 @@ def _compute_is_super_host(user: User) -> bool:
     response_stats = _compute_user_response_stats(user)
     response_rate = response_stats.get("response_rate")
 
-    is_super_host = bool(
-        rating >= 4.8
-        and successful_rentals > 20
-        and response_rate is not None
-        and response_rate >= 80
-    )
+    is_super_host = _is_super_host(rating, successful_rentals, response_rate)
     setattr(user, "_cached_is_super_host", is_super_host)
     return is_super_host
 
 
+def prefetch_user_stats(users) -> None:
+    """
+    Compute the stats UserSerializer / PublicUserSerializer expose for many users
+    in a fixed number of grouped queries and attach them to the instances
+    (``_cached_counts``, ``_cached_response_stats``, ``_cached_is_super_host``).
+    Users that already carry stats are skipped.
+    """
+    from decimal import Decimal
+    from django.db.models import Count, Sum
+
+    pending = {}
+    for user in users:
+        if user is not None and getattr(user, "_cached_counts", None) is None:
+            pending.setdefault(user.pk, []).append(user)
+    if not pending:
+        return
+    ids = list(pending)
+
+    def grouped(qs, key, **aggregates):
+        return {
+            row[key]: row
+            for row in qs.order_by().values(key).annotate(**aggregates)
+        }
+
+    listings = grouped(Listing.objects.filter(owner_id__in=ids), "owner_id", n=Count("id"))
+    rentals = grouped(
+        Booking.objects.filter(renter_id__in=ids, payment_status=Booking.PaymentStatus.PAID),
+        "renter_id",
+        n=Count("id"),
+    )
+    earnings = grouped(
+        Booking.objects.filter(
+            listing__owner_id__in=ids, payment_status=Booking.PaymentStatus.PAID
+        ),
+        "listing__owner_id",
+        n=Count("id"),
+        total=Sum("total_price"),
+    )
+    reviews = grouped(
+        Review.objects.filter(listing__owner_id__in=ids),
+        "listing__owner_id",
+        n=Count("id"),
+        avg=Avg("rating"),
+    )
+    saved = grouped(Favorite.objects.filter(user_id__in=ids), "user_id", n=Count("id"))
+    threads = _chat_threads(ids)
+
+    for user_id, instances in pending.items():
+        earned = earnings.get(user_id, {})
+        received = reviews.get(user_id, {})
+        counts = {
+            "listings_count": listings.get(user_id, {}).get("n", 0),
+            "bookings_count": rentals.get(user_id, {}).get("n", 0),
+            "total_earnings": float(earned.get("total") or Decimal("0.00")),
+            "reviews_count": received.get("n", 0),
+            "average_rating": round(received.get("avg") or 0, 1),
+            "saved_items_count": saved.get(user_id, {}).get("n", 0),
+        }
+        response_stats = _response_stats_from_threads(user_id, threads.get(user_id, []))
+        is_super_host = _is_super_host(
+            received.get("avg") or 0, earned.get("n", 0), response_stats.get("response_rate")
+        )
+        for user in instances:
+            user._cached_counts = counts
+            user._cached_response_stats = response_stats
+            user._cached_is_super_host = is_super_host
+
+
+def _cached_count(user, name):
+    counts = getattr(user, "_cached_counts", None)
+    return counts[name] if counts is not None else None
+
+
+class SparseFieldsetMixin:
+    """
+    Keep only the fields named in ``context["fields"]`` (set by list views from
+    ``?fields=id,title,...``). Dropped SerializerMethodFields and nested
+    serializers are never evaluated, so they cost no queries.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.context.get("fields")
+        if requested:
+            for name in set(self.fields) - set(requested):
+                self.fields.pop(name)
+
+
 # ==========================
 # USER SERIALIZER
 # ==========================
@@ -165,13 +282,22 @@ class UserSerializer(serializers.ModelSerializer):
         return _compute_is_super_host(obj)
 
     def get_listings_count(self, obj):
+        cached = _cached_count(obj, "listings_count")
+        if cached is not None:
+            return cached
         return obj.listings.count()
 
     def get_bookings_count(self, obj):
+        cached = _cached_count(obj, "bookings_count")
+        if cached is not None:
+            return cached
         from .models import Booking
         return Booking.objects.filter(renter=obj, payment_status=Booking.PaymentStatus.PAID).count()
 
     def get_total_earnings(self, obj):
+        cached = _cached_count(obj, "total_earnings")
+        if cached is not None:
+            return cached
         from django.db.models import Sum
         from django.db.models.functions import Coalesce
         from decimal import Decimal
@@ -183,10 +309,16 @@ class UserSerializer(serializers.ModelSerializer):
         return float(result['total'])
 
     def get_reviews_count(self, obj):
+        cached = _cached_count(obj, "reviews_count")
+        if cached is not None:
+            return cached
         from .models import Review
         return Review.objects.filter(listing__owner=obj).count()
 
     def get_saved_items_count(self, obj):
+        cached = _cached_count(obj, "saved_items_count")
+        if cached is not None:
+            return cached
         from .models import Favorite
         return Favorite.objects.filter(user=obj).count()
 
@@ -216,10 +348,16 @@ class PublicUserSerializer(serializers.ModelSerializer):
         ]
 
     def get_listings_count(self, obj):
+        cached = _cached_count(obj, "listings_count")
+        if cached is not None:
+            return cached
         return obj.listings.count() if hasattr(obj, "listings") else 0
 
     def get_average_rating(self, obj):
         from django.db.models import Avg
+        cached = _cached_count(obj, "average_rating")
+        if cached is not None:
+            return cached
         if not hasattr(obj, "listings"):
             return 0
         result = obj.listings.aggregate(avg=Avg("reviews__rating"))
@@ -245,13 +383,39 @@ class PublicUserSerializer(serializers.ModelSerializer):
         return _compute_is_super_host(obj)
 
 
+class UserSummarySerializer(serializers.ModelSerializer):
+    """Public identity only, no computed stats — for compact list payloads."""
+
+    class Meta:
+        model = User
+        fields = ["id", "username", "first_name", "avatar"]
+
+
 # ==========================
 # LISTING IMAGES
 # ==========================
 class ListingImageSerializer(serializers.ModelSerializer):
+    """
+    ``image`` is the original upload. Once the image worker has processed it,
+    ``srcset`` / ``srcset_webp`` list the resized variants for ``<img srcset>``
+    / ``<source type="image/webp">``; until then they are empty strings.
+    """
+    srcset = serializers.SerializerMethodField()
+    srcset_webp = serializers.SerializerMethodField()
+
     class Meta:
         model = ListingImage
-        fields = ["id", "image", "position"]
+        fields = ["id", "image", "position", "width", "height", "srcset", "srcset_webp"]
+
+    def _build_url(self):
+        request = self.context.get("request")
+        return request.build_absolute_uri if request else None
+
+    def get_srcset(self, obj):
+        return listing_images.srcset(obj, "jpeg", self._build_url())
+
+    def get_srcset_webp(self, obj):
+        return listing_images.srcset(obj, "webp", self._build_url())
 
 
 # ==========================
@@ -307,12 +471,17 @@ class ReviewSerializer(serializers.ModelSerializer):
         ]
 
     def get_helpful(self, obj):
+        # Annotated by querysets.listing_detail_queryset.
+        if hasattr(obj, "helpful_count"):
+            return obj.helpful_count
         try:
             return obj.votes.filter(vote_type="HELPFUL").count()
         except Exception:
             return 0
 
     def get_not_helpful(self, obj):
+        if hasattr(obj, "not_helpful_count"):
+            return obj.not_helpful_count
         try:
             return obj.votes.filter(vote_type="NOT_HELPFUL").count()
         except Exception:
@@ -325,6 +494,9 @@ class ReviewSerializer(serializers.ModelSerializer):
             if not request or not request.user or not request.user.is_authenticated:
                 return None
 
+            prefetched = getattr(obj, "request_user_votes", None)
+            if prefetched is not None:
+                return prefetched[0].vote_type if prefetched else None
             vote = obj.votes.filter(user=request.user).first()
             return vote.vote_type if vote else None
         except Exception:
@@ -340,7 +512,27 @@ class ReviewSerializer(serializers.ModelSerializer):
 # ==========================
 # LISTING SERIALIZER (MAIN)
 # ==========================
-class ListingSerializer(serializers.ModelSerializer):
+def _listing_people(listings):
+    """Owners and (already prefetched) reviewers of ``listings``."""
+    people = []
+    for listing in listings:
+        people.append(listing.owner)
+        if "reviews" in getattr(listing, "_prefetched_objects_cache", {}):
+            people.extend(review.user for review in listing.reviews.all())
+    return people
+
+
+class ListingListSerializer(serializers.ListSerializer):
+    """Loads owner/reviewer stats for the whole page before serializing it."""
+
+    def to_representation(self, data):
+        listings = list(data.all() if hasattr(data, "all") else data)
+        if {"owner", "reviews"} & set(self.child.fields):
+            prefetch_user_stats(_listing_people(listings))
+        return super().to_representation(listings)
+
+
+class ListingSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     owner = UserSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
     category_id = serializers.IntegerField(write_only=True, required=False)
@@ -351,6 +543,7 @@ class ListingSerializer(serializers.ModelSerializer):
     reviews = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     favorites_count = serializers.SerializerMethodField()
+    distance_km = serializers.SerializerMethodField()
 
     class Meta:
         model = Listing
@@ -367,15 +560,25 @@ class ListingSerializer(serializers.ModelSerializer):
             "longitude",
             "pickup_radius_m",
             "created_at",
+            "updated_at",
             "category",
             "category_id",
             "images",
             # ⭐ NEW:
             "average_rating",
+            "rating_count",
+            "rating_histogram",
             "reviews",
             "is_favorited",
             "favorites_count",
+            "distance_km",
         ]
+        list_serializer_class = ListingListSerializer
+
+    def to_representation(self, instance):
+        if {"owner", "reviews"} & set(self.fields):
+            prefetch_user_stats(_listing_people([instance]))
+        return super().to_representation(instance)
 
     def create(self, validated_data):
         category_id = validated_data.pop("category_id", None)
@@ -403,6 +606,10 @@ class ListingSerializer(serializers.ModelSerializer):
         if not user or not user.is_authenticated:
             return False
 
+        # Annotated by querysets.listing_detail_queryset.
+        flag = getattr(obj, "user_has_favorited", None)
+        if flag is not None:
+            return bool(flag)
         try:
             is_fav = Favorite.objects.filter(user=user, listing=obj).exists()
             return is_fav
@@ -411,7 +618,13 @@ class ListingSerializer(serializers.ModelSerializer):
             return False
 
     def get_favorites_count(self, obj):
-        return obj.favorited_by.count()
+        # Denormalized on the listing row (see ranking.refresh_favorites_count).
+        return obj.favorites_count
+
+    def get_distance_km(self, obj):
+        """Only set on "near me" searches (?near=lat,lng)."""
+        distance = getattr(obj, "distance_km", None)
+        return round(distance, 2) if distance is not None else None
 
     def get_reviews(self, obj):
         """Serialize reviews with proper context"""
@@ -425,6 +638,170 @@ class ListingSerializer(serializers.ModelSerializer):
             return []
 
 
+# ==========================
+# LISTING CARD SERIALIZER (list pages)
+# ==========================
+class ListingCardSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Compact listing for list pages (``?view=card``): no reviews, no owner stats,
+    only the cover image. Expects a queryset from querysets.listing_card_queryset;
+    every field then reads preloaded data and no per-item queries are issued.
+    """
+
+    owner = UserSummarySerializer(read_only=True)
+    category = CategorySerializer(read_only=True)
+    cover_image = serializers.SerializerMethodField()
+    average_rating = serializers.FloatField(read_only=True)
+    is_favorited = serializers.SerializerMethodField()
+    distance_km = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Listing
+        fields = [
+            "id",
+            "owner",
+            "title",
+            "price_per_day",
+            "deposit",
+            "city",
+            "is_active",
+            "latitude",
+            "longitude",
+            "created_at",
+            "category",
+            "cover_image",
+            "average_rating",
+            "rating_count",
+            "is_favorited",
+            "distance_km",
+        ]
+        read_only_fields = fields
+
+    def get_cover_image(self, obj):
+        images = getattr(obj, "cover_images", None)
+        if images is None:
+            images = obj.images.all()[:1]
+        image = next(iter(images), None)
+        if not image or not image.image:
+            return None
+        url = listing_images.variant_url(image, "card") or image.image.url
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
+
+    def get_is_favorited(self, obj):
+        flag = getattr(obj, "user_has_favorited", None)
+        if flag is not None:
+            return bool(flag)
+        request = self.context.get("request")
+        if not request or not request.user.is_authenticated:
+            return False
+        return Favorite.objects.filter(user=request.user, listing=obj).exists()
+
+    def get_distance_km(self, obj):
+        distance = getattr(obj, "distance_km", None)
+        return round(distance, 2) if distance is not None else None
+
+
+# ==========================
+# LISTING IMPORT ROW (bulk import)
+# ==========================
+class ListingImportRowSerializer(serializers.ModelSerializer):
+    """
+    One manifest row of a bulk import (see marketplace.bulk_import). Only
+    validates: listings are created in bulk, not through ``save()``.
+    ``category`` is a category id or name; ``images`` are archive member paths.
+    """
+
+    category = serializers.CharField(required=False, allow_blank=True)
+    # Like the regular create path, a listing needs at least one photo.
+    images = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        min_length=1,
+        max_length=20,
+        error_messages={"required": "At least one image is required"},
+    )
+    is_active = serializers.BooleanField(required=False, default=True)
+
+    class Meta:
+        model = Listing
+        fields = [
+            "title",
+            "description",
+            "price_per_day",
+            "deposit",
+            "city",
+            "is_active",
+            "latitude",
+            "longitude",
+            "pickup_radius_m",
+            "category",
+            "images",
+        ]
+
+    def validate_category(self, value):
+        value = value.strip()
+        if not value:
+            return None
+        categories = self.context["categories"]
+        category_id = categories.get(value.lower())
+        if category_id is None and value.isdigit() and int(value) in categories.values():
+            category_id = int(value)
+        if category_id is None:
+            raise serializers.ValidationError(f"Unknown category {value!r}.")
+        return category_id
+
+    def validate_images(self, value):
+        archive_names = self.context.get("archive_names")
+        missing = [name for name in value if archive_names is None or name not in archive_names]
+        if missing:
+            raise serializers.ValidationError(f"Not in the image archive: {missing}.")
+        return value
+
+    def validate(self, attrs):
+        if (attrs.get("latitude") is None) != (attrs.get("longitude") is None):
+            raise serializers.ValidationError("latitude and longitude go together.")
+        return attrs
+
+
+class ListingBulkFilterSerializer(serializers.Serializer):
+    """Which of the owner's listings a bulk update applies to; empty means all."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        allow_empty=False,
+        max_length=1000,
+    )
+    category = serializers.PrimaryKeyRelatedField(
+        queryset=Category.objects.all(), required=False, allow_null=True
+    )
+    is_active = serializers.BooleanField(required=False)
+
+
+class ListingBulkUpdateSerializer(serializers.Serializer):
+    """
+    A change applied to many listings of the owner (see marketplace.bulk_update):
+    a price change in percent or by an amount, ``is_active``, ``category``.
+    """
+
+    filter = ListingBulkFilterSerializer(required=False)
+    price_percent = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=-99, max_value=1000, required=False
+    )
+    price_amount = serializers.DecimalField(max_digits=8, decimal_places=2, required=False)
+    is_active = serializers.BooleanField(required=False)
+    category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), required=False)
+
+    def validate(self, attrs):
+        if "price_percent" in attrs and "price_amount" in attrs:
+            raise serializers.ValidationError("Give price_percent or price_amount, not both.")
+        if not {"price_percent", "price_amount", "is_active", "category"} & attrs.keys():
+            raise serializers.ValidationError(
+                "Nothing to change: give price_percent, price_amount, is_active or category."
+            )
+        return attrs
+
+
 # ==========================
 # FAVORITES SERIALIZER
 # ==========================
@@ -436,6 +813,10 @@ class FavoriteSerializer(serializers.ModelSerializer):
         fields = ["id", "listing", "created_at"]
 
 
+class FavoriteCardSerializer(FavoriteSerializer):
+    listing = ListingCardSerializer(read_only=True)
+
+
 # ==========================
 # BOOKING SERIALIZER
 # ==========================
@@ -458,6 +839,63 @@ class BookingSerializer(serializers.ModelSerializer):
         ]
 
 
+class BookingCardSerializer(BookingSerializer):
+    renter = UserSummarySerializer(read_only=True)
+    listing = ListingCardSerializer(read_only=True)
+
+
+class BookingListingSummarySerializer(serializers.ModelSerializer):
+    """The few listing fields a booking row shows; reads ``cover_images`` if prefetched."""
+
+    cover_image = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Listing
+        fields = ["id", "title", "city", "price_per_day", "cover_image"]
+        read_only_fields = fields
+
+    get_cover_image = ListingCardSerializer.get_cover_image
+
+
+class BookingCompactSerializer(serializers.ModelSerializer):
+    """
+    Booking list rows for ``?view=compact``: a listing summary and the other
+    party (the host for the renter, the renter for the host) as a public
+    identity. Expects querysets.booking_compact_queryset: no per-row queries.
+    """
+
+    role = serializers.SerializerMethodField()
+    listing = BookingListingSummarySerializer(read_only=True)
+    counterpart = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Booking
+        fields = [
+            "id",
+            "role",
+            "listing",
+            "counterpart",
+            "start_date",
+            "end_date",
+            "total_price",
+            "status",
+            "payment_status",
+            "created_at",
+        ]
+        read_only_fields = fields
+
+    def _is_renter(self, obj):
+        request = self.context.get("request")
+        return request is not None and obj.renter_id == request.user.id
+
+    def get_role(self, obj):
+        return "renter" if self._is_renter(obj) else "host"
+
+    def get_counterpart(self, obj):
+        other = obj.listing.owner if self._is_renter(obj) else obj.renter
+        return UserSummarySerializer(other, context=self.context).data
+
+
 class EarningsListingSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     title = serializers.CharField()
@@ -0,0 +1,217 @@
+"""
+Model signal handlers that keep derived marketplace data in sync.
+Connected in MarketplaceConfig.ready().
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import (
+    availability,
+    blocking,
+    listing_cache,
+    ranking,
+    ratings,
+    search,
+    similarity,
+    suggest,
+)
+from .models import (
+    AvailabilityBlock,
+    BlockedUser,
+    Booking,
+    Category,
+    ChatRoom,
+    Favorite,
+    Listing,
+    ListingImage,
+    Message,
+    Review,
+    ReviewVote,
+    User,
+)
+
+
+@receiver(post_save, sender=Listing)
+def listing_saved(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_listing(instance)
+    suggest.record_listing_change(instance.pk)
+    if created or instance.similarity_fields_changed():
+        similarity.schedule_refresh([instance.pk])
+
+
+@receiver(post_delete, sender=Listing)
+def listing_deleted(sender, instance, **kwargs):
+    search.remove_listing(instance.pk)
+    suggest.record_listing_change(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    suggest.record_category_change(instance.pk)
+
+
+@receiver(post_save, sender=ListingImage)
+@receiver(post_delete, sender=ListingImage)
+def listing_image_changed(sender, instance, raw=False, **kwargs):
+    # Images are part of the listing detail; move its Last-Modified/ETag.
+    if raw:
+        return
+    Listing.objects.filter(pk=instance.listing_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=ReviewVote)
+@receiver(post_delete, sender=ReviewVote)
+def review_vote_changed(sender, instance, raw=False, **kwargs):
+    # Vote counts are shown with the reviews in the listing detail.
+    if raw:
+        return
+    Listing.objects.filter(reviews__id=instance.review_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Refresh the cached listing too, so callers holding it see the new aggregates.
+    listing = instance.listing if Review.listing.is_cached(instance) else None
+    ratings.refresh_listing_rating(instance.listing_id, listing=listing)
+
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    availability.sync_booking(instance)
+
+
+@receiver(post_save, sender=BlockedUser)
+@receiver(post_delete, sender=BlockedUser)
+def block_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    blocking.invalidate(instance.blocker_id, instance.blocked_id)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def favorite_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    ranking.refresh_favorites_count(instance.listing_id)
+
+
+def _refresh_owner_super_host(listing_id):
+    owner_id = Listing.objects.filter(pk=listing_id).values_list("owner_id", flat=True).first()
+    if owner_id is not None:
+        ranking.refresh_super_hosts([owner_id])
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_changed_super_host(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    listing_id = instance.listing_id
+    transaction.on_commit(lambda: _refresh_owner_super_host(listing_id))
+
+
+@receiver(post_save, sender=Booking)
+def booking_paid(sender, instance, raw=False, **kwargs):
+    # Paid rentals count towards Super Host; refresh once the payment commits.
+    if raw or instance.payment_status != Booking.PaymentStatus.PAID:
+        return
+    listing_id = instance.listing_id
+    transaction.on_commit(lambda: _refresh_owner_super_host(listing_id))
+
+
+@receiver(post_save, sender=AvailabilityBlock)
+def availability_block_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    availability.sync_block(instance)
+
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+@receiver(post_save, sender=ListingImage)
+@receiver(post_delete, sender=ListingImage)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+@receiver(post_save, sender=AvailabilityBlock)
+@receiver(post_delete, sender=AvailabilityBlock)
+def listing_pages_changed(sender, raw=False, **kwargs):
+    # Bookings and blocks change the available_from/available_to results.
+    if raw:
+        return
+    listing_cache.bump_version()
+
+
+def _touch_profiles(users) -> None:
+    """Move ``profile_updated_at`` of the users matching ``users`` (a Q)."""
+    User.objects.filter(users).update(profile_updated_at=timezone.now())
+
+
+# Profile stats (UserSerializer) embedded in listing and blog detail pages:
+# keep the embedding pages' conditional GET validators moving.
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def listing_count_changed(sender, instance, created=False, raw=False, signal=None, **kwargs):
+    if raw or (signal is post_save and not created):
+        return
+    _touch_profiles(Q(pk=instance.owner_id))
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def booking_profiles_changed(sender, instance, raw=False, **kwargs):
+    # Rentals (renter) and earnings / Super Host (owner).
+    if raw:
+        return
+    _touch_profiles(Q(pk=instance.renter_id) | Q(listings=instance.listing_id))
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_profiles_changed(sender, instance, raw=False, **kwargs):
+    # Reviews received and the rating behind Super Host.
+    if raw:
+        return
+    _touch_profiles(Q(listings=instance.listing_id))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def favorite_profile_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _touch_profiles(Q(pk=instance.user_id))
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def message_profiles_changed(sender, instance, raw=False, **kwargs):
+    # Response rate and time of everyone in the room.
+    if raw:
+        return
+    _touch_profiles(Q(chat_rooms=instance.room_id))
+
+
+@receiver(m2m_changed, sender=ChatRoom.participants.through)
+def room_participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("post_add", "post_remove"):
+        _touch_profiles(Q(pk=instance.pk) if reverse else Q(pk__in=pk_set))
+    elif action == "pre_clear":
+        _touch_profiles(Q(chat_rooms=instance) if not reverse else Q(pk=instance.pk))
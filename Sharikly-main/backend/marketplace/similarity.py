@@ -0,0 +1,239 @@
+"""
+Content-based "similar listings", computed offline into the SimilarListing
+table so ``GET /listings/<pk>/similar/`` is a single indexed lookup.
+
+Each active listing becomes a sparse TF-IDF vector over hashed features:
+title words (weighted up), description words, its category and a price
+band, so neighbors share vocabulary first and category and price range
+second. Text is folded with ``suggest.normalize`` (case, accents, Arabic
+letter variants). Vectors are L2-normalized, so a dot product is the cosine
+similarity.
+
+Neighbors come from an inverted index: posting lists are capped at
+MAX_POSTINGS entries (the highest weights), candidates are scored by the
+partial dot products of a listing's QUERY_FEATURES strongest features over
+those lists, and the best RESCORE candidates are then re-scored exactly.
+Everything is pure Python on dicts (NumPy is not a dependency); the build
+is roughly linear in the number of listings.
+
+Freshness: creating a listing, or changing its title, description,
+category or price, schedules ``refresh()`` for it once the transaction
+commits (``schedule_refresh``; see ``signals.py``). It computes the
+listing's neighbors and inserts it into the lists of the listings it now
+resembles. Other edits (availability, location, ``is_active``) leave the
+rows alone. Until the refresh lands, an edited listing keeps its previous
+neighbors. Lists that merely lose an edited listing are corrected by the
+next full build. ``python manage.py build_similar_listings`` rebuilds
+everything (nightly); ``--incremental`` picks up listings that still have
+no rows, such as those whose refresh failed (every few minutes).
+"""
+import heapq
+import logging
+import math
+import zlib
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import SIMILARITY_FIELDS, Listing, SimilarListing
+from .suggest import normalize
+
+logger = logging.getLogger(__name__)
+
+TOP_K = 20
+N_FEATURES = 1 << 20
+MAX_POSTINGS = 100
+# Only a listing's strongest features are used to find candidates.
+QUERY_FEATURES = 12
+# Candidates re-scored exactly per listing.
+RESCORE = 60
+MIN_SCORE = 0.05
+BATCH_SIZE = 500
+
+TITLE_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+CATEGORY_WEIGHT = 2.0
+PRICE_WEIGHT = 1.0
+MIN_TOKEN_LENGTH = 2
+# Only the start of long descriptions carries the gist.
+MAX_DESCRIPTION_TOKENS = 200
+
+_FIELDS = ("id", *SIMILARITY_FIELDS)
+
+
+def _feature(name: str) -> int:
+    # crc32, not hash(): features must be stable across processes and runs.
+    return zlib.crc32(name.encode()) % N_FEATURES
+
+
+def _price_band(price) -> int:
+    # Bands of a factor of ~1.5: 10 and 14 share one, 10 and 40 do not.
+    return int(math.log(max(float(price or 0), 1.0), 1.5))
+
+
+def term_frequencies(title, description, category_id, price) -> dict:
+    """Weighted, sublinear term frequencies of one listing, keyed by hashed feature."""
+    counts = defaultdict(float)
+    for text, weight, limit in (
+        (title, TITLE_WEIGHT, None),
+        (description, DESCRIPTION_WEIGHT, MAX_DESCRIPTION_TOKENS),
+    ):
+        tokens = [t for t in normalize(text or "").split() if len(t) >= MIN_TOKEN_LENGTH]
+        per_token = defaultdict(int)
+        for token in tokens[:limit]:
+            per_token[token] += 1
+        for token, n in per_token.items():
+            counts[_feature(token)] += weight * (1.0 + math.log(n))
+    if category_id is not None:
+        counts[_feature(f"\x00category:{category_id}")] += CATEGORY_WEIGHT
+    counts[_feature(f"\x00price:{_price_band(price)}")] += PRICE_WEIGHT
+    return counts
+
+
+class Corpus:
+    """TF-IDF vectors and a capped inverted index over active listings."""
+
+    def __init__(self, rows):
+        frequencies = {
+            pk: term_frequencies(title, description, category_id, price)
+            for pk, title, description, category_id, price in rows
+        }
+        document_frequency = defaultdict(int)
+        for tf in frequencies.values():
+            for feature in tf:
+                document_frequency[feature] += 1
+        n = len(frequencies)
+        idf = {f: math.log((1 + n) / (1 + df)) + 1.0 for f, df in document_frequency.items()}
+
+        self.vectors = {}
+        postings = defaultdict(list)
+        for pk, tf in frequencies.items():
+            vector = {f: w * idf[f] for f, w in tf.items()}
+            norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+            vector = {f: w / norm for f, w in vector.items()}
+            self.vectors[pk] = vector
+            for f, w in vector.items():
+                postings[f].append((w, pk))
+        self.postings = {
+            f: heapq.nlargest(MAX_POSTINGS, entries) if len(entries) > MAX_POSTINGS else entries
+            for f, entries in postings.items()
+        }
+
+    @classmethod
+    def load(cls):
+        rows = Listing.objects.filter(is_active=True).values_list(*_FIELDS)
+        return cls(rows.iterator(chunk_size=5000))
+
+    def similarity(self, a, b) -> float:
+        va, vb = self.vectors[a], self.vectors[b]
+        if len(vb) < len(va):
+            va, vb = vb, va
+        return sum(w * vb.get(f, 0.0) for f, w in va.items())
+
+    def neighbors(self, pk, k=TOP_K) -> list:
+        """[(score, neighbor_pk)] best first, at most ``k``."""
+        vector = self.vectors.get(pk)
+        if not vector:
+            return []
+        partial = defaultdict(float)
+        strongest = heapq.nlargest(QUERY_FEATURES, vector.items(), key=lambda item: item[1])
+        for f, w in strongest:
+            for other_w, other in self.postings.get(f, ()):
+                partial[other] += w * other_w
+        partial.pop(pk, None)
+        candidates = heapq.nlargest(RESCORE, partial, key=partial.get)
+        scored = ((self.similarity(pk, other), other) for other in candidates)
+        return heapq.nlargest(k, (item for item in scored if item[0] >= MIN_SCORE))
+
+
+def _write(lists: dict) -> None:
+    """Replace the neighbor rows of every listing in ``lists`` ({pk: [(score, pk)]})."""
+    with transaction.atomic():
+        SimilarListing.objects.filter(listing_id__in=list(lists)).delete()
+        SimilarListing.objects.bulk_create(
+            SimilarListing(listing_id=pk, neighbor_id=other, rank=rank, score=score)
+            for pk, neighbors in lists.items()
+            for rank, (score, other) in enumerate(neighbors)
+        )
+
+
+def rebuild(corpus=None, k=TOP_K) -> dict:
+    """Recompute every active listing's neighbors, writing in batches."""
+    corpus = corpus or Corpus.load()
+    # Inactive listings keep no rows (they are never shown).
+    SimilarListing.objects.exclude(listing_id__in=list(corpus.vectors)).delete()
+    batch, rows = {}, 0
+    for pk in corpus.vectors:
+        batch[pk] = corpus.neighbors(pk, k)
+        rows += len(batch[pk])
+        if len(batch) >= BATCH_SIZE:
+            _write(batch)
+            batch = {}
+    if batch:
+        _write(batch)
+    return {"listings": len(corpus.vectors), "rows": rows}
+
+
+def refresh(listing_ids=None, corpus=None, k=TOP_K) -> dict:
+    """
+    Compute neighbors for ``listing_ids`` (default: active listings without
+    rows, e.g. reactivated or whose scheduled refresh failed) and insert each of them into
+    the stored lists of its neighbors where it now ranks in their top k.
+    Similarity is symmetric, so only those neighbors' lists can gain them.
+    """
+    corpus = corpus or Corpus.load()
+    if listing_ids is None:
+        have_rows = set(SimilarListing.objects.values_list("listing_id", flat=True).distinct())
+        listing_ids = [pk for pk in corpus.vectors if pk not in have_rows]
+    dirty = {pk: corpus.neighbors(pk, k) for pk in listing_ids if pk in corpus.vectors}
+    if not dirty:
+        return {"listings": 0, "updated": 0}
+
+    # Reverse updates: merge each dirty listing into its neighbors' lists.
+    incoming = defaultdict(list)
+    for pk, neighbors in dirty.items():
+        for score, other in neighbors:
+            if other not in dirty:
+                incoming[other].append((score, pk))
+    updated = {}
+    if incoming:
+        stored = defaultdict(list)
+        for listing_id, neighbor_id, score in SimilarListing.objects.filter(
+            listing_id__in=list(incoming)
+        ).values_list("listing_id", "neighbor_id", "score"):
+            stored[listing_id].append((score, neighbor_id))
+        for other, additions in incoming.items():
+            if not stored[other]:
+                # Not built yet; it gets its full list when it is refreshed itself.
+                continue
+            new_ids = {pk for _, pk in additions}
+            current = [item for item in stored[other] if item[1] not in new_ids]
+            merged = heapq.nlargest(k, current + additions)
+            if merged != sorted(stored[other], reverse=True):
+                updated[other] = merged
+
+    lists = {**updated, **dirty}
+    items = list(lists.items())
+    for start in range(0, len(items), BATCH_SIZE):
+        _write(dict(items[start:start + BATCH_SIZE]))
+    return {"listings": len(dirty), "updated": len(updated)}
+
+
+def _refresh_after_commit(listing_ids) -> None:
+    try:
+        refresh(listing_ids)
+    except Exception:
+        # The write itself has committed; the next full build catches up.
+        logger.exception("Refreshing similar listings of %s failed", listing_ids)
+
+
+def schedule_refresh(listing_ids) -> None:
+    """``refresh(listing_ids)`` once the current transaction commits (at once outside one)."""
+    listing_ids = list(listing_ids)
+    if listing_ids:
+        transaction.on_commit(lambda: _refresh_after_commit(listing_ids))
+
+
+def neighbor_queryset(qs, listing_id):
+    """``qs`` restricted to the stored neighbors of ``listing_id``, best first."""
+    return qs.filter(neighbor_of__listing_id=listing_id).order_by("neighbor_of__rank")
@@ -0,0 +1,344 @@
+"""
+In-memory autocomplete index for ``GET /listings/suggest/``.
+
+Each process keeps sorted prefix arrays of normalized active listing titles,
+their cities and category names. Every word of a value is a key, so "cam"
+finds "Sony camera" as ``icontains`` used to, and a lookup is a ``bisect``
+plus a short scan — no database access.
+
+Arabic and Latin text are folded the same way for indexing and querying:
+case, Latin accents, Arabic diacritics and tatweel, alef/yaa/taa-marbuta
+variants and Arabic-Indic digits; an Arabic word is also indexed without its
+"ال" article.
+
+Keeping processes in sync: listing and category writes append the changed
+id to a journal in the shared cache once the transaction commits (see
+``signals.py``). Before answering, a process compares its journal position
+with the shared one and reloads only the changed rows. A process that has
+fallen too far behind, or finds journal entries evicted, rebuilds from the
+database. With a per-process cache backend (LocMem) other workers cannot see
+the journal, so every index is also rebuilt after ``SUGGEST_INDEX_MAX_AGE``
+seconds (default 900).
+"""
+import logging
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Category, Listing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 8
+MIN_QUERY_LENGTH = 2
+JOURNAL_VERSION_KEY = "suggest:journal:version"
+JOURNAL_ENTRY_KEY = "suggest:journal:{}"
+JOURNAL_TIMEOUT = 24 * 3600
+# Beyond this many pending journal entries a full rebuild is cheaper.
+MAX_CATCH_UP = 1000
+DEFAULT_MAX_AGE = 900
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Combining marks left by NFKD (Latin accents, Arabic harakat and hamza) and tatweel.
+_MARKS_RE = re.compile("[\u0300-\u036f\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+_ARABIC_FOLD = str.maketrans(
+    {
+        "أ": "ا",
+        "إ": "ا",
+        "آ": "ا",
+        "ٱ": "ا",
+        "ى": "ي",
+        "ئ": "ي",
+        "ؤ": "و",
+        "ة": "ه",
+        **{chr(0x0660 + d): str(d) for d in range(10)},  # ٠..٩
+        **{chr(0x06F0 + d): str(d) for d in range(10)},  # ۰..۹ (Persian)
+    }
+)
+
+
+def normalize(text: str) -> str:
+    """Fold case, accents and Arabic letter variants; collapse whitespace."""
+    text = text or ""
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = _MARKS_RE.sub("", text).translate(_ARABIC_FOLD)
+    return " ".join(_WORD_RE.findall(text.casefold()))
+
+
+def index_keys(text: str) -> set:
+    """Normalized suffixes starting at each word, so any word prefix matches."""
+    normalized = normalize(text)
+    keys = set()
+    start = 0
+    while normalized:
+        key = normalized[start:]
+        keys.add(key)
+        end = normalized.find(" ", start)
+        word_length = (end if end != -1 else len(normalized)) - start
+        if key.startswith("ال") and word_length > 3:
+            keys.add(key[2:])
+        if end == -1:
+            break
+        start = end + 1
+    return keys
+
+
+class PrefixSet:
+    """
+    Sorted index entries ``key + SEP + value`` (plain strings sort several
+    times faster than tuples) with a reference count per value, so many
+    listings can share one title or city and removing one keeps the others.
+    """
+
+    SEP = "\x00"  # never produced by normalize()
+
+    def __init__(self, values=()):
+        counts = {}
+        for value in values:
+            counts[value] = counts.get(value, 0) + 1
+        self._counts = counts
+        self._entries = sorted(
+            key + self.SEP + value for value in counts for key in index_keys(value)
+        )
+
+    def __len__(self):
+        return len(self._counts)
+
+    @property
+    def entry_count(self) -> int:
+        return len(self._entries)
+
+    def add(self, value):
+        self._counts[value] = self._counts.get(value, 0) + 1
+        if self._counts[value] == 1:
+            for key in index_keys(value):
+                insort(self._entries, key + self.SEP + value)
+
+    def discard(self, value):
+        count = self._counts.get(value, 0)
+        if count > 1:
+            self._counts[value] = count - 1
+            return
+        if not count:
+            return
+        del self._counts[value]
+        for key in index_keys(value):
+            entry = key + self.SEP + value
+            i = bisect_left(self._entries, entry)
+            if i < len(self._entries) and self._entries[i] == entry:
+                del self._entries[i]
+
+    def search(self, prefix: str, limit: int) -> list:
+        """Distinct values with a key starting with ``prefix``, in key order."""
+        results, seen = [], set()
+        entries = self._entries
+        i = bisect_left(entries, prefix)
+        while i < len(entries) and len(results) < limit:
+            entry = entries[i]
+            # The prefix never contains SEP, so this only matches inside the key.
+            if not entry.startswith(prefix):
+                break
+            value = entry.partition(self.SEP)[2]
+            if value not in seen:
+                seen.add(value)
+                results.append(value)
+            i += 1
+        return results
+
+
+def _journal():
+    return caches[getattr(settings, "SUGGEST_CACHE_ALIAS", "default")]
+
+
+def _journal_version() -> int:
+    return _journal().get(JOURNAL_VERSION_KEY) or 0
+
+
+def _append_to_journal(kind: str, pk) -> None:
+    cache = _journal()
+    cache.add(JOURNAL_VERSION_KEY, 0, None)
+    try:
+        version = cache.incr(JOURNAL_VERSION_KEY)
+    except ValueError:
+        cache.set(JOURNAL_VERSION_KEY, 1, None)
+        version = 1
+    cache.set(JOURNAL_ENTRY_KEY.format(version), (kind, pk), JOURNAL_TIMEOUT)
+
+
+def record_listing_change(listing_id) -> None:
+    transaction.on_commit(lambda: _append_to_journal("listing", listing_id))
+
+
+def record_listing_changes(listing_ids) -> None:
+    """One journal entry for many listings (bulk paths that bypass signals)."""
+    listing_ids = tuple(listing_ids)
+    if listing_ids:
+        transaction.on_commit(lambda: _append_to_journal("listings", listing_ids))
+
+
+def record_category_change(category_id) -> None:
+    transaction.on_commit(lambda: _append_to_journal("category", category_id))
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        """Drop everything; the next query rebuilds from the database."""
+        with self._lock:
+            self.titles = PrefixSet()
+            self.cities = PrefixSet()
+            self.categories = PrefixSet()
+            # listing id -> (title, city) currently indexed (active listings only)
+            self._listings = {}
+            self._category_ids = {}  # name -> id (names are unique)
+            self._journal_position = None
+            self._built_at = 0.0
+            self._refreshing = False
+
+    # --- building ---
+
+    def rebuild(self):
+        """Load everything from the database, then swap it in under the lock."""
+        # Read the journal position first: changes committed while loading are
+        # replayed by the next sync(), and replaying a change is idempotent.
+        position = _journal_version()
+        rows = Listing.objects.filter(is_active=True).values_list("id", "title", "city")
+        listings = {
+            pk: (title or "", city or "") for pk, title, city in rows.iterator(chunk_size=5000)
+        }
+        category_ids = {name: pk for pk, name in Category.objects.values_list("id", "name")}
+        titles = PrefixSet(title for title, _ in listings.values() if title)
+        cities = PrefixSet(city for _, city in listings.values() if city)
+        categories = PrefixSet(category_ids)
+        with self._lock:
+            self.titles, self.cities, self.categories = titles, cities, categories
+            self._listings = listings
+            self._category_ids = category_ids
+            self._journal_position = position
+            self._built_at = time.monotonic()
+
+    def _refresh_in_background(self):
+        """Periodic rebuild without blocking queries, which keep using the old arrays."""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            from django.db import connection
+
+            try:
+                self.rebuild()
+            except Exception:
+                logger.exception("Suggest index refresh failed")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+                    self._built_at = time.monotonic()
+                connection.close()
+
+        threading.Thread(target=run, name="suggest-index-refresh", daemon=True).start()
+
+    def _set_listing(self, pk, values):
+        old = self._listings.pop(pk, None)
+        if old:
+            title, city = old
+            if title:
+                self.titles.discard(title)
+            if city:
+                self.cities.discard(city)
+        if values:
+            title, city = values
+            if title:
+                self.titles.add(title)
+            if city:
+                self.cities.add(city)
+            self._listings[pk] = values
+
+    def apply_listing_rows(self, listing_ids):
+        """Reload the given listings from the database (missing or inactive -> removed)."""
+        listing_ids = set(listing_ids)
+        if not listing_ids:
+            return
+        rows = Listing.objects.filter(pk__in=listing_ids, is_active=True).values_list(
+            "id", "title", "city"
+        )
+        current = {pk: (title or "", city or "") for pk, title, city in rows}
+        with self._lock:
+            for pk in listing_ids:
+                self._set_listing(pk, current.get(pk))
+
+    def apply_category_rows(self, category_ids):
+        category_ids = set(category_ids)
+        if not category_ids:
+            return
+        names = dict(Category.objects.filter(pk__in=category_ids).values_list("id", "name"))
+        with self._lock:
+            for name, pk in list(self._category_ids.items()):
+                if pk in category_ids:
+                    del self._category_ids[name]
+                    self.categories.discard(name)
+            for pk, name in names.items():
+                self._category_ids[name] = pk
+                self.categories.add(name)
+
+    def sync(self):
+        """Catch up with the shared journal; rebuild when that is not possible."""
+        if self._journal_position is None:
+            self.rebuild()
+            return
+        max_age = getattr(settings, "SUGGEST_INDEX_MAX_AGE", DEFAULT_MAX_AGE)
+        if time.monotonic() - self._built_at > max_age:
+            self._refresh_in_background()
+        target = _journal_version()
+        if target == self._journal_position:
+            return
+        if target < self._journal_position or target - self._journal_position > MAX_CATCH_UP:
+            # Journal reset (cache flushed) or too far behind.
+            self.rebuild()
+            return
+        keys = [JOURNAL_ENTRY_KEY.format(v) for v in range(self._journal_position + 1, target + 1)]
+        entries = _journal().get_many(keys)
+        if len(entries) != len(keys):
+            self.rebuild()
+            return
+        changes = {"listing": set(), "category": set()}
+        for kind, pk in entries.values():
+            if kind == "listings":
+                changes["listing"].update(pk)
+            else:
+                changes[kind].add(pk)
+        self.apply_listing_rows(changes["listing"])
+        self.apply_category_rows(changes["category"])
+        with self._lock:
+            self._journal_position = max(self._journal_position, target)
+
+    # --- querying ---
+
+    def suggest(self, query: str, limit: int = DEFAULT_LIMIT) -> dict:
+        prefix = normalize(query)
+        if len(prefix) < MIN_QUERY_LENGTH:
+            return {"titles": [], "cities": [], "categories": []}
+        self.sync()
+        with self._lock:
+            categories = self.categories.search(prefix, limit)
+            return {
+                "titles": self.titles.search(prefix, limit),
+                "cities": self.cities.search(prefix, limit),
+                "categories": [
+                    {"id": self._category_ids[name], "name": name} for name in categories
+                ],
+            }
+
+
+index = SuggestIndex()
@@ -6,8 +6,10 @@ from django.test import TestCase
 from django.contrib.auth import get_user_model
 from decimal import Decimal
 from datetime import date, timedelta
+from io import StringIO
 
 from .models import (
+    AvailabilityBlock,
     Category,
     Listing,
     ListingImage,
@@ -16,6 +18,7 @@ from .models import (
     Favorite,
     Notification,
     ContactMessage,
+    ListingOccupancy,
 )
 
 User = get_user_model()
@@ -72,6 +75,74 @@ class ListingModelTests(TestCase):
         )
         self.assertEqual(listing.average_rating, 3.0)
 
+    def test_save_keeps_denormalized_columns(self):
+        listing = Listing.objects.create(
+            owner=self.user,
+            title="Lens",
+            description="Desc",
+            price_per_day=Decimal("20.00"),
+        )
+        stale = Listing.objects.get(pk=listing.pk)
+        fan = User.objects.create_user(
+            email="fan@example.com", username="fan", password="testpass"
+        )
+        Review.objects.create(user=fan, listing=listing, rating=4, comment="Good")
+        Favorite.objects.create(user=fan, listing=listing)
+
+        stale.title = "Zoom lens"
+        stale.save()
+        listing.refresh_from_db()
+        self.assertEqual(listing.title, "Zoom lens")
+        self.assertEqual((listing.rating_avg, listing.rating_count), (4.0, 1))
+        self.assertEqual(listing.rating_histogram, [0, 0, 0, 0, 1, 0])
+        self.assertEqual(listing.favorites_count, 1)
+
+
+class ListingLocationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="geo-owner@example.com", username="geoowner", password="testpass"
+        )
+
+    def test_privacy_jitter_applied_once(self):
+        listing = Listing.objects.create(
+            owner=self.user,
+            title="Bike",
+            description="Desc",
+            price_per_day=Decimal("20.00"),
+            latitude=24.7136,
+            longitude=46.6753,
+        )
+        self.assertLess(abs(listing.latitude - 24.7136), 0.0014)
+        stored = (listing.latitude, listing.longitude, listing.geohash)
+        self.assertEqual(len(listing.geohash), 7)
+
+        listing.title = "Road bike"
+        listing.save()
+        reloaded = Listing.objects.get(pk=listing.pk)
+        reloaded.save()
+        reloaded.refresh_from_db()
+        self.assertEqual((reloaded.latitude, reloaded.longitude, reloaded.geohash), stored)
+
+        reloaded.latitude, reloaded.longitude = 21.4858, 39.1925
+        reloaded.save()
+        self.assertNotEqual(reloaded.geohash, stored[2])
+        self.assertLess(abs(reloaded.latitude - 21.4858), 0.0014)
+
+    def test_cells_are_prefix_matches(self):
+        from . import geo
+
+        near = geo.filter_near(Listing.objects.all(), 24.7136, 46.6753, 5)
+        sql = str(near.query)
+        # Prefix LIKE, not a string range that depends on the collation.
+        self.assertIn("LIKE", sql)
+        self.assertNotIn("{", sql)
+        listing = Listing.objects.create(
+            owner=self.user, title="Tent", description="Desc", price_per_day=Decimal("5.00"),
+            latitude=24.7136, longitude=46.6753,
+        )
+        self.assertEqual(list(near.values_list("pk", flat=True)), [listing.pk])
+
 
 class BookingModelTests(TestCase):
     def setUp(self):
@@ -173,3 +244,153 @@ class ContactMessageModelTests(TestCase):
         )
         self.assertIn("Jane", str(msg))
         self.assertIn("jane@example.com", str(msg))
+
+
+class ListingRatingAggregateTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            email="agg-owner@example.com", username="aggowner", password="testpass"
+        )
+        self.reviewer = User.objects.create_user(
+            email="agg-r1@example.com", username="aggr1", password="testpass"
+        )
+        self.reviewer_two = User.objects.create_user(
+            email="agg-r2@example.com", username="aggr2", password="testpass"
+        )
+        self.listing = Listing.objects.create(
+            owner=self.owner,
+            title="Drone",
+            description="Desc",
+            price_per_day=Decimal("80.00"),
+        )
+
+    def test_aggregates_follow_review_create_edit_delete(self):
+        review = Review.objects.create(user=self.reviewer, listing=self.listing, rating=5)
+        Review.objects.create(user=self.reviewer_two, listing=self.listing, rating=2)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.rating_count, 2)
+        self.assertAlmostEqual(self.listing.rating_avg, 3.5)
+        self.assertEqual(self.listing.rating_histogram, [0, 0, 1, 0, 0, 1])
+
+        review.rating = 3
+        review.save()
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.rating_histogram, [0, 0, 1, 1, 0, 0])
+
+        Review.objects.all().delete()
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.rating_count, 0)
+        self.assertIsNone(self.listing.rating_avg)
+        self.assertEqual(self.listing.average_rating, 0)
+
+    def test_sync_command_repairs_drift(self):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+
+        Review.objects.create(user=self.reviewer, listing=self.listing, rating=4)
+        Listing.objects.filter(pk=self.listing.pk).update(rating_avg=None, rating_count=0)
+        with self.assertRaises(CommandError):
+            call_command("sync_listing_ratings", "--verify", stdout=StringIO())
+        call_command("sync_listing_ratings", stdout=StringIO())
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.rating_count, 1)
+        self.assertEqual(self.listing.rating_avg, 4.0)
+        call_command("sync_listing_ratings", "--verify", stdout=StringIO())
+
+
+class ListingOccupancyTests(TestCase):
+    def setUp(self):
+        self.renter = User.objects.create_user(
+            email="occ-r@example.com", username="occrenter", password="testpass"
+        )
+        owner = User.objects.create_user(
+            email="occ-o@example.com", username="occowner", password="testpass"
+        )
+        self.listing = Listing.objects.create(
+            owner=owner, title="Tent", description="Desc", price_per_day=Decimal("15.00")
+        )
+        self.start = date.today() + timedelta(days=10)
+
+    def ranges(self):
+        return list(
+            ListingOccupancy.objects.filter(listing=self.listing)
+            .order_by("start_date")
+            .values_list("start_date", "end_date")
+        )
+
+    def test_index_follows_bookings_and_blocks(self):
+        booking = Booking.objects.create(
+            listing=self.listing,
+            renter=self.renter,
+            start_date=self.start,
+            end_date=self.start + timedelta(days=2),
+            total_price=Decimal("45.00"),
+        )
+        block = AvailabilityBlock.objects.create(
+            listing=self.listing,
+            start_date=self.start + timedelta(days=5),
+            end_date=self.start + timedelta(days=6),
+        )
+        self.assertEqual(
+            self.ranges(),
+            [
+                (self.start, self.start + timedelta(days=2)),
+                (self.start + timedelta(days=5), self.start + timedelta(days=6)),
+            ],
+        )
+
+        booking.end_date = self.start + timedelta(days=3)
+        booking.status = Booking.Status.CONFIRMED
+        booking.save()
+        self.assertEqual(self.ranges()[0], (self.start, self.start + timedelta(days=3)))
+
+        booking.status = Booking.Status.CANCELLED
+        booking.save()
+        block.delete()
+        self.assertEqual(self.ranges(), [])
+
+    def test_calendar_merges_and_answers_from_one_query(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from . import availability
+
+        day = lambda n: self.start + timedelta(days=n)  # noqa: E731
+        for first, last in ((0, 2), (1, 4)):
+            Booking.objects.create(
+                listing=self.listing, renter=self.renter, start_date=day(first),
+                end_date=day(last), total_price=Decimal("1.00"),
+            )
+        AvailabilityBlock.objects.create(listing=self.listing, start_date=day(5), end_date=day(6))
+        AvailabilityBlock.objects.create(listing=self.listing, start_date=day(10), end_date=day(10))
+
+        with CaptureQueriesContext(connection) as queries:
+            calendar = availability.Calendar.load(self.listing.pk)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(calendar.bookings.merged, [(day(0), day(4))])
+        # Touching intervals join: day 4 (booking) and day 5 (block).
+        self.assertEqual(calendar.unavailable.merged, [(day(0), day(6)), (day(10), day(10))])
+
+        self.assertTrue(calendar.bookings.overlaps(day(4), day(8)))
+        self.assertFalse(calendar.bookings.overlaps(day(5), day(20)))
+        self.assertTrue(calendar.blocks.overlaps(day(-3), day(5)))
+        self.assertFalse(calendar.unavailable.overlaps(day(7), day(9)))
+        self.assertFalse(calendar.unavailable.overlaps(day(-5), day(-1)))
+
+        self.assertEqual(
+            calendar.free_windows(day(-2), limit=3, end=day(20)),
+            [(day(-2), day(-1)), (day(7), day(9)), (day(11), day(20))],
+        )
+        self.assertEqual(
+            calendar.free_windows(day(1), limit=1, min_days=4, end=day(20)), [(day(11), day(20))]
+        )
+
+    def test_rebuild_command(self):
+        from django.core.management import call_command
+
+        AvailabilityBlock.objects.create(
+            listing=self.listing, start_date=self.start, end_date=self.start
+        )
+        ListingOccupancy.objects.all().delete()
+        call_command("rebuild_availability_index", stdout=StringIO())
+        self.assertEqual(self.ranges(), [(self.start, self.start)])
@@ -2,7 +2,16 @@
 Integration tests for marketplace views (imports views module for coverage).
 Run: python manage.py test marketplace.test_views
 """
-from django.test import TestCase
+import hashlib
+import logging
+import threading
+import time
+from unittest import skipUnless
+
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
@@ -10,11 +19,12 @@ from decimal import Decimal
 from datetime import timedelta
 
 # Import views so the module is covered by tests
-from . import views  # noqa: F401
-from .models import Booking, Category, Listing, Review
+from . import blobs, views  # noqa: F401
+from .models import AvailabilityBlock, Booking, Category, Favorite, Listing, ListingImage, Review
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 
 class ViewIntegrationTests(TestCase):
@@ -175,3 +185,2094 @@ class EarningsViewTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["monthly_earnings"], "1500.00")
         self.assertEqual(response.data["annual_earnings"], "18000.00")
+
+
+class ListingSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.owner = User.objects.create_user(
+            email="searchowner@example.com", username="searchowner", password="testpass"
+        )
+        self.camera = Listing.objects.create(
+            owner=self.owner,
+            title="Sony camera body",
+            description="Full frame mirrorless",
+            price_per_day=Decimal("150.00"),
+            city="Riyadh",
+        )
+        self.lens = Listing.objects.create(
+            owner=self.owner,
+            title="Prime lens",
+            description="Works with any camera mount",
+            price_per_day=Decimal("50.00"),
+            city="Jeddah",
+        )
+        self.tent = Listing.objects.create(
+            owner=self.owner,
+            title="خيمة رحلات",
+            description="Camping tent for four",
+            price_per_day=Decimal("30.00"),
+            city="Abha",
+        )
+
+    def _ids(self, params):
+        response = self.client.get("/api/listings/", params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row["id"] for row in response.data["results"]]
+
+    def test_search_ranks_title_match_first(self):
+        self.assertEqual(self._ids({"search": "camera"}), [self.camera.id, self.lens.id])
+
+    def test_search_prefix_and_arabic_terms(self):
+        self.assertEqual(self._ids({"search": "cam"})[:1], [self.camera.id])
+        self.assertEqual(self._ids({"search": "خيمة"}), [self.tent.id])
+
+    def test_search_index_follows_edits_and_deletes(self):
+        self.camera.title = "Canon camcorder"
+        self.camera.description = "Video"
+        self.camera.save()
+        self.assertEqual(self._ids({"search": "sony"}), [])
+        self.assertEqual(self._ids({"search": "camcorder"}), [self.camera.id])
+        self.lens.delete()
+        self.assertEqual(self._ids({"search": "mount"}), [])
+
+    def test_rating_min_uses_stored_aggregate(self):
+        reviewer = User.objects.create_user(
+            email="searchreviewer@example.com", username="searchreviewer", password="testpass"
+        )
+        Review.objects.create(user=reviewer, listing=self.camera, rating=5)
+        Review.objects.create(user=reviewer, listing=self.lens, rating=3)
+        self.assertEqual(self._ids({"rating_min": "4"}), [self.camera.id])
+        self.assertEqual(
+            sorted(self._ids({"rating_min": "0"})), sorted([self.camera.id, self.lens.id])
+        )
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="cursor@example.com", username="cursor", password="testpass"
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def _walk(self, url, params):
+        ids, params = [], dict(params, cursor="")
+        while True:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            ids.extend(row["id"] for row in response.data["results"])
+            if not response.data["next_cursor"]:
+                return ids
+            params["cursor"] = response.data["next_cursor"]
+
+    def test_notifications_cursor_matches_page_order(self):
+        from .models import Notification
+
+        same_time = timezone.now()
+        for i in range(5):
+            n = Notification.objects.create(
+                user=self.user,
+                notification_type=Notification.NotificationType.NEW_MESSAGE,
+                title=f"n{i}",
+            )
+            # Identical timestamps exercise the id tie-breaker.
+            Notification.objects.filter(pk=n.pk).update(created_at=same_time)
+        expected = [
+            row["id"]
+            for row in self.client.get("/api/notifications/", {"page_size": 50}).data["results"]
+        ]
+        walked = self._walk("/api/notifications/", {"page_size": 2})
+        self.assertEqual(len(walked), 5)
+        self.assertEqual(walked, expected)
+
+    def test_listings_cursor_by_price(self):
+        for price in ["30.00", "10.00", "20.00", "10.00"]:
+            Listing.objects.create(
+                owner=self.user, title="Item", description="d", price_per_day=Decimal(price)
+            )
+        walked = self._walk("/api/listings/", {"order": "price_asc", "page_size": 3})
+        prices = [Listing.objects.get(pk=pk).price_per_day for pk in walked]
+        self.assertEqual(prices, sorted(prices))
+        self.assertEqual(len(walked), 4)
+
+    def test_invalid_cursor_and_unsupported_ordering(self):
+        response = self.client.get("/api/listings/", {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get("/api/listings/", {"cursor": "", "search": "camera"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ListingAvailabilityFilterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        owner = User.objects.create_user(
+            email="availowner@example.com", username="availowner", password="testpass"
+        )
+        renter = User.objects.create_user(
+            email="availrenter@example.com", username="availrenter", password="testpass"
+        )
+        self.start = timezone.now().date() + timedelta(days=30)
+        self.listings = {
+            name: Listing.objects.create(
+                owner=owner, title=name, description="d", price_per_day=Decimal("10.00")
+            )
+            for name in ("free", "booked", "blocked", "declined")
+        }
+        Booking.objects.create(
+            listing=self.listings["booked"],
+            renter=renter,
+            start_date=self.start - timedelta(days=2),
+            end_date=self.start,
+            total_price=Decimal("30.00"),
+        )
+        Booking.objects.create(
+            listing=self.listings["declined"],
+            renter=renter,
+            start_date=self.start,
+            end_date=self.start + timedelta(days=1),
+            total_price=Decimal("20.00"),
+            status=Booking.Status.DECLINED,
+        )
+        AvailabilityBlock.objects.create(
+            listing=self.listings["blocked"],
+            start_date=self.start + timedelta(days=3),
+            end_date=self.start + timedelta(days=4),
+        )
+
+    def titles(self, start, end):
+        response = self.client.get(
+            "/api/listings/",
+            {"available_from": start.isoformat(), "available_to": end.isoformat()},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(row["title"] for row in response.data["results"])
+
+    def test_bookings_and_blocks_exclude_listings(self):
+        self.assertEqual(
+            self.titles(self.start, self.start + timedelta(days=3)), ["declined", "free"]
+        )
+        self.assertEqual(
+            self.titles(self.start + timedelta(days=1), self.start + timedelta(days=2)),
+            ["blocked", "booked", "declined", "free"],
+        )
+
+
+class ListingNearMeTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        owner = User.objects.create_user(
+            email="nearowner@example.com", username="nearowner", password="testpass"
+        )
+
+        def make(title, lat, lng):
+            return Listing.objects.create(
+                owner=owner,
+                title=title,
+                description="d",
+                price_per_day=Decimal("10.00"),
+                latitude=lat,
+                longitude=lng,
+            )
+
+        self.far_north = make("5km north", 24.7136 + 0.045, 46.6753)
+        self.center = make("Center", 24.7136, 46.6753)
+        self.jeddah = make("Jeddah", 21.4858, 39.1925)
+        make("No location", None, None)
+
+    def test_radius_filter_and_distance_order(self):
+        response = self.client.get(
+            "/api/listings/",
+            {"near": "24.7136,46.6753", "radius_km": "10", "order": "distance"},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = response.data["results"]
+        self.assertEqual([r["id"] for r in rows], [self.center.id, self.far_north.id])
+        self.assertLess(rows[0]["distance_km"], 0.5)
+        self.assertAlmostEqual(rows[1]["distance_km"], 5.0, delta=0.5)
+
+    def test_small_radius_and_invalid_point(self):
+        response = self.client.get("/api/listings/", {"near": "24.7136,46.6753", "radius_km": "1"})
+        self.assertEqual([r["id"] for r in response.data["results"]], [self.center.id])
+        response = self.client.get("/api/listings/", {"near": "abc"})
+        self.assertEqual(response.data["count"], 4)
+
+
+@override_settings(
+    STORAGES={
+        "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    }
+)
+class ListingCardViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.owner = User.objects.create_user(
+            email="cardowner@example.com", username="cardowner", password="testpass"
+        )
+        self.viewer = User.objects.create_user(
+            email="cardviewer@example.com", username="cardviewer", password="testpass"
+        )
+        self.category = Category.objects.create(name="Cards")
+        self.listings = []
+        for i in range(6):
+            listing = Listing.objects.create(
+                owner=self.owner,
+                category=self.category,
+                title=f"Card {i}",
+                description="d",
+                price_per_day=Decimal("10.00"),
+            )
+            for pos in (1, 0):
+                ListingImage.objects.create(
+                    listing=listing, image=f"listing_images/card_{i}_{pos}.jpg", position=pos
+                )
+            Review.objects.create(listing=listing, user=self.viewer, rating=4)
+            self.listings.append(listing)
+        Favorite.objects.create(user=self.viewer, listing=self.listings[0])
+
+    def test_card_page_uses_fixed_query_count(self):
+        # COUNT, page rows (owner + category joined), cover images.
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/listings/", {"view": "card"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        card = response.data["results"][0]
+        self.assertEqual(card["id"], self.listings[-1].id)
+        self.assertTrue(card["cover_image"].endswith("card_5_0.jpg"))
+        self.assertEqual(card["owner"]["username"], "cardowner")
+        self.assertEqual(card["average_rating"], 4.0)
+        self.assertNotIn("reviews", card)
+        self.assertNotIn("images", card)
+
+    def test_card_favorites_and_bookings(self):
+        self.client.force_authenticate(user=self.viewer)
+        response = self.client.get("/api/listings/", {"view": "card"})
+        flags = {row["id"]: row["is_favorited"] for row in response.data["results"]}
+        self.assertTrue(flags[self.listings[0].id])
+        self.assertFalse(flags[self.listings[1].id])
+
+        response = self.client.get("/api/favorites/", {"view": "card"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        listing = response.data["results"][0]["listing"]
+        self.assertEqual(listing["id"], self.listings[0].id)
+        self.assertTrue(listing["is_favorited"])
+
+        today = timezone.now().date()
+        Booking.objects.create(
+            listing=self.listings[1],
+            renter=self.viewer,
+            start_date=today,
+            end_date=today + timedelta(days=2),
+            total_price=Decimal("20.00"),
+        )
+        response = self.client.get("/api/bookings/", {"view": "card"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        row = response.data["results"][0]
+        self.assertEqual(row["renter"], {"id": self.viewer.id, "username": "cardviewer", "first_name": "", "avatar": None})
+        self.assertEqual(row["listing"]["title"], "Card 1")
+
+    def test_full_page_query_count_does_not_grow_with_page_size(self):
+        self.client.force_authenticate(user=self.viewer)
+        counts = []
+        for page_size in (2, 6):
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get("/api/listings/", {"page_size": page_size})
+            self.assertEqual(len(response.data["results"]), page_size)
+            counts.append(len(captured))
+        self.assertEqual(counts[0], counts[1])
+        row = next(r for r in response.data["results"] if r["id"] == self.listings[0].id)
+        self.assertTrue(row["is_favorited"])
+        self.assertEqual(row["favorites_count"], 1)
+        self.assertEqual(row["owner"]["listings_count"], 6)
+        self.assertEqual(row["owner"]["reviews_count"], 6)
+        self.assertEqual(row["reviews"][0]["user"]["saved_items_count"], 1)
+
+    def test_sparse_fieldset(self):
+        response = self.client.get("/api/listings/", {"fields": "title,price_per_day"})
+        self.assertEqual(set(response.data["results"][0]), {"id", "title", "price_per_day"})
+        response = self.client.get(
+            f"/api/listings/{self.listings[0].id}/similar/", {"view": "card", "fields": "title"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(set(response.data[0]), {"id", "title"})
+
+
+class ListingResponseCacheTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.client = APIClient()
+        self.owner = User.objects.create_user(
+            email="cacheowner@example.com", username="cacheowner", password="testpass"
+        )
+        self.staff = User.objects.create_user(
+            email="cachestaff@example.com", username="cachestaff", password="testpass", is_staff=True
+        )
+        self.listing = Listing.objects.create(
+            owner=self.owner, title="Cached", description="d", price_per_day=Decimal("10.00")
+        )
+
+    def test_hit_miss_and_version_invalidation(self):
+        first = self.client.get("/api/listings/", {"city": "", "page": "1"})
+        self.assertEqual(first["X-Cache"], "MISS")
+        with self.assertNumQueries(0):
+            second = self.client.get("/api/listings/")
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(second.data, first.data)
+
+        Listing.objects.create(
+            owner=self.owner, title="Fresh", description="d", price_per_day=Decimal("5.00")
+        )
+        third = self.client.get("/api/listings/")
+        self.assertEqual(third["X-Cache"], "MISS")
+        self.assertEqual(third.data["count"], 2)
+
+        # Signed-in viewers do not share anonymous entries (is_favorited differs).
+        self.client.force_authenticate(user=self.staff)
+        self.assertEqual(self.client.get("/api/listings/")["X-Cache"], "MISS")
+
+        stats = self.client.get("/api/listings/cache-stats/").data
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 3))
+
+    def test_stats_are_staff_only(self):
+        self.client.force_authenticate(user=self.owner)
+        response = self.client.get("/api/listings/cache-stats/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_version_is_shared_between_workers(self):
+        from django.core.management import call_command
+        from . import listing_cache
+
+        # Two aliases on one table stand for the caches of two gunicorn workers.
+        backend = {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "test_listing_cache",
+        }
+        with override_settings(CACHES={"default": backend, "worker2": backend}):
+            call_command("createcachetable", verbosity=0)
+            before = listing_cache.current_version()
+            listing_cache.bump_version()
+            with override_settings(LISTING_CACHE_ALIAS="worker2"):
+                self.assertEqual(listing_cache.current_version(), before + 1)
+                self.assertEqual(listing_cache.timeout(), listing_cache.DEFAULT_TIMEOUT)
+
+    def test_process_local_cache_bounds_staleness(self):
+        from . import listing_cache
+
+        caches = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "w1"},
+            "worker2": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "w2"},
+        }
+        with override_settings(CACHES=caches):
+            before = listing_cache.current_version()
+            listing_cache.bump_version()
+            with override_settings(LISTING_CACHE_ALIAS="worker2"):
+                # The other worker misses the bump, so its pages expire quickly.
+                self.assertNotEqual(listing_cache.current_version(), before + 1)
+                self.assertEqual(listing_cache.timeout(), listing_cache.PROCESS_LOCAL_TIMEOUT)
+
+
+class ListingSuggestTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from . import suggest
+
+        cache.clear()
+        suggest.index.reset()
+        self.client = APIClient()
+        owner = User.objects.create_user(
+            email="suggestowner@example.com", username="suggestowner", password="testpass"
+        )
+        self.category = Category.objects.create(name="Cameras")
+        self.sony = Listing.objects.create(
+            owner=owner, title="Sony Camera", description="d",
+            price_per_day=Decimal("10.00"), city="Riyadh",
+        )
+        Listing.objects.create(
+            owner=owner, title="الكاميرا الرقمية", description="d",
+            price_per_day=Decimal("10.00"), city="جدة",
+        )
+
+    def suggest(self, q):
+        response = self.client.get("/api/listings/suggest/", {"q": q})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_word_prefix_and_arabic_normalization(self):
+        data = self.suggest("cam")
+        self.assertEqual(data["titles"], ["Sony Camera"])
+        self.assertEqual(data["categories"], [{"id": self.category.id, "name": "Cameras"}])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest("RIY")["cities"], ["Riyadh"])
+        # Article-less and diacritic/alef variants all reach the same title.
+        for q in ("كاميرا", "الكاميرا", "كَاميرا", "الرقميه"):
+            self.assertEqual(self.suggest(q)["titles"], ["الكاميرا الرقمية"], q)
+        self.assertEqual(self.suggest("c")["titles"], [])
+
+    def test_index_follows_listing_changes(self):
+        self.assertEqual(self.suggest("sony")["titles"], ["Sony Camera"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sony.title = "Nikon Lens"
+            self.sony.save()
+        self.assertEqual(self.suggest("sony")["titles"], [])
+        self.assertEqual(self.suggest("lens")["titles"], ["Nikon Lens"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sony.is_active = False
+            self.sony.save()
+            Category.objects.create(name="Lenses")
+        data = self.suggest("lens")
+        self.assertEqual(data["titles"], [])
+        self.assertEqual([c["name"] for c in data["categories"]], ["Lenses"])
+
+    def test_account_deletion_is_one_journal_entry(self):
+        from accounts.services import anonymize_and_close_account
+        from . import suggest
+
+        self.assertEqual(self.suggest("sony")["titles"], ["Sony Camera"])
+        before = suggest._journal_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            anonymize_and_close_account(self.sony.owner)
+        self.assertEqual(suggest._journal_version(), before + 1)
+        self.assertEqual(self.suggest("sony")["titles"], [])
+
+
+class ListingFacetsTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.client = APIClient()
+        owner = User.objects.create_user(
+            email="facetowner@example.com", username="facetowner", password="testpass"
+        )
+        reviewer = User.objects.create_user(
+            email="facetreviewer@example.com", username="facetreviewer", password="testpass"
+        )
+        self.cameras = Category.objects.create(name="Cameras")
+        self.tools = Category.objects.create(name="Tools")
+        rows = [
+            ("Riyadh", self.cameras, "40.00", 5),
+            ("riyadh ", self.cameras, "120.00", 4),
+            ("Riyadh", self.tools, "75.00", None),
+            ("Jeddah", self.tools, "1500.00", 3),
+        ]
+        for city, category, price, stars in rows:
+            listing = Listing.objects.create(
+                owner=owner, title="Item", description="d", city=city,
+                category=category, price_per_day=Decimal(price),
+            )
+            if stars is not None:
+                Review.objects.create(listing=listing, user=reviewer, rating=stars)
+        Listing.objects.create(
+            owner=owner, title="Hidden", description="d", city="Riyadh",
+            price_per_day=Decimal("10.00"), is_active=False,
+        )
+
+    def test_counts(self):
+        response = self.client.get("/api/listings/facets/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data
+        self.assertEqual(data["count"], 4)
+        self.assertEqual(
+            data["categories"],
+            [
+                {"id": self.cameras.id, "name": "Cameras", "count": 2},
+                {"id": self.tools.id, "name": "Tools", "count": 2},
+            ],
+        )
+        self.assertEqual(data["cities"], [{"name": "Riyadh", "count": 3}, {"name": "Jeddah", "count": 1}])
+        self.assertEqual(
+            [bucket["count"] for bucket in data["price"]], [1, 1, 1, 0, 0, 1]
+        )
+        self.assertIsNone(data["price"][-1]["max"])
+        self.assertEqual(
+            data["ratings"],
+            [
+                {"min": 4.5, "count": 1},
+                {"min": 4.0, "count": 2},
+                {"min": 3.0, "count": 3},
+                {"min": 2.0, "count": 3},
+                {"min": 1.0, "count": 3},
+            ],
+        )
+
+    def test_uses_list_filters_and_cache(self):
+        first = self.client.get("/api/listings/facets/", {"category": self.tools.id, "page": "2"})
+        self.assertEqual(first["X-Cache"], "MISS")
+        self.assertEqual(first.data["count"], 2)
+        self.assertEqual([c["name"] for c in first.data["cities"]], ["Jeddah", "Riyadh"])
+        # Paging and ordering do not change facets, so they share the entry.
+        second = self.client.get("/api/listings/facets/", {"category": self.tools.id, "order": "price_asc"})
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(second.data, first.data)
+
+
+class ListingRelevanceOrderTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.client = APIClient()
+        self.owner = User.objects.create_user(
+            email="rankowner@example.com", username="rankowner", password="testpass"
+        )
+        self.fans = [
+            User.objects.create_user(
+                email=f"rankfan{i}@example.com", username=f"rankfan{i}", password="testpass"
+            )
+            for i in range(4)
+        ]
+        self.popular = Listing.objects.create(
+            owner=self.owner, title="Camping tent", description="Sleeps four",
+            price_per_day=Decimal("40.00"), city="Riyadh",
+        )
+        Listing.objects.filter(pk=self.popular.pk).update(
+            created_at=timezone.now() - timedelta(days=45)
+        )
+        self.fresh = Listing.objects.create(
+            owner=self.owner, title="Tent pegs", description="Steel pegs for a camping tent",
+            price_per_day=Decimal("5.00"), city="Riyadh",
+        )
+        for fan in self.fans:
+            Favorite.objects.create(user=fan, listing=self.popular)
+            Review.objects.create(user=fan, listing=self.popular, rating=5)
+
+    def _ids(self, params):
+        response = self.client.get("/api/listings/", params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row["id"] for row in response.data["results"]]
+
+    def test_favorite_signals_keep_count(self):
+        self.popular.refresh_from_db()
+        self.assertEqual(self.popular.favorites_count, 4)
+        Favorite.objects.filter(listing=self.popular, user=self.fans[0]).delete()
+        self.popular.refresh_from_db()
+        self.assertEqual(self.popular.favorites_count, 3)
+
+    def test_relevance_blends_signals(self):
+        self.assertEqual(self._ids({}), [self.fresh.id, self.popular.id])
+        self.assertEqual(self._ids({"order": "relevance"}), [self.popular.id, self.fresh.id])
+        # The title match still wins a search when text dominates the weights.
+        with self.settings(LISTING_RELEVANCE_WEIGHTS={"text": 20}):
+            self.assertEqual(
+                self._ids({"order": "relevance", "search": "pegs"}), [self.fresh.id]
+            )
+        with self.settings(
+            LISTING_RELEVANCE_WEIGHTS={"rating": 0, "favorites": 0, "super_host": 0}
+        ):
+            from django.core.cache import cache
+
+            cache.clear()
+            self.assertEqual(self._ids({"order": "relevance"}), [self.fresh.id, self.popular.id])
+
+    def test_super_host_flag_boosts_owner(self):
+        from . import ranking
+
+        other = User.objects.create_user(
+            email="rankhost@example.com", username="rankhost", password="testpass"
+        )
+        hosted = Listing.objects.create(
+            owner=other, title="Drone", description="4K", price_per_day=Decimal("90.00")
+        )
+        self.assertEqual(ranking.refresh_super_hosts([other.pk]), 0)
+        hosted.refresh_from_db()
+        self.assertFalse(hosted.owner_is_super_host)
+        Listing.objects.filter(pk=hosted.pk).update(owner_is_super_host=True)
+        with self.settings(LISTING_RELEVANCE_WEIGHTS={"super_host": 10}):
+            self.assertEqual(self._ids({"order": "relevance"})[0], hosted.id)
+        # Recomputed from the owner's actual stats, the flag is cleared again.
+        ranking.refresh_super_hosts([other.pk])
+        hosted.refresh_from_db()
+        self.assertFalse(hosted.owner_is_super_host)
+
+    def test_ranking_adds_no_queries(self):
+        def count(params):
+            from django.core.cache import cache
+
+            cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                self._ids(params)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count({"order": "relevance"}), count({"order": "newest"}))
+
+
+class BlockListCacheTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.client = APIClient()
+        self.me = User.objects.create_user(
+            email="blockme@example.com", username="blockme", password="testpass"
+        )
+        self.other = User.objects.create_user(
+            email="blockother@example.com", username="blockother", password="testpass"
+        )
+        self.friend = User.objects.create_user(
+            email="blockfriend@example.com", username="blockfriend", password="testpass"
+        )
+        from .models import ChatRoom
+
+        self.blocked_room = ChatRoom.objects.create()
+        self.blocked_room.participants.set([self.me, self.other])
+        self.friend_room = ChatRoom.objects.create()
+        self.friend_room.participants.set([self.me, self.friend])
+        self.client.force_authenticate(self.me)
+
+    def _room_ids(self):
+        response = self.client.get("/api/chat/rooms/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = response.data["results"] if isinstance(response.data, dict) else response.data
+        return sorted(row["id"] for row in rows)
+
+    def test_lookup_is_cached_and_invalidated_by_block_views(self):
+        from . import blocking
+
+        self.assertEqual(blocking.blocked_user_ids(self.me), set())
+        with self.assertNumQueries(0):
+            blocking.blocked_user_ids(self.me)
+        self.assertEqual(sorted(self._room_ids()), sorted([self.blocked_room.id, self.friend_room.id]))
+
+        self.client.post(f"/api/users/{self.other.pk}/block/")
+        self.assertEqual(blocking.blocked_user_ids(self.me), {self.other.pk})
+        # The blocked side sees the block too.
+        self.assertEqual(blocking.blocked_user_ids(self.other), {self.me.pk})
+        self.assertEqual(self._room_ids(), [self.friend_room.id])
+
+        self.client.delete(f"/api/users/{self.other.pk}/unblock/")
+        self.assertEqual(blocking.blocked_user_ids(self.me), set())
+        self.assertEqual(blocking.blocked_user_ids(self.other), set())
+
+    def test_account_deletion_invalidates(self):
+        from accounts.services import anonymize_and_close_account
+        from . import blocking
+        from .models import BlockedUser
+
+        BlockedUser.objects.create(blocker=self.me, blocked=self.other)
+        self.assertEqual(blocking.blocked_user_ids(self.other), {self.me.pk})
+        anonymize_and_close_account(self.me)
+        self.assertEqual(blocking.blocked_user_ids(self.other), set())
+
+    def test_process_local_cache_is_short_lived(self):
+        from . import blocking
+
+        locmem = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        database = {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "blocks"}
+        with override_settings(CACHES={"default": locmem}):
+            self.assertEqual(blocking.timeout(), blocking.PROCESS_LOCAL_TIMEOUT)
+        with override_settings(CACHES={"default": database}):
+            self.assertEqual(blocking.timeout(), blocking.DEFAULT_TIMEOUT)
+
+    def test_room_filter_is_one_query(self):
+        from . import blocking
+        from .models import BlockedUser
+
+        BlockedUser.objects.create(blocker=self.other, blocked=self.me)
+        blocking.blocked_user_ids(self.me)  # warm the cache
+        with CaptureQueriesContext(connection) as ctx:
+            rooms = list(views._visible_chat_rooms(self.me))
+        self.assertEqual(rooms, [self.friend_room])
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+
+@override_settings(
+    STORAGES={
+        "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    }
+)
+class SimilarListingsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        owner = User.objects.create_user(
+            email="simowner@example.com", username="simowner", password="testpass"
+        )
+        cameras = Category.objects.create(name="Sim cameras")
+        camping = Category.objects.create(name="Sim camping")
+
+        def create(title, description, category, price):
+            return Listing.objects.create(
+                owner=owner, title=title, description=description,
+                category=category, price_per_day=Decimal(price),
+            )
+
+        self.sony = create("Sony mirrorless camera", "Full frame body with battery", cameras, "120")
+        self.canon = create("Canon mirrorless camera", "Full frame body, two batteries", cameras, "110")
+        self.lens = create("Zoom lens", "Fits Sony cameras", cameras, "60")
+        self.tent = create("Family tent", "Sleeps six, easy setup", camping, "40")
+        self.stove = create("Camping stove", "Gas stove for the tent", camping, "15")
+
+    def _similar(self, listing):
+        response = self.client.get(f"/api/listings/{listing.id}/similar/", {"view": "card"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row["id"] for row in response.data]
+
+    def test_neighbors_follow_content(self):
+        from . import similarity
+
+        similarity.rebuild()
+        self.assertEqual(self._similar(self.sony)[0], self.canon.id)
+        self.assertEqual(self._similar(self.tent)[0], self.stove.id)
+        self.assertNotIn(self.sony.id, self._similar(self.sony))
+
+    def test_edits_refresh_after_commit(self):
+        from . import similarity
+        from .models import SimilarListing
+
+        similarity.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stove.title = "Sony camera strap"
+            self.stove.description = "Mirrorless camera strap"
+            self.stove.category = self.sony.category
+            self.stove.save()
+            # Old neighbors keep serving until the transaction commits.
+            self.assertEqual(self._similar(self.stove)[0], self.tent.id)
+        self.assertIn(self.sony.id, self._similar(self.stove)[:2])
+        # The edited listing was merged into its new neighbors' lists.
+        self.assertIn(self.stove.id, self._similar(self.sony))
+
+        # New listings get neighbors the same way.
+        with self.captureOnCommitCallbacks(execute=True):
+            strap = Listing.objects.create(
+                owner=self.stove.owner, title="Sony strap", description="Camera strap",
+                category=self.sony.category, price_per_day=Decimal("5.00"),
+            )
+        self.assertTrue(SimilarListing.objects.filter(listing=strap).exists())
+
+    def test_other_edits_keep_neighbors(self):
+        from . import similarity
+        from .models import SimilarListing
+
+        similarity.rebuild()
+        rows = set(SimilarListing.objects.filter(listing=self.tent).values_list("pk", flat=True))
+        with self.captureOnCommitCallbacks() as callbacks:
+            tent = Listing.objects.get(pk=self.tent.pk)
+            tent.is_active = False
+            tent.latitude, tent.longitude = 24.7, 46.7
+            tent.save()
+            tent.is_active = True
+            tent.save()
+        self.assertFalse(any("schedule_refresh" in callback.__qualname__ for callback in callbacks))
+        self.assertEqual(
+            set(SimilarListing.objects.filter(listing=self.tent).values_list("pk", flat=True)), rows
+        )
+
+    def test_neighbors_are_a_single_lookup(self):
+        from . import similarity
+
+        similarity.rebuild()
+        with CaptureQueriesContext(connection) as queries:
+            self._similar(self.sony)
+        lookups = [q for q in queries.captured_queries if "similarlisting" in q["sql"]]
+        self.assertEqual(len(lookups), 1)
+
+    def test_lookup_hides_inactive_and_missing(self):
+        from . import similarity
+
+        similarity.rebuild()
+        Listing.objects.filter(pk=self.canon.pk).update(is_active=False)
+        self.assertNotIn(self.canon.id, self._similar(self.sony))
+        response = self.client.get("/api/listings/99999/similar/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(
+    STORAGES={
+        "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    }
+)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.client = APIClient()
+        self.owner = User.objects.create_user(
+            email="condowner@example.com", username="condowner", password="testpass"
+        )
+        self.fan = User.objects.create_user(
+            email="condfan@example.com", username="condfan", password="testpass"
+        )
+        self.listing = Listing.objects.create(
+            owner=self.owner, title="Drill", description="Cordless", price_per_day=Decimal("12.00")
+        )
+
+    def _revalidate(self, url):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertIn("ETag", first)
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        return first, second, len(ctx.captured_queries)
+
+    def test_listing_detail_304_and_invalidation(self):
+        url = f"/api/listings/{self.listing.id}/"
+        first, second, queries = self._revalidate(url)
+        self.assertIn("Last-Modified", first)
+        self.assertEqual(second.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(second.content, b"")
+        self.assertEqual(queries, 1)
+
+        # Favorites, reviews and images all change the detail payload.
+        Favorite.objects.create(user=self.fan, listing=self.listing)
+        third = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(third.status_code, status.HTTP_200_OK)
+        self.assertEqual(third.data["favorites_count"], 1)
+        Review.objects.create(user=self.fan, listing=self.listing, rating=4)
+        fourth = self.client.get(url, HTTP_IF_NONE_MATCH=third["ETag"])
+        self.assertEqual(fourth.status_code, status.HTTP_200_OK)
+
+    def test_listing_detail_follows_embedded_profiles(self):
+        from .models import ChatRoom, Message
+
+        url = f"/api/listings/{self.listing.id}/"
+        first = self.client.get(url)
+        # A message to the owner changes their response stats on the page.
+        room = ChatRoom.objects.create()
+        room.participants.add(self.owner, self.fan)
+        Message.objects.create(room=room, sender=self.fan, text="Is it free?")
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+
+        # If-Modified-Since agrees with the ETag.
+        since = second["Last-Modified"]
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code,
+            status.HTTP_304_NOT_MODIFIED,
+        )
+        User.objects.filter(pk=self.owner.pk).update(
+            profile_updated_at=timezone.now() + timedelta(seconds=5)
+        )
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=second["ETag"]).status_code, 200)
+
+    def test_listing_detail_etag_is_per_viewer(self):
+        url = f"/api/listings/{self.listing.id}/"
+        anonymous = self.client.get(url)
+        self.client.force_authenticate(self.fan)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=anonymous["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_categories_304_until_changed(self):
+        tools = Category.objects.create(name="Cond tools")
+        first, second, queries = self._revalidate("/api/categories/")
+        self.assertEqual(second.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(queries, 1)
+        garden = Category.objects.create(name="Cond garden")
+        third = self.client.get("/api/categories/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(third.status_code, status.HTTP_200_OK)
+
+        # Edits and deletions move the validator too.
+        tools.icon = "wrench"
+        tools.save()
+        fourth = self.client.get("/api/categories/", HTTP_IF_NONE_MATCH=third["ETag"])
+        self.assertEqual(fourth.status_code, status.HTTP_200_OK)
+        tools.delete()
+        fifth = self.client.get("/api/categories/", HTTP_IF_NONE_MATCH=fourth["ETag"])
+        self.assertEqual(fifth.status_code, status.HTTP_200_OK)
+        self.assertEqual([row["id"] for row in fifth.data], [garden.id])
+
+    def test_blog_post_304_until_edited(self):
+        from .models import BlogPost
+
+        post = BlogPost.objects.create(
+            title="Renting tips", excerpt="e", content="c", author=self.owner, published=True
+        )
+        url = f"/api/blog/{post.id}/"
+        first, second, queries = self._revalidate(url)
+        self.assertEqual(second.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(queries, 1)
+        BlogPost.objects.filter(pk=post.pk).update(updated_at=timezone.now() + timedelta(seconds=5))
+        third = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(third.status_code, status.HTTP_200_OK)
+
+
+@override_settings(
+    STORAGES={
+        "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    }
+)
+class ListingBatchTests(TestCase):
+    def setUp(self):
+        from .models import BlockedUser
+
+        self.client = APIClient()
+        self.me = User.objects.create_user(
+            email="batchme@example.com", username="batchme", password="testpass"
+        )
+        other = User.objects.create_user(
+            email="batchother@example.com", username="batchother", password="testpass"
+        )
+        blocker = User.objects.create_user(
+            email="batchblocker@example.com", username="batchblocker", password="testpass"
+        )
+        BlockedUser.objects.create(blocker=blocker, blocked=self.me)
+
+        def create(owner, title, **extra):
+            listing = Listing.objects.create(
+                owner=owner, title=title, description="d", price_per_day=Decimal("10.00"), **extra
+            )
+            ListingImage.objects.create(listing=listing, image=f"listing_images/{title}.jpg")
+            return listing
+
+        self.public = [create(other, f"batch{i}") for i in range(5)]
+        self.my_hidden = create(self.me, "mine", is_active=False)
+        self.other_hidden = create(other, "theirs", is_active=False)
+        self.blocked = create(blocker, "blocked")
+
+    def test_returns_requested_order_and_reports_missing(self):
+        self.client.force_authenticate(self.me)
+        ids = [
+            self.public[3].id, self.my_hidden.id, 99999,
+            self.other_hidden.id, self.blocked.id, self.public[0].id,
+        ]
+        response = self.client.get("/api/listings/batch/", {"ids": ",".join(map(str, ids))})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [row["id"] for row in response.data["results"]],
+            [self.public[3].id, self.my_hidden.id, self.public[0].id],
+        )
+        self.assertEqual(response.data["missing"], [99999, self.other_hidden.id, self.blocked.id])
+
+    def test_query_count_does_not_grow_with_ids(self):
+        def count(listings):
+            ids = ",".join(str(listing.id) for listing in listings)
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get("/api/listings/batch/", {"ids": ids, "view": "card"})
+            self.assertEqual(len(response.data["results"]), len(listings))
+            return len(ctx.captured_queries)
+
+        self.assertEqual(count(self.public[:1]), count(self.public))
+
+    def test_rejects_bad_and_oversized_requests(self):
+        self.assertEqual(
+            self.client.get("/api/listings/batch/", {"ids": "1,x"}).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+        self.assertEqual(
+            self.client.get("/api/listings/batch/").status_code, status.HTTP_400_BAD_REQUEST
+        )
+        too_many = ",".join(str(i) for i in range(1, 52))
+        self.assertEqual(
+            self.client.get("/api/listings/batch/", {"ids": too_many}).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+
+class ListingImagePipelineTests(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        storage_settings = override_settings(
+            MEDIA_ROOT=media_root,
+            STORAGES={
+                "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+                "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+            },
+        )
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+
+        self.client = APIClient()
+        owner = User.objects.create_user(
+            email="photos@example.com", username="photos", password="testpass"
+        )
+        self.listing = Listing.objects.create(
+            owner=owner, title="Tent", description="d", price_per_day=Decimal("10.00")
+        )
+
+    def _upload(self, size=(2000, 1000), orientation=None, name="photo.jpg"):
+        import io
+
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+
+        exif = Image.Exif()
+        exif[0x010F] = "CameraMaker"
+        if orientation:
+            exif[0x0112] = orientation
+        buffer = io.BytesIO()
+        Image.new("RGB", size, (200, 30, 30)).save(buffer, format="JPEG", exif=exif)
+        upload = SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+        return ListingImage.objects.create(listing=self.listing, image=upload)
+
+    def _open(self, name):
+        from django.core.files.storage import default_storage
+        from PIL import Image
+
+        with default_storage.open(name) as handle:
+            img = Image.open(handle)
+            img.load()
+        return img
+
+    def test_worker_renders_variants_strips_exif_and_records_dimensions(self):
+        from . import images
+
+        image = self._upload(orientation=6)  # stored sideways: 2000x1000, shown 1000x2000
+        self.assertEqual(image.processing_status, ListingImage.ProcessingStatus.PENDING)
+
+        self.assertEqual(images.run_pending(), {"ready": 1, "retry": 0, "failed": 0})
+        image.refresh_from_db()
+        self.assertEqual(image.processing_status, ListingImage.ProcessingStatus.READY)
+        self.assertEqual((image.width, image.height), (1000, 2000))
+        self.assertEqual(len(self._open(image.image.name).getexif()), 0)
+        for variant, max_edge in images.VARIANTS:
+            entry = image.variants[variant]
+            self.assertEqual(max(entry["width"], entry["height"]), max_edge)
+            self.assertLess(entry["width"], entry["height"])
+            for key, pil_format in (("jpeg", "JPEG"), ("webp", "WEBP")):
+                derived = self._open(entry[key])
+                self.assertEqual(derived.format, pil_format)
+                self.assertEqual(derived.size, (entry["width"], entry["height"]))
+                self.assertEqual(len(derived.getexif()), 0)
+
+        response = self.client.get(f"/api/listings/{self.listing.id}/")
+        payload = response.data["images"][0]
+        self.assertEqual((payload["width"], payload["height"]), (1000, 2000))
+        self.assertIn(" 320w, ", payload["srcset"])
+        self.assertTrue(payload["srcset_webp"].endswith(" 800w"))
+
+    def test_small_images_are_not_upscaled_and_unprocessed_ones_serve_the_original(self):
+        from . import images
+
+        image = self._upload(size=(400, 300))
+        response = self.client.get(f"/api/listings/{self.listing.id}/")
+        self.assertEqual(response.data["images"][0]["srcset"], "")
+
+        images.run_pending()
+        image.refresh_from_db()
+        self.assertEqual(image.variants["thumb"]["width"], 320)
+        self.assertEqual(image.variants["card"]["width"], 400)
+        self.assertEqual(image.variants["full"]["width"], 400)
+
+        response = self.client.get("/api/listings/", {"view": "card"})
+        self.assertIn(image.variants["card"]["jpeg"], response.data["results"][0]["cover_image"])
+
+    def test_broken_uploads_are_retried_then_failed(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        from . import images
+
+        image = ListingImage.objects.create(
+            listing=self.listing, image=SimpleUploadedFile("broken.jpg", b"not an image")
+        )
+        with self.assertLogs("marketplace.images", level="ERROR"):
+            outcomes = [images.run_pending() for _ in range(images.MAX_ATTEMPTS)]
+        self.assertEqual([o["retry"] for o in outcomes], [1] * (images.MAX_ATTEMPTS - 1) + [0])
+        self.assertEqual(outcomes[-1]["failed"], 1)
+        image.refresh_from_db()
+        self.assertEqual(image.processing_status, ListingImage.ProcessingStatus.FAILED)
+        self.assertEqual(images.run_pending(), {"ready": 0, "retry": 0, "failed": 0})
+
+    def test_stale_claims_are_taken_over(self):
+        from . import images
+
+        image = self._upload()
+        ListingImage.objects.filter(pk=image.pk).update(
+            processing_status=ListingImage.ProcessingStatus.PROCESSING,
+            processing_started_at=timezone.now(),
+        )
+        self.assertEqual(images.claim(10), [])
+
+        ListingImage.objects.filter(pk=image.pk).update(
+            processing_started_at=timezone.now() - images.STALE_AFTER - timedelta(seconds=1)
+        )
+        self.assertEqual(images.run_pending()["ready"], 1)
+
+
+class DirectUploadTests(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        storage_settings = override_settings(
+            MEDIA_ROOT=media_root,
+            STORAGES={
+                "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+                "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+            },
+        )
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+
+        self.client = APIClient()
+        self.owner = User.objects.create_user(
+            email="uploader@example.com", username="uploader", password="testpass"
+        )
+        self.other = User.objects.create_user(
+            email="uploadpeer@example.com", username="uploadpeer", password="testpass"
+        )
+        self.client.force_authenticate(self.owner)
+
+    def _upload(
+        self,
+        kind="listing_image",
+        body=b"\xff\xd8jpeg-bytes",
+        content_type="image/jpeg",
+        filename="photo.jpg",
+        put=True,
+    ):
+        ticket = self.client.post(
+            "/api/uploads/",
+            {"kind": kind, "filename": filename, "content_type": content_type, "size": len(body)},
+            format="json",
+        )
+        self.assertEqual(ticket.status_code, status.HTTP_201_CREATED, ticket.data)
+        if put:
+            response = APIClient().generic(
+                "PUT", ticket.data["url"], body, content_type=ticket.data["headers"]["Content-Type"]
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return ticket.data
+
+    def test_listing_photos_uploaded_directly_are_attached_in_order(self):
+        from django.core.files.storage import default_storage
+
+        first, second = self._upload(), self._upload(body=b"second")
+        self.assertTrue(default_storage.exists(first["key"]))
+        response = self.client.post(
+            "/api/listings/",
+            {
+                "title": "Kayak",
+                "description": "d",
+                "price_per_day": "25.00",
+                "uploads": [second["id"], first["id"]],
+            },
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        listing = Listing.objects.get(pk=response.data["id"])
+        self.assertEqual(
+            [image.image.name for image in listing.images.all()], [second["key"], first["key"]]
+        )
+
+        # Each upload attaches once.
+        again = self.client.post(
+            f"/api/listings/{listing.id}/images/", {"uploads": [first["id"]]}, format="json"
+        )
+        self.assertEqual(again.status_code, status.HTTP_400_BAD_REQUEST)
+
+        third = self._upload(body=b"third")
+        added = self.client.post(
+            f"/api/listings/{listing.id}/images/", {"uploads": [third["id"]]}, format="json"
+        )
+        self.assertEqual(added.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(added.data[0]["position"], 2)
+
+    def test_attach_requires_the_object_and_the_uploader(self):
+        not_sent = self._upload(put=False)
+        listing = Listing.objects.create(
+            owner=self.owner, title="Tent", description="d", price_per_day=Decimal("10.00")
+        )
+        response = self.client.post(
+            f"/api/listings/{listing.id}/images/", {"uploads": [not_sent["id"]]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        sent = self._upload()
+        self.client.force_authenticate(self.other)
+        other_listing = Listing.objects.create(
+            owner=self.other, title="Bike", description="d", price_per_day=Decimal("10.00")
+        )
+        response = self.client.post(
+            f"/api/listings/{other_listing.id}/images/", {"uploads": [sent["id"]]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(ListingImage.objects.exists())
+
+    def test_local_target_enforces_the_ticket(self):
+        ticket = self._upload(put=False)
+        wrong_type = APIClient().generic(
+            "PUT", ticket["url"], b"\xff\xd8jpeg-bytes", content_type="text/html"
+        )
+        self.assertEqual(wrong_type.status_code, status.HTTP_400_BAD_REQUEST)
+        wrong_size = APIClient().generic("PUT", ticket["url"], b"short", content_type="image/jpeg")
+        self.assertEqual(wrong_size.status_code, status.HTTP_400_BAD_REQUEST)
+        forged = APIClient().generic(
+            "PUT", ticket["url"].replace("/local/", "/local/x"), b"\xff\xd8jpeg-bytes",
+            content_type="image/jpeg",
+        )
+        self.assertEqual(forged.status_code, status.HTTP_403_FORBIDDEN)
+
+        too_big = self.client.post(
+            "/api/uploads/",
+            {"kind": "listing_image", "content_type": "image/jpeg", "size": 100 * 1024 * 1024},
+            format="json",
+        )
+        self.assertEqual(too_big.status_code, status.HTTP_400_BAD_REQUEST)
+        not_image = self.client.post(
+            "/api/uploads/",
+            {"kind": "listing_image", "content_type": "application/pdf", "size": 10},
+            format="json",
+        )
+        self.assertEqual(not_image.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_chat_attachment_uploaded_directly(self):
+        from .models import ChatRoom
+
+        room = ChatRoom.objects.create()
+        room.participants.add(self.owner, self.other)
+        ticket = self._upload(
+            kind="chat_file",
+            body=b"%PDF-1.4",
+            content_type="application/pdf",
+            filename="../lease agreement.pdf",
+        )
+        response = self.client.post(
+            "/api/chat/messages/", {"room": room.id, "upload": ticket["id"]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(response.data["file_name"], "lease_agreement.pdf")
+        self.assertTrue(response.data["file_url"].endswith(ticket["key"]))
+
+    def test_expired_uploads_are_purged_with_their_objects(self):
+        from django.core.files.storage import default_storage
+
+        from . import uploads
+        from .models import DirectUpload
+
+        ticket = self._upload()
+        self.assertEqual(uploads.purge_expired(), 0)
+        self.assertEqual(uploads.purge_expired(now=timezone.now() + timedelta(hours=1)), 1)
+        self.assertFalse(default_storage.exists(ticket["key"]))
+        self.assertFalse(DirectUpload.objects.exists())
+
+    @override_settings(
+        STORAGES={
+            "default": {
+                "BACKEND": "helpers.cloudflare.storages.MediaFileStorage",
+                "OPTIONS": {
+                    "bucket_name": "media-bucket",
+                    "access_key": "key",
+                    "secret_key": "secret",
+                    "endpoint_url": "http://127.0.0.1:9000",
+                    "signature_version": "s3v4",
+                },
+            },
+            "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+        }
+    )
+    def test_s3_storage_gets_a_presigned_put(self):
+        from urllib.parse import parse_qs, urlparse
+
+        ticket = self._upload(put=False)
+        url = urlparse(ticket["url"])
+        self.assertEqual(url.netloc, "127.0.0.1:9000")
+        self.assertEqual(url.path, f"/media-bucket/media/{ticket['key']}")
+        query = parse_qs(url.query)
+        self.assertEqual(query["X-Amz-SignedHeaders"], ["content-length;content-type;host"])
+        self.assertEqual(query["X-Amz-Expires"], ["900"])
+
+
+class SlowStorage(FileSystemStorage):
+    """FileSystemStorage with a per-write delay that records write concurrency."""
+
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+
+    def _save(self, name, content):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        try:
+            time.sleep(0.05)
+            if "broken" in name or "broken" in (content.name or ""):
+                raise OSError("storage unavailable")
+            return super()._save(name, content)
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+
+class ListingImageUploadTests(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        storage_settings = override_settings(
+            MEDIA_ROOT=self.media_root,
+            UPLOAD_STORAGE_WORKERS=3,
+            STORAGES={
+                "default": {"BACKEND": "marketplace.test_views.SlowStorage"},
+                "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+            },
+        )
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+        SlowStorage.peak = 0
+
+        self.client = APIClient()
+        self.owner = User.objects.create_user(
+            email="gallery@example.com", username="gallery", password="testpass"
+        )
+        self.client.force_authenticate(self.owner)
+
+    def _post(self, names):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        files = [
+            SimpleUploadedFile(name, b"\xff\xd8" + name.encode(), "image/jpeg") for name in names
+        ]
+        return self.client.post(
+            "/api/listings/",
+            {"title": "Drone", "description": "d", "price_per_day": "40.00", "images": files},
+            format="multipart",
+        )
+
+    def _stored_files(self):
+        import os
+
+        return [name for _, _, files in os.walk(self.media_root) for name in files]
+
+    def test_images_are_stored_concurrently_and_inserted_in_one_query(self):
+        names = [f"photo{i}.jpg" for i in range(6)]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self._post(names)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(SlowStorage.peak, 3)
+
+        images = list(ListingImage.objects.filter(listing_id=response.data["id"]))
+        self.assertEqual([image.position for image in images], list(range(6)))
+        self.assertEqual(
+            [image.blob.sha256 for image in images],
+            [hashlib.sha256(b"\xff\xd8" + name.encode()).hexdigest() for name in names],
+        )
+        self.assertEqual([image.image.name for image in images], [i.blob.name for i in images])
+        inserts = [
+            q for q in ctx.captured_queries
+            if q["sql"].startswith("INSERT") and "marketplace_listingimage" in q["sql"]
+        ]
+        self.assertEqual(len(inserts), 1)
+
+    def test_failed_upload_creates_nothing_and_leaves_files_to_the_collector(self):
+        with self.assertLogs("marketplace.views", level="ERROR"):
+            response = self._post(["one.jpg", "broken.jpg", "three.jpg"])
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertFalse(Listing.objects.exists())
+        self.assertFalse(ListingImage.objects.exists())
+        # What was written is unreferenced and goes with the next collection.
+        self.assertEqual(len(self._stored_files()), 2)
+        with override_settings(MEDIA_BLOB_GRACE_HOURS=0):
+            self.assertEqual(blobs.collect_garbage()["blobs"], 2)
+        self.assertEqual(self._stored_files(), [])
+
+
+class MediaBlobTests(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        storage_settings = override_settings(
+            MEDIA_ROOT=self.media_root,
+            STORAGES={
+                "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+                "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+            },
+        )
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+
+        self.client = APIClient()
+        self.owner = User.objects.create_user(
+            email="blobs@example.com", username="blobs", password="testpass"
+        )
+        self.client.force_authenticate(self.owner)
+
+    def _photo(self, color=(10, 120, 200), exif=False, name="photo.jpg"):
+        import io
+
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        extra = {}
+        if exif:
+            tags = Image.Exif()
+            tags[0x010F] = "CameraMaker"
+            extra["exif"] = tags
+        Image.new("RGB", (40, 30), color).save(buffer, format="JPEG", **extra)
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+    def _create_listing(self, *photos):
+        response = self.client.post(
+            "/api/listings/",
+            {
+                "title": "Canoe",
+                "description": "d",
+                "price_per_day": "30.00",
+                "images": list(photos),
+            },
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        return Listing.objects.get(pk=response.data["id"])
+
+    def _stored_files(self):
+        import os
+
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.media_root)
+            for root, _, files in os.walk(self.media_root)
+            for name in files
+        )
+
+    def test_same_photo_on_several_listings_is_stored_once(self):
+        from .models import MediaBlob
+
+        first = self._create_listing(self._photo(), self._photo(color=(0, 0, 0)))
+        second = self._create_listing(self._photo(name="again.jpg"))
+        self.assertEqual(MediaBlob.objects.count(), 2)
+        self.assertEqual(len(self._stored_files()), 2)
+        self.assertEqual(first.images.first().blob_id, second.images.get().blob_id)
+
+    def test_chat_images_keep_private_names(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        from .models import ChatRoom, MediaBlob, Message
+
+        peer = User.objects.create_user(email="blobpeer@example.com", username="blobpeer")
+        room = ChatRoom.objects.create()
+        room.participants.add(self.owner, peer)
+        for _ in range(2):
+            response = self.client.post(
+                "/api/chat/messages/", {"room": room.id, "image": self._photo()}, format="multipart"
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        images = [message.image.name for message in Message.objects.all()]
+        # Same bytes, separate random objects: nothing is derived from the content.
+        self.assertEqual(len(set(images)), 2)
+        self.assertFalse(any("photo" in name or name.startswith(blobs.PREFIX) for name in images))
+        self.assertFalse(MediaBlob.objects.exists())
+
+        document = SimpleUploadedFile("lease.pdf", b"%PDF-1.4", content_type="application/pdf")
+        response = self.client.post(
+            "/api/chat/messages/", {"room": room.id, "file": document}, format="multipart"
+        )
+        self.assertEqual(response.data["file_name"], "lease.pdf")
+
+    def test_known_listing_photo_skips_the_direct_upload(self):
+        from . import uploads
+
+        photo = self._photo()
+        blob = self._create_listing(photo).images.get().blob
+        photo.seek(0)
+        ticket = self.client.post(
+            "/api/uploads/",
+            {
+                "kind": "listing_image",
+                "content_type": "image/jpeg",
+                "size": photo.size,
+                "sha256": hashlib.sha256(photo.read()).hexdigest(),
+            },
+            format="json",
+        ).data
+        self.assertIsNone(ticket["url"])
+        self.assertEqual(ticket["key"], blob.name)
+
+        listing = Listing.objects.create(
+            owner=self.owner, title="Raft", description="d", price_per_day=Decimal("10.00")
+        )
+        response = self.client.post(
+            f"/api/listings/{listing.id}/images/", {"uploads": [ticket["id"]]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(listing.images.get().blob_id, blob.pk)
+
+        # An unused shortcut ticket must not delete the shared object when purged.
+        unused = self.client.post(
+            "/api/uploads/",
+            {
+                "kind": "listing_image",
+                "content_type": "image/jpeg",
+                "size": blob.size,
+                "sha256": blob.sha256,
+            },
+            format="json",
+        ).data
+        self.assertIsNone(unused["url"])
+        self.assertEqual(uploads.purge_expired(now=timezone.now() + timedelta(hours=1)), 1)
+        self.assertIn(blob.name, self._stored_files())
+
+    def test_direct_uploads_are_hashed_later_and_duplicates_dropped(self):
+        from django.core.files.storage import default_storage
+
+        photo = self._photo()
+        blob = self._create_listing(photo).images.get().blob
+        photo.seek(0)
+        copy_name = default_storage.save("listing_images/direct-copy.jpg", photo)
+        listing = Listing.objects.create(
+            owner=self.owner, title="Raft", description="d", price_per_day=Decimal("10.00")
+        )
+        image = ListingImage.objects.create(listing=listing, image=copy_name)
+
+        self.assertEqual(blobs.adopt_pending(), {"hashed": 1, "deduplicated": 1, "errors": 0})
+        image.refresh_from_db()
+        self.assertEqual((image.blob_id, image.image.name), (blob.pk, blob.name))
+        self.assertNotIn(copy_name, self._stored_files())
+
+    def test_collector_removes_only_unreferenced_blobs_past_the_grace_period(self):
+        from .models import MediaBlob
+
+        keep = self._create_listing(self._photo())
+        drop = self._create_listing(self._photo(color=(0, 0, 0)))
+        dropped = drop.images.get().blob
+        drop.delete()
+
+        self.assertEqual(blobs.collect_garbage()["blobs"], 0)
+        later = timezone.now() + blobs.grace_period() + timedelta(minutes=1)
+        self.assertEqual(blobs.collect_garbage(now=later), {"blobs": 1, "bytes": dropped.size})
+        self.assertEqual(list(MediaBlob.objects.all()), [keep.images.get().blob])
+        self.assertEqual(self._stored_files(), [keep.images.get().blob.name])
+
+    def test_collector_keeps_objects_older_messages_still_name(self):
+        from .models import ChatRoom, Message
+
+        listing = self._create_listing(self._photo())
+        shared = listing.images.get().blob
+        room = ChatRoom.objects.create()
+        room.participants.add(self.owner)
+        # Sent while chat images were still deduplicated.
+        Message.objects.create(room=room, sender=self.owner, image=shared.name)
+        listing.delete()
+
+        later = timezone.now() + blobs.grace_period() + timedelta(minutes=1)
+        self.assertEqual(blobs.collect_garbage(now=later)["blobs"], 0)
+        self.assertIn(shared.name, self._stored_files())
+
+    def test_stripping_exif_from_a_shared_photo_does_not_touch_the_other_copy(self):
+        from . import images
+
+        first = self._create_listing(self._photo(exif=True)).images.get()
+        second = self._create_listing(self._photo(exif=True)).images.get()
+        shared = first.blob
+        ListingImage.objects.filter(pk=second.pk).update(
+            processing_status=ListingImage.ProcessingStatus.READY
+        )
+
+        self.assertEqual(images.run_pending()["ready"], 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertNotEqual(first.blob_id, shared.pk)
+        self.assertEqual(second.blob_id, shared.pk)
+        self.assertIn(shared.name, self._stored_files())
+
+
+class ListingImportTests(TestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        storage_settings = override_settings(
+            MEDIA_ROOT=self.media_root,
+            STORAGES={
+                "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+                "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+            },
+        )
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+
+        self.client = APIClient()
+        self.owner = User.objects.create_user(
+            email="importer@example.com", username="importer", password="testpass"
+        )
+        self.client.force_authenticate(self.owner)
+        self.category = Category.objects.create(name="Kayaks")
+
+    def _archive(self, **photos):
+        import io
+        import zipfile
+
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            for name, color in photos.items():
+                photo = io.BytesIO()
+                Image.new("RGB", (40, 30), color).save(photo, format="JPEG")
+                archive.writestr(f"photos/{name}.jpg", photo.getvalue())
+        return SimpleUploadedFile("photos.zip", buffer.getvalue(), content_type="application/zip")
+
+    def _import(self, name, content, **files):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        manifest = SimpleUploadedFile(name, content.encode(), content_type="text/plain")
+        return self.client.post(
+            "/api/listings/import/", {"manifest": manifest, **files}, format="multipart"
+        )
+
+    def test_csv_import_reports_each_row_and_attaches_photos(self):
+        manifest = (
+            "title,description,price_per_day,category,city,images\n"
+            "Sea kayak,Two seats,45.00,kayaks,Riyadh,photos/red.jpg|photos/blue.jpg\n"
+            "No price,d,,Kayaks,,\n"
+            "River kayak,One seat,30.00,,,photos/red.jpg\n"
+            "Ghost photo,d,10.00,,,photos/missing.jpg\n"
+        )
+        response = self._import(
+            "catalog.csv", manifest, images=self._archive(red=(200, 0, 0), blue=(0, 0, 200))
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(response.data["failed"], 2)
+        rows = response.data["rows"]
+        self.assertEqual([entry["row"] for entry in rows], [1, 2, 3, 4])
+        self.assertIn("price_per_day", rows[1]["errors"])
+        # Rows without photos are rejected, as on the regular create path.
+        self.assertEqual(rows[1]["errors"]["images"], ["At least one image is required"])
+        self.assertIn("images", rows[3]["errors"])
+
+        sea = Listing.objects.get(pk=rows[0]["id"])
+        self.assertEqual(sea.owner, self.owner)
+        self.assertEqual(sea.category, self.category)
+        self.assertTrue(sea.is_active)
+        self.assertEqual(list(sea.images.order_by("position").values_list("position", flat=True)), [0, 1])
+        river = Listing.objects.get(pk=rows[2]["id"])
+        # The same photo in two rows is stored once.
+        self.assertEqual(river.images.get().blob, sea.images.get(position=0).blob)
+        self.assertEqual(blobs.MediaBlob.objects.count(), 2)
+        self.assertEqual(
+            set(ListingImage.objects.values_list("processing_status", flat=True)),
+            {ListingImage.ProcessingStatus.PENDING},
+        )
+
+        # Imported listings are searchable although bulk_create sends no signals.
+        response = self.client.get("/api/listings/", {"search": "kayak"})
+        found = {item["id"] for item in response.data["results"]}
+        self.assertEqual(found, {sea.pk, river.pk})
+
+    def test_jsonl_import_reports_unreadable_lines(self):
+        manifest = (
+            '{"title": "Tent", "description": "d", "price_per_day": "12.50",'
+            ' "latitude": 24.7, "longitude": 46.6, "images": ["photos/tent.jpg"]}\n'
+            "\n"
+            "not json\n"
+            '{"title": "Half a point", "description": "d", "price_per_day": "5", "latitude": 1,'
+            ' "images": ["photos/tent.jpg"]}\n'
+        )
+        response = self._import("catalog.jsonl", manifest, images=self._archive(tent=(0, 90, 0)))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual(response.data["created"], 1)
+        rows = response.data["rows"]
+        self.assertIn("non_field_errors", rows[1]["errors"])
+        self.assertIn("non_field_errors", rows[2]["errors"])
+        tent = Listing.objects.get(pk=rows[0]["id"])
+        # Coordinates are jittered and geohashed like on save().
+        self.assertTrue(tent.geohash)
+        self.assertNotEqual(tent.latitude, Decimal("24.7"))
+
+    def test_rejects_unknown_manifest_format_and_enforces_row_limit(self):
+        response = self._import("catalog.xlsx", "title\n")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        manifest = "title,description,price_per_day,images\n" + "Lamp,d,3,photos/lamp.jpg\n" * 3
+        with override_settings(LISTING_IMPORT_MAX_ROWS=2):
+            response = self._import("catalog.csv", manifest, images=self._archive(lamp=(9, 9, 9)))
+        self.assertTrue(response.data["truncated"])
+        self.assertEqual(response.data["created"], 2)
+
+    def test_query_count_does_not_grow_with_rows_in_a_chunk(self):
+        import io
+
+        from . import bulk_import
+
+        def run(rows):
+            manifest = io.BytesIO(
+                (
+                    "title,description,price_per_day,images\n"
+                    + "Lamp,d,3,photos/lamp.jpg\n" * rows
+                ).encode()
+            )
+            archive = self._archive(lamp=(9, 9, 9))
+            with CaptureQueriesContext(connection) as queries:
+                report = bulk_import.run(self.owner, manifest, "catalog.csv", archive_file=archive)
+            self.assertEqual(report["created"], rows)
+            return len(queries)
+
+        run(1)  # stores the photo; later runs find it
+        self.assertEqual(run(3), run(30))
+
+
+class ListingBulkUpdateTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.owner = User.objects.create_user(
+            email="bulkowner@example.com", username="bulkowner", password="testpass"
+        )
+        self.other = User.objects.create_user(
+            email="bulkother@example.com", username="bulkother", password="testpass"
+        )
+        self.client.force_authenticate(self.owner)
+        self.bikes = Category.objects.create(name="Bulk bikes")
+        self.boats = Category.objects.create(name="Bulk boats")
+
+        def create(owner, title, price, category=None, is_active=True):
+            return Listing.objects.create(
+                owner=owner, title=title, description="d", price_per_day=Decimal(price),
+                category=category, is_active=is_active,
+            )
+
+        self.bike = create(self.owner, "City bike", "20.00", self.bikes)
+        self.ebike = create(self.owner, "E-bike", "33.33", self.bikes)
+        self.canoe = create(self.owner, "Canoe", "50.00", self.boats)
+        self.foreign = create(self.other, "Someone's bike", "20.00", self.bikes)
+
+    def _bulk(self, body):
+        return self.client.post("/api/listings/bulk-update/", body, format="json")
+
+    def _prices(self):
+        return dict(Listing.objects.values_list("pk", "price_per_day"))
+
+    def test_percentage_price_change_is_one_update_scoped_to_owner(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self._bulk({"filter": {"category": self.bikes.pk}, "price_percent": "10"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual(response.data, {"updated": 2, "ids": [self.bike.pk, self.ebike.pk]})
+        prices = self._prices()
+        self.assertEqual(prices[self.bike.pk], Decimal("22.00"))
+        self.assertEqual(prices[self.ebike.pk], Decimal("36.66"))
+        self.assertEqual(prices[self.canoe.pk], Decimal("50.00"))
+        self.assertEqual(prices[self.foreign.pk], Decimal("20.00"))
+        updates = [q["sql"] for q in queries.captured_queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len([sql for sql in updates if "marketplace_listing" in sql]), 1)
+
+    def test_pause_whole_catalog_and_move_category(self):
+        before = Listing.objects.get(pk=self.canoe.pk).updated_at
+        response = self._bulk({"is_active": False})
+        self.assertEqual(response.data["updated"], 3)
+        self.assertFalse(Listing.objects.filter(owner=self.owner, is_active=True).exists())
+        self.assertTrue(Listing.objects.get(pk=self.foreign.pk).is_active)
+        self.assertGreater(Listing.objects.get(pk=self.canoe.pk).updated_at, before)
+
+        response = self._bulk(
+            {"filter": {"ids": [self.bike.pk, self.foreign.pk]}, "category": self.boats.pk}
+        )
+        self.assertEqual(response.data, {"updated": 1, "ids": [self.bike.pk]})
+        self.assertEqual(Listing.objects.get(pk=self.bike.pk).category, self.boats)
+        self.assertEqual(Listing.objects.get(pk=self.foreign.pk).category, self.bikes)
+
+    def test_changes_invalidate_cached_pages_and_similar_listings(self):
+        from . import similarity
+        from .models import SimilarListing
+
+        similarity.rebuild()
+        rows = set(SimilarListing.objects.filter(listing=self.canoe).values_list("pk", flat=True))
+        self.client.force_authenticate(None)
+        self.client.get("/api/listings/")  # cached
+        self.client.force_authenticate(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            self._bulk({"filter": {"ids": [self.canoe.pk]}, "price_amount": "-15.50"})
+
+        # Recomputed (rows rewritten) after commit, never left empty.
+        refreshed = set(SimilarListing.objects.filter(listing=self.canoe).values_list("pk", flat=True))
+        self.assertTrue(refreshed)
+        self.assertFalse(rows & refreshed)
+        self.client.force_authenticate(None)
+        results = self.client.get("/api/listings/").data["results"]
+        canoe = next(item for item in results if item["id"] == self.canoe.pk)
+        self.assertEqual(Decimal(canoe["price_per_day"]), Decimal("34.50"))
+
+    def test_rejects_out_of_range_prices_and_empty_changes(self):
+        response = self._bulk({"price_amount": "-25.00"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._prices()[self.bike.pk], Decimal("20.00"))
+
+        self.assertEqual(self._bulk({"filter": {"is_active": True}}).status_code, 400)
+        response = self._bulk({"price_percent": "5", "price_amount": "1"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self._bulk({"filter": {"ids": []}, "is_active": False})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ListingCalendarEndpointTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.owner = User.objects.create_user(
+            email="calowner@example.com", username="calowner", password="testpass"
+        )
+        self.renter = User.objects.create_user(
+            email="calrenter@example.com", username="calrenter", password="testpass"
+        )
+        self.listing = Listing.objects.create(
+            owner=self.owner, title="Drone", description="d", price_per_day=Decimal("40.00")
+        )
+        self.today = timezone.localdate()
+        for first, last in ((3, 5), (4, 7)):
+            Booking.objects.create(
+                listing=self.listing, renter=self.renter, start_date=self.day(first),
+                end_date=self.day(last), total_price=Decimal("1.00"),
+            )
+        AvailabilityBlock.objects.create(
+            listing=self.listing, start_date=self.day(12), end_date=self.day(13), reason="Repair"
+        )
+
+    def day(self, n):
+        return self.today + timedelta(days=n)
+
+    def test_availability_returns_merged_ranges(self):
+        response = self.client.get(f"/api/listings/{self.listing.pk}/availability/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["booked_ranges"], [{"start": str(self.day(3)), "end": str(self.day(7))}]
+        )
+        self.assertEqual(response.data["blocked_ranges"][0]["reason"], "Repair")
+        self.assertEqual(len(response.data["unavailable_ranges"]), 2)
+
+    def test_free_windows(self):
+        url = f"/api/listings/{self.listing.pk}/availability/free-windows/"
+        response = self.client.get(url, {"limit": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["windows"],
+            [
+                {"start": str(self.day(0)), "end": str(self.day(2)), "days": 3},
+                {"start": str(self.day(8)), "end": str(self.day(11)), "days": 4},
+            ],
+        )
+        response = self.client.get(url, {"min_days": 5, "limit": 1, "from": str(self.day(1))})
+        self.assertEqual(response.data["windows"][0]["start"], str(self.day(14)))
+        self.assertEqual(self.client.get(url, {"limit": 500}).status_code, 400)
+
+    def test_bookings_and_blocks_respect_each_other(self):
+        self.client.force_authenticate(self.renter)
+        response = self.client.post(
+            "/api/bookings/",
+            {"listing": self.listing.pk, "start_date": str(self.day(13)), "end_date": str(self.day(15))},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        response = self.client.post(
+            "/api/bookings/",
+            {"listing": self.listing.pk, "start_date": str(self.day(8)), "end_date": str(self.day(11))},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+
+        self.client.force_authenticate(self.owner)
+        url = f"/api/listings/{self.listing.pk}/availability-blocks/"
+        response = self.client.post(
+            url, {"start_date": str(self.day(11)), "end_date": str(self.day(11))}, format="json"
+        )
+        self.assertIn("booking", response.data["detail"])
+        response = self.client.post(
+            url, {"start_date": str(self.day(13)), "end_date": str(self.day(14))}, format="json"
+        )
+        self.assertIn("availability block", response.data["detail"])
+        response = self.client.post(
+            url, {"start_date": str(self.day(20)), "end_date": str(self.day(21))}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+class ListingBatchCalendarTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        owner = User.objects.create_user(
+            email="mcalowner@example.com", username="mcalowner", password="testpass"
+        )
+        renter = User.objects.create_user(
+            email="mcalrenter@example.com", username="mcalrenter", password="testpass"
+        )
+        self.start = timezone.localdate() + timedelta(days=1)
+        self.busy, self.free, self.hidden = (
+            Listing.objects.create(
+                owner=owner, title=title, description="d", price_per_day=Decimal("10.00"),
+                is_active=active,
+            )
+            for title, active in (("Busy", True), ("Free", True), ("Hidden", False))
+        )
+        day = lambda n: self.start + timedelta(days=n)  # noqa: E731
+        # Starts before the horizon: clipped to offset 0.
+        Booking.objects.create(
+            listing=self.busy, renter=renter, start_date=day(-3), end_date=day(1),
+            total_price=Decimal("1.00"),
+        )
+        AvailabilityBlock.objects.create(listing=self.busy, start_date=day(2), end_date=day(3))
+        AvailabilityBlock.objects.create(listing=self.busy, start_date=day(9), end_date=day(40))
+
+    def _calendar(self, **params):
+        ids = ",".join(str(listing.pk) for listing in (self.busy, self.free, self.hidden))
+        return self.client.get(
+            "/api/listings/calendar/", {"ids": ids, "from": str(self.start), "days": 10, **params}
+        )
+
+    def test_runs_for_many_listings_in_one_occupancy_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self._calendar()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["listings"],
+            {str(self.busy.pk): [[0, 4], [9, 1]], str(self.free.pk): []},
+        )
+        self.assertEqual(response.data["missing"], [self.hidden.pk])
+        occupancy = [q for q in queries.captured_queries if "listingoccupancy" in q["sql"]]
+        self.assertEqual(len(occupancy), 1)
+
+    def test_bitmap_encoding(self):
+        import base64
+
+        response = self._calendar(encoding="bitmap")
+        bits = base64.b64decode(response.data["listings"][str(self.busy.pk)])
+        # Days 0-3 and 9 set, least significant bit first.
+        self.assertEqual(bits, bytes([0b00001111, 0b00000010]))
+        self.assertEqual(self._calendar(days=5000).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@skipUnless(
+    connection.vendor == "postgresql",
+    "needs concurrent connections; the SQLite test database is in-memory and shared",
+)
+class ConcurrentBookingTests(TransactionTestCase):
+    """Many renters booking at once: one winner per date range, per listing."""
+
+    def test_parallel_attempts_book_each_range_once(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        from django.db import connections
+
+        owner = User.objects.create_user(
+            email="raceowner@example.com", username="raceowner", password="testpass"
+        )
+        renters = [
+            User.objects.create_user(
+                email=f"racer{i}@example.com", username=f"racer{i}", password="testpass"
+            )
+            for i in range(8)
+        ]
+        listings = [
+            Listing.objects.create(
+                owner=owner, title=f"Race {i}", description="d", price_per_day=Decimal("10.00")
+            )
+            for i in range(10)
+        ]
+        start = timezone.localdate() + timedelta(days=5)
+        # Every renter tries two overlapping ranges on every listing.
+        ranges = [(start, start + timedelta(days=2)), (start + timedelta(days=1), start + timedelta(days=3))]
+        attempts = [
+            (renter, listing, first, last)
+            for listing in listings
+            for first, last in ranges
+            for renter in renters
+        ]
+
+        def attempt(args):
+            renter, listing, first, last = args
+            client = APIClient()
+            client.force_authenticate(renter)
+            try:
+                response = client.post(
+                    "/api/bookings/",
+                    {"listing": listing.pk, "start_date": str(first), "end_date": str(last)},
+                    format="json",
+                )
+                return response.status_code
+            finally:
+                connections.close_all()
+
+        began = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            codes = list(pool.map(attempt, attempts))
+        elapsed = time.perf_counter() - began
+
+        self.assertEqual(set(codes), {status.HTTP_201_CREATED, status.HTTP_409_CONFLICT})
+        # The two ranges overlap, so exactly one booking per listing wins.
+        self.assertEqual(codes.count(status.HTTP_201_CREATED), len(listings))
+        for listing in listings:
+            self.assertEqual(Booking.objects.filter(listing=listing).count(), 1)
+        self.assertEqual(Booking.objects.count(), len(listings))
+        logger.info("%d booking attempts in %.2fs", len(attempts), elapsed)
+
+
+class BookingCompactListTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.me = User.objects.create_user(
+            email="compactme@example.com", username="compactme", password="testpass"
+        )
+        self.host = User.objects.create_user(
+            email="compacthost@example.com", username="compacthost", password="testpass"
+        )
+        self.guest = User.objects.create_user(
+            email="compactguest@example.com", username="compactguest", password="testpass"
+        )
+        self.client.force_authenticate(self.me)
+        User.objects.filter(pk=self.host.pk).update(avatar="avatars/host.jpg")
+        today = timezone.localdate()
+
+        def listing(owner, title):
+            created = Listing.objects.create(
+                owner=owner, title=title, description="d", price_per_day=Decimal("10.00")
+            )
+            for position in (1, 0):
+                ListingImage.objects.create(
+                    listing=created, image=f"listing_images/{title}_{position}.jpg", position=position
+                )
+            return created
+
+        def book(listing, renter, offset):
+            return Booking.objects.create(
+                listing=listing, renter=renter, start_date=today + timedelta(days=offset),
+                end_date=today + timedelta(days=offset + 1), total_price=Decimal("20.00"),
+            )
+
+        mine, theirs = listing(self.me, "mine"), listing(self.host, "theirs")
+        self.rented = [book(theirs, self.me, 2 * i) for i in range(6)]
+        self.hosted = [book(mine, self.guest, 2 * i) for i in range(6)]
+        book(theirs, self.guest, 40)  # neither mine nor hosted by me
+
+    def test_compact_rows_use_a_fixed_query_budget(self):
+        for page_size in (3, 12):
+            # COUNT, page rows (renter, listing and owner joined), cover images.
+            with self.assertNumQueries(3):
+                response = self.client.get(
+                    "/api/bookings/", {"view": "compact", "page_size": page_size}
+                )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 12)
+        ids = [row["id"] for row in response.data["results"]]
+        self.assertEqual(len(ids), len(set(ids)))
+
+        rows = {row["id"]: row for row in response.data["results"]}
+        rented = rows[self.rented[0].pk]
+        self.assertEqual(rented["role"], "renter")
+        self.assertEqual(rented["counterpart"]["username"], "compacthost")
+        # Absolute, like cover_image in the same row.
+        self.assertEqual(rented["counterpart"]["avatar"], "http://testserver/media/avatars/host.jpg")
+        self.assertEqual(rented["listing"]["title"], "theirs")
+        self.assertTrue(rented["listing"]["cover_image"].endswith("theirs_0.jpg"))
+        hosted = rows[self.hosted[0].pk]
+        self.assertEqual(hosted["role"], "host")
+        self.assertEqual(hosted["counterpart"]["username"], "compactguest")
+        self.assertNotIn("email", hosted["counterpart"])
+
+    def test_roles_and_cursor_pages(self):
+        response = self.client.get("/api/bookings/", {"view": "compact", "role": "host"})
+        self.assertEqual({row["id"] for row in response.data["results"]}, {b.pk for b in self.hosted})
+        response = self.client.get("/api/bookings/", {"role": "renter", "page_size": 4, "cursor": ""})
+        first = [row["id"] for row in response.data["results"]]
+        response = self.client.get(response.data["next"])
+        second = [row["id"] for row in response.data["results"]]
+        self.assertEqual(sorted(first + second), sorted(b.pk for b in self.rented))
@@ -0,0 +1,243 @@
+"""
+Direct-to-storage uploads, so file bytes never pass through a Django worker.
+
+1. ``POST /api/uploads/`` with ``kind``, ``filename``, ``content_type`` and
+   ``size`` issues a DirectUpload: a storage key and a short-lived URL.
+2. The client ``PUT``s the file to that URL with the returned headers.
+   A listing image issued with a ``sha256`` whose content is already stored
+   gets no URL and skips this step (see blobs.py).
+3. The upload is attached by id: ``uploads`` on listing create or
+   ``POST /api/listings/<pk>/images/``, ``upload`` on chat messages. Attaching
+   checks that the object exists with the declared size, then stores the key
+   in the FileField without reading the file.
+
+On S3-compatible storage (R2, or MinIO/LocalStack pointed to by
+``R2_ENDPOINT``) the URL is a presigned ``put_object`` whose signature covers
+the key, ``Content-Type`` and ``Content-Length``. Other storages (the local
+FileSystemStorage) get a signed URL of ``LocalUploadView``, which accepts
+the same PUT and streams it into storage: the stand-in for development and
+tests.
+
+Issued uploads expire after ``DIRECT_UPLOAD_EXPIRES`` seconds (default 900).
+Expired uploads that were never attached are deleted, object included, by
+``python manage.py purge_direct_uploads``.
+"""
+import mimetypes
+import posixpath
+import tempfile
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from rest_framework.exceptions import ValidationError
+
+from . import blobs
+from .models import DirectUpload
+
+Kind = DirectUpload.Kind
+
+MB = 1024 * 1024
+# kind: (key prefix, accepted content types (None: any), max bytes)
+RULES = {
+    Kind.LISTING_IMAGE: ("listing_images/", ("image/jpeg", "image/png", "image/webp"), 15 * MB),
+    Kind.CHAT_IMAGE: (
+        "chat_images/",
+        ("image/jpeg", "image/png", "image/webp", "image/gif"),
+        15 * MB,
+    ),
+    Kind.CHAT_AUDIO: (
+        "chat_audio/",
+        (
+            "audio/mpeg",
+            "audio/mp4",
+            "audio/aac",
+            "audio/x-m4a",
+            "audio/ogg",
+            "audio/webm",
+            "audio/wav",
+        ),
+        20 * MB,
+    ),
+    Kind.CHAT_FILE: ("chat_files/", None, 25 * MB),
+}
+# Kinds whose content is public, so "already stored?" may be answered (see blobs.py).
+PUBLIC_KINDS = (Kind.LISTING_IMAGE,)
+# Message field each chat kind attaches to.
+MESSAGE_FIELDS = {Kind.CHAT_IMAGE: "image", Kind.CHAT_AUDIO: "audio", Kind.CHAT_FILE: "file"}
+DEFAULT_EXPIRES = 900
+SIGNING_SALT = "marketplace.uploads"
+CHUNK_SIZE = 64 * 1024
+
+
+def expires_in() -> int:
+    return int(getattr(settings, "DIRECT_UPLOAD_EXPIRES", DEFAULT_EXPIRES))
+
+
+def _is_s3(storage) -> bool:
+    return hasattr(storage, "bucket") and hasattr(storage, "_normalize_name")
+
+
+def random_name(filename) -> str:
+    """An unguessable object name with ``filename``'s extension, for private chat files."""
+    return f"{uuid.uuid4().hex}{posixpath.splitext(filename or '')[1].lower()[:10]}"
+
+
+def _make_key(kind, filename, content_type) -> str:
+    prefix = RULES[kind][0]
+    token = uuid.uuid4().hex
+    if kind == Kind.CHAT_FILE:
+        # The file name is shown in the chat (MessageSerializer.file_name).
+        name = get_valid_filename(posixpath.basename(filename or "")) or "file"
+        return f"{prefix}{token}/{name[-100:]}"
+    extension = mimetypes.guess_extension(content_type) or ""
+    return f"{prefix}{token}{'.jpg' if extension == '.jpe' else extension}"
+
+
+def _upload_url(upload, request) -> str:
+    storage = default_storage
+    if _is_s3(storage):
+        return storage.bucket.meta.client.generate_presigned_url(
+            "put_object",
+            Params={
+                "Bucket": storage.bucket.name,
+                "Key": storage._normalize_name(upload.key),
+                "ContentType": upload.content_type,
+                "ContentLength": upload.size,
+            },
+            ExpiresIn=expires_in(),
+        )
+    token = signing.dumps(upload.pk, salt=SIGNING_SALT)
+    return request.build_absolute_uri(reverse("direct_upload_local", args=[token]))
+
+
+def issue(request, kind, filename, content_type, size, sha256=None) -> dict:
+    """
+    Create a DirectUpload for ``request.user``; the ticket the client uploads
+    with. A listing image whose ``sha256`` is already stored comes back with
+    ``url: null``: there is nothing to upload (see blobs.py).
+    """
+    if kind not in RULES:
+        raise ValidationError({"kind": f"Must be one of: {', '.join(RULES)}."})
+    _, accepted, max_size = RULES[kind]
+    content_type = (content_type or "").strip().lower()
+    if not content_type or (accepted is not None and content_type not in accepted):
+        raise ValidationError({"content_type": "This file type is not accepted."})
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise ValidationError({"size": "A size in bytes is required."})
+    if not 0 < size <= max_size:
+        raise ValidationError({"size": f"Must be between 1 and {max_size} bytes."})
+
+    blob = None
+    if sha256 and kind in PUBLIC_KINDS:
+        blob = blobs.find(str(sha256).lower())
+        if blob is not None and blob.size != size:
+            blob = None
+    upload = DirectUpload.objects.create(
+        user=request.user,
+        kind=kind,
+        key=blob.name if blob else _make_key(kind, filename, content_type),
+        content_type=content_type,
+        size=size,
+        blob=blob,
+        expires_at=timezone.now() + timedelta(seconds=expires_in()),
+    )
+    return {
+        "id": upload.pk,
+        "key": upload.key,
+        "url": None if blob else _upload_url(upload, request),
+        "method": "PUT",
+        "headers": {"Content-Type": upload.content_type},
+        "expires_at": upload.expires_at,
+    }
+
+
+def receive_local(token, content_type, stream, content_length) -> DirectUpload:
+    """
+    The local stand-in for a presigned PUT: check what the signature would
+    and stream the body into storage. Raises ``signing.BadSignature`` or
+    ``ValueError`` when the upload must be refused.
+    """
+    pk = signing.loads(token, salt=SIGNING_SALT, max_age=expires_in())
+    upload = DirectUpload.objects.filter(
+        pk=pk, consumed_at__isnull=True, blob__isnull=True
+    ).first()
+    if upload is None or upload.expires_at <= timezone.now():
+        raise ValueError("Upload expired.")
+    if content_type != upload.content_type or content_length != upload.size:
+        raise ValueError("Content-Type and Content-Length must match the issued upload.")
+    with tempfile.SpooledTemporaryFile(max_size=4 * MB) as buffer:
+        remaining = upload.size
+        while remaining:
+            chunk = stream.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise ValueError("Body shorter than Content-Length.")
+            buffer.write(chunk)
+            remaining -= len(chunk)
+        buffer.seek(0)
+        if default_storage.exists(upload.key):
+            default_storage.delete(upload.key)
+        saved = default_storage.save(upload.key, File(buffer))
+    if saved != upload.key:
+        DirectUpload.objects.filter(pk=upload.pk).update(key=saved)
+        upload.key = saved
+    return upload
+
+
+def consume(user, upload_ids, kinds, field="uploads") -> list:
+    """
+    Lock and mark used the uploads ``upload_ids`` of ``user``, in the given
+    order, after checking each object is in storage with its declared size.
+    Call inside a transaction; raises ValidationError on ``field``.
+    """
+    try:
+        ids = [int(pk) for pk in upload_ids]
+    except (TypeError, ValueError):
+        raise ValidationError({field: "Upload ids must be integers."})
+    if len(set(ids)) != len(ids):
+        raise ValidationError({field: "Each upload can only be attached once."})
+    found = {
+        upload.pk: upload
+        for upload in DirectUpload.objects.select_for_update().filter(
+            pk__in=ids, user=user, kind__in=kinds, consumed_at__isnull=True
+        )
+    }
+    missing = [pk for pk in ids if pk not in found]
+    if missing:
+        raise ValidationError({field: f"Unknown or already used uploads: {missing}."})
+    not_uploaded = []
+    for pk in ids:
+        upload = found[pk]
+        try:
+            stored_size = default_storage.size(upload.key)
+        except Exception:
+            stored_size = None
+        if stored_size != upload.size:
+            not_uploaded.append(pk)
+    if not_uploaded:
+        raise ValidationError({field: f"Files not uploaded yet: {not_uploaded}."})
+    DirectUpload.objects.filter(pk__in=ids).update(consumed_at=timezone.now())
+    return [found[pk] for pk in ids]
+
+
+def purge_expired(now=None) -> int:
+    """Delete uploads that expired without being attached, and their objects."""
+    now = now or timezone.now()
+    deleted = 0
+    expired = DirectUpload.objects.filter(consumed_at__isnull=True, expires_at__lt=now)
+    for upload in expired.iterator(chunk_size=500):
+        # Row first: once it is gone the upload can no longer be attached.
+        if DirectUpload.objects.filter(pk=upload.pk, consumed_at__isnull=True).delete()[0]:
+            # A shared blob is not this upload's to delete; the collector handles it.
+            if upload.blob_id is None:
+                default_storage.delete(upload.key)
+            deleted += 1
+    return deleted
+
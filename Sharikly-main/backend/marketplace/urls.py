@@ -50,6 +50,16 @@ urlpatterns = [
     path("categories/", views.CategoryListView.as_view(), name="categories"),
     path("listings/", views.ListingListCreateView.as_view(), name="listings"),
     path("listings/suggest/", views.ListingSuggestView.as_view(), name="listings_suggest"),
+    path("listings/facets/", views.ListingFacetsView.as_view(), name="listings_facets"),
+    path("listings/batch/", views.ListingBatchView.as_view(), name="listings_batch"),
+    path("listings/calendar/", views.ListingCalendarView.as_view(), name="listings_calendar"),
+    path("listings/import/", views.ListingImportView.as_view(), name="listings_import"),
+    path(
+        "listings/bulk-update/",
+        views.ListingBulkUpdateView.as_view(),
+        name="listings_bulk_update",
+    ),
+    path("listings/cache-stats/", views.ListingCacheStatsView.as_view(), name="listings_cache_stats"),
     path(
         "listings/<int:pk>/",
         views.ListingRetrieveUpdateView.as_view(),
@@ -60,16 +70,33 @@ urlpatterns = [
         views.ListingAvailabilityView.as_view(),
         name="listing_availability",
     ),
+    path(
+        "listings/<int:pk>/availability/free-windows/",
+        views.ListingFreeWindowsView.as_view(),
+        name="listing_free_windows",
+    ),
     path(
         "listings/<int:pk>/availability-blocks/",
         views.ListingAvailabilityBlockView.as_view(),
         name="listing_availability_blocks",
     ),
+    path(
+        "listings/<int:pk>/images/",
+        views.ListingImageAttachView.as_view(),
+        name="listing_images_attach",
+    ),
     path(
         "listings/<int:pk>/similar/",
         views.SimilarListingsView.as_view(),
         name="listing_similar",
     ),
+    # Direct-to-storage uploads
+    path("uploads/", views.DirectUploadCreateView.as_view(), name="direct_uploads"),
+    path(
+        "uploads/local/<str:token>/",
+        views.DirectUploadLocalView.as_view(),
+        name="direct_upload_local",
+    ),
     # Bookings
     path("bookings/", views.BookingListCreateView.as_view(), name="bookings"),
     path("bookings/<int:pk>/", views.BookingRetrieveView.as_view(), name="booking_detail"),
@@ -1,11 +1,15 @@
 from rest_framework import generics, permissions, status
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.views import APIView
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from rest_framework.exceptions import ValidationError, AuthenticationFailed, PermissionDenied
+from rest_framework.exceptions import (
+    APIException,
+    AuthenticationFailed,
+    PermissionDenied,
+    ValidationError,
+)
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
@@ -13,7 +17,11 @@ from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils.decorators import method_decorator
+from django.core import signing
+from django.core.files.storage import default_storage
 from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Q, Subquery
 from datetime import datetime as dt
 from django.utils.encoding import force_str
 from django.utils.http import urlsafe_base64_decode
@@ -26,6 +34,7 @@ from .models import (
     Category,
     ChatRoom,
     ContactMessage,
+    DirectUpload,
     Favorite,
     HostPreference,
     Listing,
@@ -44,15 +53,21 @@ from .models import (
 from .serializers import (
     AvailabilityBlockSerializer,
     BlogPostSerializer,
+    BookingCardSerializer,
+    BookingCompactSerializer,
     BookingSerializer,
     CategorySerializer,
     ChatRoomSerializer,
     ContactMessageSerializer,
     EarningsCalculatorInputSerializer,
     EarningsCalculatorResponseSerializer,
+    FavoriteCardSerializer,
     FavoriteSerializer,
     HostPreferenceSerializer,
     LandlordEarningsDashboardSerializer,
+    ListingBulkUpdateSerializer,
+    ListingCardSerializer,
+    ListingImageSerializer,
     ListingSerializer,
     MessageSerializer,
     NotificationPreferenceSerializer,
@@ -66,6 +81,29 @@ from .serializers import (
     UserAdminMessageSerializer,
     UserSerializer,
 )
+from . import (
+    availability,
+    blobs,
+    blocking,
+    bulk_import,
+    bulk_update,
+    conditional,
+    geo,
+    listing_cache,
+    ranking,
+    similarity,
+    uploads,
+)
+from . import search as listing_search
+from . import images as listing_images
+from .pagination import CursorOrPageNumberPagination
+from .querysets import (
+    booking_compact_queryset,
+    listing_card_queryset,
+    listing_detail_queryset,
+    prefetch_listing_cards,
+    with_cover_image,
+)
 from .earnings import (
     build_landlord_dashboard,
     build_public_community_earnings,
@@ -141,15 +179,20 @@ class UserReviewsView(generics.ListAPIView):
 
 
 def _blocked_user_ids(user):
-    """User IDs that cannot interact in chat with `user` (either direction)."""
-    from .models import BlockedUser
-    blocked_by_me = set(
-        BlockedUser.objects.filter(blocker=user).values_list("blocked_id", flat=True)
-    )
-    blocked_me = set(
-        BlockedUser.objects.filter(blocked=user).values_list("blocker_id", flat=True)
-    )
-    return blocked_by_me | blocked_me
+    """User IDs that cannot interact in chat with `user` (either direction); cached, see blocking.py."""
+    return blocking.blocked_user_ids(user)
+
+
+def _visible_chat_rooms(user):
+    """
+    Rooms ``user`` is in, minus rooms shared with someone blocked in either
+    direction: one query with a flat anti-join on the participants table.
+    """
+    rooms = ChatRoom.objects.filter(participants=user)
+    blocked_ids = _blocked_user_ids(user)
+    if blocked_ids:
+        rooms = rooms.exclude(participants__in=blocked_ids)
+    return rooms
 
 
 def _create_notification(user, notification_type, title, body: str = "", link: str = ""):
@@ -269,7 +312,7 @@ class BlockedUsersListView(generics.ListAPIView):
         )
 
 
-class NotificationListPagination(PageNumberPagination):
+class NotificationListPagination(CursorOrPageNumberPagination):
     page_size = 20
     page_size_query_param = "page_size"
     max_page_size = 50
@@ -631,194 +674,350 @@ class CustomTokenObtainPairView(TokenObtainPairView):
 
 
 # --- Listings Views ---
-class ListingListPagination(PageNumberPagination):
-    page_size = 12
-    page_size_query_param = "page_size"
-    max_page_size = 48
-
+def _wants_card_view(request) -> bool:
+    """``?view=card`` on a GET: compact listing cards instead of full listings."""
+    return request.method == "GET" and request.query_params.get("view") == "card"
 
-class ListingListCreateView(generics.ListCreateAPIView):
-    serializer_class = ListingSerializer
-    parser_classes = [MultiPartParser, FormParser]
-    pagination_class = ListingListPagination
-
-    def get_permissions(self):
-        if self.request.method == "POST":
-            return [permissions.IsAuthenticated()]
-        return [permissions.AllowAny()]
 
-    def get_serializer_context(self):
-        """
-        Ensure request is available on create so nested serializers that rely on it
-        (e.g. favorites, reviews) behave consistently.
-        """
-        context = super().get_serializer_context()
-        context["request"] = self.request
-        return context
+def _sparse_fields(request):
+    """
+    ``?fields=id,title,price_per_day`` -> list of field names (``id`` always
+    included), or None for the full representation. Unknown names are ignored.
+    """
+    if request.method != "GET":
+        return None
+    raw = request.query_params.get("fields") or ""
+    names = [name.strip() for name in raw.split(",") if name.strip()]
+    if not names:
+        return None
+    return ["id"] + [name for name in names if name != "id"]
 
-    def perform_create(self, serializer):
-        """
-        Create listing with images while preserving the client-provided ordering.
 
-        The frontend sends images in the desired order (cover first). We mirror that
-        into ListingImage.position so the gallery order is stable across edits.
-        """
-        images = self.request.FILES.getlist("images")
-        if not images:
-            raise ValidationError({"images": "At least one image is required"})
-        listing = serializer.save(owner=self.request.user)
-        for idx, img in enumerate(images):
-            ListingImage.objects.create(listing=listing, image=img, position=idx)
+class ListingFilterMixin:
+    """
+    The public listing filters (``?search=``, ``category``, ``city``, ``near``,
+    prices, ``rating_min``, availability window, ``owner``, ``mine``) shared by
+    the list and facet endpoints.
+    """
 
-    def get_queryset(self):
-        from django.db.models import Q
-        from django.db.models import Avg, OuterRef, Exists
+    def _viewer_blocked_ids(self):
+        if not hasattr(self, "_blocked_ids"):
+            user = self.request.user
+            self._blocked_ids = _blocked_user_ids(user) if user.is_authenticated else set()
+        return self._blocked_ids
 
-        qs = Listing.objects.all()
-        if self.request.method != "GET":
-            return qs.order_by("-created_at")
+    def _wants_mine(self):
         # "My listings" for profile: only owner's listings (include inactive)
-        if self.request.user.is_authenticated and self.request.query_params.get("mine") == "1":
-            qs = qs.filter(owner=self.request.user).order_by("-created_at")
-            return qs
+        return self.request.user.is_authenticated and self.request.query_params.get("mine") == "1"
+
+    def filter_listings(self, qs, rank=True):
+        """Apply the GET filters; ``rank=False`` skips the search relevance annotation."""
+        request = self.request
+        if self._wants_mine():
+            return qs.filter(owner=request.user)
         # Public list: only active, and hide listings from users I've blocked / who blocked me
         qs = qs.filter(is_active=True)
-        if self.request.user.is_authenticated:
-            blocked_ids = _blocked_user_ids(self.request.user)
+        if request.user.is_authenticated:
+            blocked_ids = self._viewer_blocked_ids()
             if blocked_ids:
                 qs = qs.exclude(owner_id__in=blocked_ids)
         # Optional: filter by owner (public profile pages)
-        owner_id = self.request.query_params.get("owner")
+        owner_id = request.query_params.get("owner")
         if owner_id:
             try:
                 qs = qs.filter(owner_id=int(owner_id))
             except ValueError:
                 logger.debug("Invalid owner filter value")
         # Filters (GET only)
-        search = (self.request.query_params.get("search") or "").strip()
+        search = (request.query_params.get("search") or "").strip()
         if search:
-            qs = qs.filter(
-                Q(title__icontains=search)
-                | Q(description__icontains=search)
-                | Q(city__icontains=search)
-            )
-        category_id = self.request.query_params.get("category")
+            # Full-text index (tsvector/GIN or FTS5) with prefix matching; annotates search_rank.
+            qs = listing_search.filter_queryset(qs, search, rank=rank)
+        category_id = request.query_params.get("category")
         if category_id:
             try:
                 qs = qs.filter(category_id=int(category_id))
             except ValueError:
                 logger.debug("Invalid category filter value")
-        city = (self.request.query_params.get("city") or "").strip()
+        city = (request.query_params.get("city") or "").strip()
         if city:
             qs = qs.filter(city__icontains=city)
-        min_price = self.request.query_params.get("min_price")
+        # "Near me": ?near=lat,lng&radius_km=10 (geohash cells -> bounding box -> haversine)
+        near = geo.parse_point(request.query_params.get("near"))
+        if near:
+            try:
+                radius_km = float(request.query_params.get("radius_km") or 10)
+            except ValueError:
+                logger.debug("Invalid radius_km filter value")
+                radius_km = 10.0
+            qs = geo.filter_near(qs, near[0], near[1], radius_km)
+        min_price = request.query_params.get("min_price")
         if min_price is not None and min_price != "":
             try:
                 qs = qs.filter(price_per_day__gte=float(min_price))
             except ValueError:
                 logger.debug("Invalid min_price filter value")
-        max_price = self.request.query_params.get("max_price")
+        max_price = request.query_params.get("max_price")
         if max_price is not None and max_price != "":
             try:
                 qs = qs.filter(price_per_day__lte=float(max_price))
             except ValueError:
                 logger.debug("Invalid max_price filter value")
 
-        # Rating filter (server-side)
-        rating_min = self.request.query_params.get("rating_min")
+        # Rating filter (server-side): range scan on the denormalized rating_avg
+        # (NULL for unreviewed listings, so they are excluded as before).
+        rating_min = request.query_params.get("rating_min")
         if rating_min is not None and rating_min != "":
             try:
                 rmin = float(rating_min)
-                qs = qs.annotate(avg_rating=Avg("reviews__rating")).filter(avg_rating__gte=rmin)
+                qs = qs.filter(rating_avg__gte=rmin)
             except ValueError:
                 logger.debug("Invalid rating_min filter value")
 
-        # Availability window filter (exclude listings with overlapping PENDING/CONFIRMED bookings)
-        available_from = self.request.query_params.get("available_from")
-        available_to = self.request.query_params.get("available_to")
+        # Availability window filter: exclude listings with a PENDING/CONFIRMED booking
+        # or an owner block overlapping the window (anti-join on the occupancy index).
+        available_from = request.query_params.get("available_from")
+        available_to = request.query_params.get("available_to")
         if available_from and available_to:
             try:
                 start = dt.strptime(available_from, "%Y-%m-%d").date()
                 end = dt.strptime(available_to, "%Y-%m-%d").date()
                 if end >= start:
-                    overlap_qs = Booking.objects.filter(
-                        listing_id=OuterRef("pk"),
-                        status__in=[Booking.Status.PENDING, Booking.Status.CONFIRMED],
-                        start_date__lte=end,
-                        end_date__gte=start,
-                    )
-                    qs = qs.annotate(has_overlap=Exists(overlap_qs)).filter(has_overlap=False)
+                    qs = availability.filter_available(qs, start, end)
             except (ValueError, TypeError):
                 logger.debug("Invalid availability filter values")
-        # Ordering
-        order = self.request.query_params.get("order") or "newest"
-        if order == "price_asc":
+        return qs
+
+
+class ListingListPagination(CursorOrPageNumberPagination):
+    page_size = 12
+    page_size_query_param = "page_size"
+    max_page_size = 48
+
+
+class ListingListCreateView(ListingFilterMixin, generics.ListCreateAPIView):
+    serializer_class = ListingSerializer
+    parser_classes = [MultiPartParser, FormParser]
+    pagination_class = ListingListPagination
+
+    def get_permissions(self):
+        if self.request.method == "POST":
+            return [permissions.IsAuthenticated()]
+        return [permissions.AllowAny()]
+
+    def get_serializer_context(self):
+        """
+        Ensure request is available on create so nested serializers that rely on it
+        (e.g. favorites, reviews) behave consistently.
+        """
+        context = super().get_serializer_context()
+        context["request"] = self.request
+        context["fields"] = _sparse_fields(self.request)
+        return context
+
+    def get_serializer_class(self):
+        if _wants_card_view(self.request):
+            return ListingCardSerializer
+        return super().get_serializer_class()
+
+    def list(self, request, *args, **kwargs):
+        """Serve identical page requests from the versioned cache (see listing_cache)."""
+        if not listing_cache.is_enabled():
+            return super().list(request, *args, **kwargs)
+        key = listing_cache.page_key(request, self._viewer_blocked_ids())
+        data = listing_cache.get_page(key)
+        if data is not None:
+            response = Response(data)
+            response["X-Cache"] = "HIT"
+            return response
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            listing_cache.set_page(key, response.data)
+        response["X-Cache"] = "MISS"
+        return response
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        # Serializers read only preloaded data: a page costs a fixed number of queries.
+        if _wants_card_view(self.request):
+            return listing_card_queryset(queryset, self.request.user)
+        return listing_detail_queryset(queryset, self.request.user)
+
+    def perform_create(self, serializer):
+        """
+        Create listing with images while preserving the client-provided ordering.
+
+        The frontend sends images in the desired order (cover first). We mirror that
+        into ListingImage.position so the gallery order is stable across edits.
+        """
+        images = self.request.FILES.getlist("images")
+        # Photos already sent straight to storage (see uploads.py) come after these.
+        upload_ids = self.request.data.getlist("uploads")
+        if not images and not upload_ids:
+            raise ValidationError({"images": "At least one image is required"})
+        # Content already stored is reused; new content is written concurrently
+        # and before the transaction, so none is held open across network
+        # round trips. Blobs left unreferenced by a failure are collected later.
+        try:
+            stored = blobs.store_many(images)
+        except Exception:
+            logger.exception("Storing listing images failed")
+            raise APIException("Could not store the images. Please try again.")
+        with transaction.atomic():
+            uploaded = uploads.consume(
+                self.request.user, upload_ids, [DirectUpload.Kind.LISTING_IMAGE]
+            )
+            listing = serializer.save(owner=self.request.user)
+            sources = [(blob.name, blob) for blob in stored] + [
+                (upload.key, upload.blob) for upload in uploaded
+            ]
+            # bulk_create sends no ListingImage signals; the listing's own
+            # post_save (same transaction) already invalidates listing pages.
+            ListingImage.objects.bulk_create(
+                ListingImage(listing=listing, image=name, blob=blob, position=idx)
+                for idx, (name, blob) in enumerate(sources)
+            )
+
+    def get_queryset(self):
+        qs = Listing.objects.all()
+        if self.request.method != "GET":
+            return qs.order_by("-created_at")
+        if self._wants_mine():
+            return self.filter_listings(qs).order_by("-created_at")
+        qs = self.filter_listings(qs)
+        search = (self.request.query_params.get("search") or "").strip()
+        near = geo.parse_point(self.request.query_params.get("near"))
+        # Ordering: a text search without an explicit order is sorted by match rank.
+        order = self.request.query_params.get("order") or ("rank" if search else "newest")
+        if order == "relevance":
+            # Match rank blended with rating, recency, favorites and Super Host (see ranking.py).
+            qs = ranking.order_by_relevance(qs, text=bool(search))
+        elif order == "price_asc":
             qs = qs.order_by("price_per_day")
         elif order == "price_desc":
             qs = qs.order_by("-price_per_day")
+        elif order == "rank" and search:
+            qs = qs.order_by("-search_rank", "-created_at")
+        elif order == "distance" and near:
+            qs = qs.order_by("distance_km", "-created_at")
         else:
             qs = qs.order_by("-created_at")
         return qs
 
 
+class ListingFacetsView(ListingFilterMixin, APIView):
+    """
+    GET /listings/facets/?<same filters as /listings/>
+    Category, city, price-bucket and rating counts for the filter panel,
+    computed in one grouped query (see facets.py) and cached like list pages.
+    """
+
+    permission_classes = [permissions.AllowAny]
+    # Params that change a list page but not its facet counts.
+    ignored_params = ("page", "page_size", "cursor", "order", "view", "fields")
+
+    def get(self, request):
+        from . import facets
+
+        key = None
+        if listing_cache.is_enabled():
+            key = listing_cache.page_key(
+                request,
+                self._viewer_blocked_ids(),
+                namespace="facets",
+                ignore=self.ignored_params,
+            )
+            data = listing_cache.get_page(key)
+            if data is not None:
+                response = Response(data)
+                response["X-Cache"] = "HIT"
+                return response
+        data = facets.compute(self.filter_listings(Listing.objects.all(), rank=False))
+        response = Response(data)
+        if key:
+            listing_cache.set_page(key, data)
+            response["X-Cache"] = "MISS"
+        return response
+
+
+class ListingCacheStatsView(APIView):
+    """
+    GET /listings/cache-stats/ (staff only): hit/miss counters of the listing
+    page cache. DELETE resets the counters.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(listing_cache.stats())
+
+    def delete(self, request):
+        listing_cache.reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class ListingSuggestView(APIView):
     """
     GET /listings/suggest/?q=...
-    Returns lightweight suggestions for autocomplete.
+    Returns lightweight suggestions for autocomplete, answered from the
+    in-memory prefix index (see suggest.py) without a database round trip.
     """
 
     permission_classes = [permissions.AllowAny]
 
     def get(self, request):
-        from django.db.models import Q
+        from . import suggest
 
         q = (request.query_params.get("q") or "").strip()
-        if len(q) < 2:
-            return Response({"titles": [], "cities": [], "categories": []}, status=status.HTTP_200_OK)
-
-        base = Listing.objects.filter(is_active=True)
-        titles = (
-            base.filter(title__icontains=q)
-            .values_list("title", flat=True)
-            .order_by("title")
-            .distinct()[:8]
-        )
-        cities = (
-            base.filter(city__isnull=False)
-            .filter(city__icontains=q)
-            .values_list("city", flat=True)
-            .order_by("city")
-            .distinct()[:8]
-        )
-        categories = (
-            Category.objects.filter(name__icontains=q)
-            .values("id", "name")
-            .order_by("name")
-            .distinct()[:8]
-        )
-        return Response(
-            {
-                "titles": list(titles),
-                "cities": [c for c in list(cities) if c],
-                "categories": list(categories),
-            },
-            status=status.HTTP_200_OK,
-        )
+        return Response(suggest.index.suggest(q), status=status.HTTP_200_OK)
 
     # Suggest endpoint is read-only; creation is handled by ListingListCreateView.
 
 
+def _visible_listings(user):
+    """Listings ``user`` may open: active ones, plus their own (active or inactive)."""
+    from django.db.models import Q
+
+    qs = Listing.objects.filter(Q(is_active=True))
+    if user.is_authenticated:
+        qs = (qs | Listing.objects.filter(owner=user)).distinct()
+    return qs
+
+
 class ListingRetrieveUpdateView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ListingSerializer
 
+    def _visible_listings(self):
+        return _visible_listings(self.request.user)
+
     def get_queryset(self):
-        from django.db.models import Q
+        return listing_detail_queryset(self._visible_listings(), self.request.user)
 
-        # Public: only active; owner: can see their own (active or inactive)
-        qs = Listing.objects.filter(Q(is_active=True))
-        if self.request.user.is_authenticated:
-            qs = (qs | Listing.objects.filter(owner=self.request.user)).distinct()
-        return qs
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Conditional GET: one lookup of the listing's ``updated_at`` and the
+        ``profile_updated_at`` of its owner and reviewers decides whether the
+        client's copy is current (304) before anything is loaded or serialized.
+        """
+        pk = kwargs[self.lookup_field]
+        latest_reviewer = (
+            Review.objects.filter(listing=OuterRef("pk"))
+            .order_by("-user__profile_updated_at")
+            .values("user__profile_updated_at")[:1]
+        )
+        row = (
+            self._visible_listings()
+            .filter(pk=pk)
+            .values_list("updated_at", "owner__profile_updated_at", Subquery(latest_reviewer))
+            .first()
+        )
+        if row is None:
+            return super().retrieve(request, *args, **kwargs)  # 404
+        updated_at = conditional.latest(*row)
+        etag = conditional.make_etag(request, "listing", pk, updated_at.isoformat())
+        response = conditional.not_modified(request, etag, updated_at)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        return conditional.set_validators(response, etag, updated_at)
 
     def get_permissions(self):
         if self.request.method in ["PUT", "PATCH", "DELETE"]:
@@ -843,6 +1042,193 @@ class ListingRetrieveUpdateView(generics.RetrieveUpdateDestroyAPIView):
         instance.delete()
 
 
+def _requested_listing_ids(request, max_ids):
+    """Distinct ids from ``?ids=3,17,42`` (or repeated ``ids``), in order; 400 if invalid."""
+    raw = ",".join(request.query_params.getlist("ids"))
+    ids = []
+    for part in raw.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            pk = int(part)
+        except ValueError:
+            raise ValidationError({"ids": f"Invalid listing id: {part!r}."})
+        if pk not in ids:
+            ids.append(pk)
+    if not ids:
+        raise ValidationError({"ids": "Provide one or more listing ids, e.g. ?ids=1,2,3."})
+    if len(ids) > max_ids:
+        raise ValidationError({"ids": f"At most {max_ids} ids per request."})
+    return ids
+
+
+class ListingBatchView(APIView):
+    """
+    GET /listings/batch/?ids=3,17,42[&view=card][&fields=...]
+    Up to ``max_ids`` listings in one request, in the requested order, with the
+    detail view's visibility rules (active or owned) and the block list
+    applied. Ids that are unknown, hidden or blocked are listed in ``missing``
+    (without saying which), so clients can drop stale favorites/banners.
+    """
+
+    permission_classes = [permissions.AllowAny]
+    max_ids = 50
+
+    def get(self, request):
+        ids = _requested_listing_ids(request, self.max_ids)
+        user = request.user
+        qs = _visible_listings(user).filter(pk__in=ids)
+        if user.is_authenticated:
+            blocked_ids = _blocked_user_ids(user)
+            if blocked_ids:
+                qs = qs.exclude(owner_id__in=blocked_ids)
+        context = {"request": request, "fields": _sparse_fields(request)}
+        if _wants_card_view(request):
+            listings = list(listing_card_queryset(qs, user))
+            serializer_class = ListingCardSerializer
+        else:
+            listings = list(listing_detail_queryset(qs, user))
+            serializer_class = ListingSerializer
+        by_id = {listing.pk: listing for listing in listings}
+        found = [by_id[pk] for pk in ids if pk in by_id]
+        return Response(
+            {
+                "results": serializer_class(found, many=True, context=context).data,
+                "missing": [pk for pk in ids if pk not in by_id],
+            }
+        )
+
+
+class DirectUploadCreateView(APIView):
+    """
+    Issue a direct-to-storage upload (see uploads.py).
+
+    POST body: { "kind": "listing_image" | "chat_image" | "chat_audio" | "chat_file",
+                 "filename": "...", "content_type": "...", "size": <bytes>,
+                 "sha256": "<hex, optional, listing images>" }
+    Returns { id, key, url, method, headers, expires_at }: PUT the file to
+    ``url`` with ``headers`` (unless ``url`` is null: already stored), then
+    attach it by ``id``.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        data = request.data
+        ticket = uploads.issue(
+            request,
+            data.get("kind"),
+            data.get("filename"),
+            data.get("content_type"),
+            data.get("size"),
+            sha256=data.get("sha256"),
+        )
+        return Response(ticket, status=status.HTTP_201_CREATED)
+
+
+class DirectUploadLocalView(APIView):
+    """
+    Upload target for storages without presigned URLs (local development,
+    tests): accepts the PUT a presigned URL would. The signed token in the
+    URL authorizes it.
+    """
+
+    permission_classes = []
+    authentication_classes = []
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, *args, **kwargs):
+        return super().dispatch(*args, **kwargs)
+
+    def put(self, request, token):
+        if uploads._is_s3(default_storage):
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        try:
+            content_length = int(request.META.get("CONTENT_LENGTH") or -1)
+            uploads.receive_local(token, request.content_type, request._request, content_length)
+        except signing.BadSignature:
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_200_OK)
+
+
+class ListingImageAttachView(APIView):
+    """
+    Owner-only: add directly uploaded photos to a listing, after its current ones.
+
+    POST body: { "uploads": [<upload id>, ...] }
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk):
+        listing = get_object_or_404(Listing, pk=pk)
+        if listing.owner_id != request.user.id:
+            raise PermissionDenied("Only the owner can add photos to this listing.")
+        upload_ids = request.data.get("uploads")
+        if not isinstance(upload_ids, list) or not upload_ids:
+            raise ValidationError({"uploads": "A list of upload ids is required."})
+        with transaction.atomic():
+            uploaded = uploads.consume(request.user, upload_ids, [DirectUpload.Kind.LISTING_IMAGE])
+            last = listing.images.aggregate(last=Max("position"))["last"]
+            start = 0 if last is None else last + 1
+            created = [
+                ListingImage.objects.create(
+                    listing=listing, image=upload.key, blob=upload.blob, position=idx
+                )
+                for idx, upload in enumerate(uploaded, start=start)
+            ]
+        serializer = ListingImageSerializer(created, many=True, context={"request": request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class ListingBulkUpdateView(APIView):
+    """
+    Owner-only: change many of the caller's listings in one UPDATE (see bulk_update.py).
+
+    POST body: { "filter": { "ids": [...], "category": <id|null>, "is_active": <bool> },
+                 "price_percent": "-10" | "price_amount": "5.00",
+                 "is_active": <bool>, "category": <id> }
+    Returns { updated, ids }.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = ListingBulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        changes = dict(serializer.validated_data)
+        filters = changes.pop("filter", {})
+        return Response(bulk_update.apply(request.user, filters, changes))
+
+
+class ListingImportView(APIView):
+    """
+    Bulk-create the caller's listings from a manifest (see bulk_import.py).
+
+    POST multipart: ``manifest`` (.csv or .jsonl), optional ``images`` (.zip
+    of the photos the rows name). Returns { created, failed, truncated, rows },
+    one entry per row: { row, id } or { row, errors }.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        manifest = request.FILES.get("manifest")
+        if manifest is None:
+            raise ValidationError({"manifest": "A .csv or .jsonl manifest file is required."})
+        try:
+            report = bulk_import.run(
+                request.user, manifest, manifest.name, archive_file=request.FILES.get("images")
+            )
+        except bulk_import.ManifestError as exc:
+            raise ValidationError({"manifest": str(exc)})
+        return Response(report)
+
+
 class ListingAvailabilityView(APIView):
     """
     Return unavailable date ranges for a listing combining:
@@ -853,26 +1239,119 @@ class ListingAvailabilityView(APIView):
 
     def get(self, request, pk):
         listing = get_object_or_404(Listing, pk=pk)
-        booked = (
-            Booking.objects.filter(listing=listing)
-            .filter(status__in=[Booking.Status.PENDING, Booking.Status.CONFIRMED])
-            .values_list("start_date", "end_date")
+        calendar = availability.Calendar.load(listing.pk, reasons=True)
+        return Response(
+            {
+                "booked_ranges": calendar.bookings.ranges(),
+                "blocked_ranges": [
+                    {"start": str(s), "end": str(e), "reason": r}
+                    for s, e, r in calendar.block_reasons
+                ],
+                "unavailable_ranges": calendar.unavailable.ranges(),
+            }
+        )
+
+
+class ListingFreeWindowsView(APIView):
+    """
+    GET /listings/<pk>/availability/free-windows/?from=YYYY-MM-DD&min_days=3&limit=5
+    The next ``limit`` bookable date ranges of at least ``min_days`` days,
+    starting at ``from`` (default and earliest: today) and looking up to a
+    year ahead; a window reaching that horizon is cut there.
+    """
+
+    permission_classes = [permissions.AllowAny]
+    max_limit = 20
+
+    def _int_param(self, request, name, default, low, high):
+        raw = request.query_params.get(name)
+        if raw in (None, ""):
+            return default
+        try:
+            value = int(raw)
+        except ValueError:
+            raise ValidationError({name: "Must be an integer."})
+        if not low <= value <= high:
+            raise ValidationError({name: f"Must be between {low} and {high}."})
+        return value
+
+    def get(self, request, pk):
+        listing = get_object_or_404(_visible_listings(request.user), pk=pk)
+        today = timezone.localdate()
+        start = today
+        if request.query_params.get("from"):
+            try:
+                start = max(dt.strptime(request.query_params["from"], "%Y-%m-%d").date(), today)
+            except ValueError:
+                raise ValidationError({"from": "Invalid date format. Use YYYY-MM-DD."})
+        min_days = self._int_param(request, "min_days", 1, 1, 365)
+        limit = self._int_param(request, "limit", 5, 1, self.max_limit)
+        end = start + availability.FREE_WINDOW_HORIZON
+        calendar = availability.Calendar.load(listing.pk, start, end)
+        windows = calendar.free_windows(start, limit, min_days=min_days, end=end)
+        return Response(
+            {
+                "windows": [
+                    {"start": str(first), "end": str(last), "days": (last - first).days + 1}
+                    for first, last in windows
+                ]
+            }
         )
-        booked_ranges = [
-            {"start": str(s), "end": str(e)}
-            for s, e in booked
-        ]
-        blocks = AvailabilityBlock.objects.filter(listing=listing).values_list(
-            "start_date", "end_date", "reason"
+
+
+class ListingCalendarView(APIView):
+    """
+    GET /listings/calendar/?ids=3,17,42[&from=YYYY-MM-DD][&days=365][&encoding=runs|bitmap]
+    Unavailable days of many listings over a horizon, compactly encoded (see
+    ``availability.calendars``), from one query. Listings not visible to the
+    caller are listed in ``missing``.
+
+    - ``runs``: ``[[offset, length], ...]``, day offsets from ``from``;
+    - ``bitmap``: base64 of one bit per day, least significant bit first.
+    """
+
+    permission_classes = [permissions.AllowAny]
+    max_ids = 100
+    max_days = 731
+
+    def get(self, request):
+        ids = _requested_listing_ids(request, self.max_ids)
+        start = timezone.localdate()
+        if request.query_params.get("from"):
+            try:
+                start = dt.strptime(request.query_params["from"], "%Y-%m-%d").date()
+            except ValueError:
+                raise ValidationError({"from": "Invalid date format. Use YYYY-MM-DD."})
+        try:
+            days = int(request.query_params.get("days") or 365)
+        except ValueError:
+            raise ValidationError({"days": "Must be an integer."})
+        if not 1 <= days <= self.max_days:
+            raise ValidationError({"days": f"Must be between 1 and {self.max_days}."})
+        encoding = request.query_params.get("encoding") or "runs"
+        if encoding not in ("runs", "bitmap"):
+            raise ValidationError({"encoding": "Must be 'runs' or 'bitmap'."})
+
+        qs = _visible_listings(request.user).filter(pk__in=ids)
+        if request.user.is_authenticated:
+            blocked_ids = _blocked_user_ids(request.user)
+            if blocked_ids:
+                qs = qs.exclude(owner_id__in=blocked_ids)
+        visible_ids = set(qs.values_list("pk", flat=True))
+        visible = [pk for pk in ids if pk in visible_ids]
+        calendars = availability.calendars(visible, start, days)
+        encode = (
+            (lambda intervals: intervals.bitmap(start, days))
+            if encoding == "bitmap"
+            else (lambda intervals: intervals.runs(start, days))
         )
-        blocked_ranges = [
-            {"start": str(s), "end": str(e), "reason": r or ""}
-            for s, e, r in blocks
-        ]
         return Response(
             {
-                "booked_ranges": booked_ranges,
-                "blocked_ranges": blocked_ranges,
+                "from": str(start),
+                "days": days,
+                "encoding": encoding,
+                "listings": {str(pk): encode(calendars[pk]) for pk in visible},
+                "missing": [pk for pk in ids if pk not in calendars],
             }
         )
 
@@ -910,8 +1389,9 @@ class ListingAvailabilityBlockView(APIView):
         serializer.is_valid(raise_exception=True)
         start = serializer.validated_data["start_date"]
         end = serializer.validated_data["end_date"]
+        calendar = availability.Calendar.load(listing.pk, start, end)
         # ensure no overlap with bookings
-        if _booking_overlaps(listing, start, end):
+        if calendar.bookings.overlaps(start, end):
             return Response(
                 {
                     "detail": "This block overlaps an existing booking. Adjust the dates or manage bookings first."
@@ -919,12 +1399,7 @@ class ListingAvailabilityBlockView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
         # prevent overlapping with existing blocks
-        from django.db.models import Q
-
-        has_block_overlap = AvailabilityBlock.objects.filter(listing=listing).filter(
-            Q(start_date__lte=end, end_date__gte=start)
-        ).exists()
-        if has_block_overlap:
+        if calendar.blocks.overlaps(start, end):
             return Response(
                 {
                     "detail": "This block overlaps an existing availability block. Adjust the dates."
@@ -963,41 +1438,46 @@ class ListingAvailabilityBlockView(APIView):
 
 
 class SimilarListingsView(APIView):
-    """Return listings similar to the given one: same category, then by price similarity, then newest. No auth required."""
+    """
+    Return listings similar to the given one. No auth required.
+
+    Served from the precomputed neighbor table (see similarity.py). Listings
+    without neighbors yet (new or just edited) fall back to same category,
+    then by price similarity, then newest.
+    """
     permission_classes = [permissions.AllowAny]
 
     def get(self, request, pk):
         from django.db.models import F, Value, DecimalField
         from django.db.models.functions import Abs
 
-        current = get_object_or_404(Listing, pk=pk)
         qs = Listing.objects.filter(is_active=True).exclude(pk=pk)
         # Hide similar listings from blocked users
         if request.user and request.user.is_authenticated:
             blocked_ids = _blocked_user_ids(request.user)
             if blocked_ids:
                 qs = qs.exclude(owner_id__in=blocked_ids)
-        if current.category_id:
-            qs = qs.filter(category_id=current.category_id)
-        qs = qs.annotate(
-            price_diff=Abs(F("price_per_day") - Value(current.price_per_day, output_field=DecimalField(max_digits=10, decimal_places=2)))
-        ).order_by("price_diff", "-created_at")[:8]
-        serializer = ListingSerializer(qs, many=True, context={"request": request})
-        return Response(serializer.data)
-
-
-def _booking_overlaps(listing, start, end):
-    """True if [start, end] overlaps any PENDING or CONFIRMED booking for listing."""
-    from django.db.models import Q
-    return Booking.objects.filter(
-        listing=listing,
-        status__in=[Booking.Status.PENDING, Booking.Status.CONFIRMED],
-    ).filter(
-        Q(start_date__lte=end, end_date__gte=start)
-    ).exists()
-
-
-class BookingListPagination(PageNumberPagination):
+        context = {"request": request, "fields": _sparse_fields(request)}
+        if _wants_card_view(request):
+            prepare, serializer_class = listing_card_queryset, ListingCardSerializer
+        else:
+            prepare, serializer_class = listing_detail_queryset, ListingSerializer
+
+        # One indexed join on the neighbor table; the fallback runs only when
+        # it finds nothing (no neighbors yet, or none visible to this user).
+        similar = list(prepare(similarity.neighbor_queryset(qs, pk), request.user)[:8])
+        if not similar:
+            current = get_object_or_404(Listing, pk=pk)
+            if current.category_id:
+                qs = qs.filter(category_id=current.category_id)
+            qs = qs.annotate(
+                price_diff=Abs(F("price_per_day") - Value(current.price_per_day, output_field=DecimalField(max_digits=10, decimal_places=2)))
+            ).order_by("price_diff", "-created_at")
+            similar = list(prepare(qs, request.user)[:8])
+        return Response(serializer_class(similar, many=True, context=context).data)
+
+
+class BookingListPagination(CursorOrPageNumberPagination):
     page_size = 10
     page_size_query_param = "page_size"
     max_page_size = 50
@@ -1008,20 +1488,36 @@ class BookingListCreateView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = BookingListPagination
 
+    def _wants_compact_view(self):
+        return self.request.method == "GET" and self.request.query_params.get("view") == "compact"
+
     def get_queryset(self):
         user = self.request.user
         role = (self.request.query_params.get("role") or "").strip().lower()
         base = Booking.objects.all()
+        # Hosted bookings by listing id, not through a join on the listing's
+        # owner: each side is an index range on (renter|listing, created_at),
+        # a row can only match once, and no DISTINCT is needed.
+        hosted = Q(listing__in=Listing.objects.filter(owner=user).values("pk"))
         if role == "renter":
             qs = base.filter(renter=user)
         elif role in ("host", "owner", "lender"):
-            qs = base.filter(listing__owner=user)
+            qs = base.filter(hosted)
         else:
-            qs = (
-                base.filter(renter=user)
-                | base.filter(listing__owner=user)
-            )
-        return qs.order_by("-created_at").distinct()
+            qs = base.filter(Q(renter=user) | hosted)
+        qs = qs.order_by("-created_at")
+        if self._wants_compact_view():
+            qs = booking_compact_queryset(qs)
+        elif _wants_card_view(self.request):
+            qs = qs.select_related("renter").prefetch_related(prefetch_listing_cards(user))
+        return qs
+
+    def get_serializer_class(self):
+        if self._wants_compact_view():
+            return BookingCompactSerializer
+        if _wants_card_view(self.request):
+            return BookingCardSerializer
+        return super().get_serializer_class()
 
     def create(self, request, *args, **kwargs):
         listing_id = request.data.get("listing")
@@ -1053,23 +1549,19 @@ class BookingListCreateView(generics.ListCreateAPIView):
                 {"detail": "end_date must be on or after start_date."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        if _booking_overlaps(listing, start, end):
-            return Response(
-                {"detail": "These dates overlap an existing booking. Please check availability."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
         # SECURITY: recompute the price from the listing's own rate. Never trust a
         # client-supplied total_price, or a renter could book anything for 1 SAR.
         rental_days = (end - start).days or 1
         total_price = listing.price_per_day * rental_days
-        booking = Booking.objects.create(
-            listing=listing,
-            renter=request.user,
-            start_date=start,
-            end_date=end,
-            total_price=total_price,
-            status=Booking.Status.PENDING,
-        )
+        try:
+            booking = availability.create_booking(listing, request.user, start, end, total_price)
+        except availability.DatesUnavailable as exc:
+            detail = (
+                "These dates overlap an existing booking. Please check availability."
+                if exc.source == "booking"
+                else "The host has blocked some of these dates. Please check availability."
+            )
+            return Response({"detail": detail, "code": "dates_unavailable"}, status=status.HTTP_409_CONFLICT)
         return Response(
             BookingSerializer(booking).data,
             status=status.HTTP_201_CREATED,
@@ -1355,6 +1847,16 @@ class CategoryListView(generics.ListAPIView):
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]
 
+    def list(self, request, *args, **kwargs):
+        # Validator: one aggregate query over the (small) category table.
+        state = Category.objects.aggregate(count=Count("id"), last=Max("updated_at"))
+        last = state["last"].isoformat() if state["last"] else ""
+        etag = conditional.make_etag(request, "categories", state["count"], last, personal=False)
+        response = conditional.not_modified(request, etag)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        return conditional.set_validators(response, etag, personal=False)
+
 
 # --- Chat Views ---
 class ChatRoomListCreateView(generics.ListCreateAPIView):
@@ -1363,17 +1865,7 @@ class ChatRoomListCreateView(generics.ListCreateAPIView):
 
     def get_queryset(self):
         # Rooms I'm in, excluding rooms where another participant is blocked (either direction)
-        blocked_ids = _blocked_user_ids(self.request.user)
-        if not blocked_ids:
-            return ChatRoom.objects.filter(participants=self.request.user).distinct()
-        room_ids_with_blocked = ChatRoom.objects.filter(
-            participants=self.request.user
-        ).filter(
-            participants__id__in=blocked_ids
-        ).values_list("id", flat=True)
-        return ChatRoom.objects.filter(participants=self.request.user).exclude(
-            id__in=room_ids_with_blocked
-        ).distinct()
+        return _visible_chat_rooms(self.request.user)
 
     def create(self, request, *args, **kwargs):
         participants_ids = request.data.get("participants", [])
@@ -1542,15 +2034,7 @@ class ChatUnreadCountView(APIView):
         from datetime import timedelta
 
         user = request.user
-        blocked_ids = _blocked_user_ids(user)
-        rooms = ChatRoom.objects.filter(participants=user).distinct()
-        if blocked_ids:
-            room_ids_with_blocked = ChatRoom.objects.filter(
-                participants=user
-            ).filter(
-                participants__id__in=blocked_ids
-            ).values_list("id", flat=True)
-            rooms = rooms.exclude(id__in=room_ids_with_blocked)
+        rooms = _visible_chat_rooms(user)
         total = 0
         old_cutoff = timezone.now() - timedelta(days=365 * 10)
         for room in rooms:
@@ -1590,7 +2074,22 @@ class SendMessageView(generics.CreateAPIView):
 
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        msg = serializer.save(room=room, sender=request.user)
+        upload_id = request.data.get("upload")
+        # Chat images and audio are private: each gets its own random object
+        # name, never shared or derived from the content (see blobs.py).
+        for field in ("image", "audio"):
+            if serializer.validated_data.get(field):
+                upload = serializer.validated_data[field]
+                upload.name = uploads.random_name(upload.name)
+        attachment = {}
+        with transaction.atomic():
+            if upload_id not in (None, ""):
+                # A file sent straight to storage (see uploads.py).
+                (upload,) = uploads.consume(
+                    request.user, [upload_id], list(uploads.MESSAGE_FIELDS), field="upload"
+                )
+                attachment[uploads.MESSAGE_FIELDS[upload.kind]] = upload.key
+            msg = serializer.save(room=room, sender=request.user, **attachment)
         app_url = getattr(settings, "FRONTEND_APP_URL", "").rstrip("/") or ""
         chat_link = f"{app_url}/chat/{room.id}" if app_url else f"/chat/{room.id}"
         snippet = (msg.text or "")[:100] + ("..." if len(msg.text or "") > 100 else "")
@@ -1702,7 +2201,7 @@ class RemoveFavoriteView(generics.DestroyAPIView):
         )
 
 
-class FavoritesListPagination(PageNumberPagination):
+class FavoritesListPagination(CursorOrPageNumberPagination):
     page_size = 12
     page_size_query_param = "page_size"
     max_page_size = 48
@@ -1716,7 +2215,15 @@ class UserFavoritesListView(generics.ListAPIView):
     pagination_class = FavoritesListPagination
 
     def get_queryset(self):
-        return Favorite.objects.filter(user=self.request.user).order_by("-created_at")
+        qs = Favorite.objects.filter(user=self.request.user).order_by("-created_at")
+        if _wants_card_view(self.request):
+            qs = qs.prefetch_related(prefetch_listing_cards(self.request.user))
+        return qs
+
+    def get_serializer_class(self):
+        if _wants_card_view(self.request):
+            return FavoriteCardSerializer
+        return super().get_serializer_class()
 
 
 # --- Review Vote Views ---
@@ -1992,6 +2499,27 @@ class BlogPostDetailView(generics.RetrieveUpdateDestroyAPIView):
             return BlogPost.objects.all()
         return BlogPost.objects.filter(published=True)
 
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Conditional GET on the post's ``updated_at`` and its author's
+        ``profile_updated_at``: 304 without loading the post or its author.
+        """
+        pk = kwargs[self.lookup_field]
+        row = (
+            self.get_queryset()
+            .filter(pk=pk)
+            .values_list("updated_at", "author__profile_updated_at")
+            .first()
+        )
+        if row is None:
+            return super().retrieve(request, *args, **kwargs)  # 404
+        updated_at = conditional.latest(*row)
+        etag = conditional.make_etag(request, "blog", pk, updated_at.isoformat())
+        response = conditional.not_modified(request, etag, updated_at)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        return conditional.set_validators(response, etag, updated_at)
+
     def update(self, request, *args, **kwargs):
         """Only admins or author can update"""
         instance = self.get_object()
@@ -2080,17 +2608,19 @@ class LocalRentalRequestsView(APIView):
                 city_filter |= Q(city__icontains=city)
             qs = qs.filter(city_filter)
 
-        qs = qs.select_related("category").prefetch_related("images").annotate(
+        qs = with_cover_image(qs.select_related("category")).annotate(
             booking_count=Count("bookings")
         ).order_by("-booking_count", "-created_at")[:5]
 
         results = []
         for listing in qs:
-            image = listing.images.first()
+            image = next(iter(listing.cover_images), None)
             image_url = None
             if image and image.image:
                 try:
-                    image_url = request.build_absolute_uri(image.image.url)
+                    image_url = request.build_absolute_uri(
+                        listing_images.variant_url(image, "card") or image.image.url
+                    )
                 except Exception:
                     image_url = None
             results.append({
@@ -22,6 +22,9 @@ echo "2. Starting gunicorn..."
 cd /home/Sharikly/Sharikly-main/backend
 source venv/bin/activate
 
+# Shared cache table used by all workers (no-op if it exists or Redis is used)
+python manage.py createcachetable
+
 # Start in background with nohup
 nohup gunicorn --workers 3 --bind 127.0.0.1:8000 config.wsgi:application > /dev/null 2>&1 &
 